@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+正文解析基准：对比 bs4 与 lxml 两种解析后端
+用法：python benchmarks/bench_parse.py [--sections 2000] [--depth 12] [--repeat 3]
+（完整的基准测试套件见 benchmarks/run.py）
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from wechat_article_spider import WechatArticleSpider  # noqa: E402
+from corpus import build_page  # noqa: E402
+
+
+def time_backend(spider, backend, html, repeat):
+    spider.parser_backend = backend
+    best = float("inf")
+    article = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        article = spider.parse_article(html, "https://mp.weixin.qq.com/s/bench")
+        best = min(best, time.perf_counter() - start)
+    return best, article
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bs4 与 lxml 正文解析基准")
+    parser.add_argument("--sections", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import tempfile
+    spider = WechatArticleSpider(output_dir=tempfile.mkdtemp())
+    html = build_page(args.sections, args.depth)
+    print(f"页面大小: {len(html) / 1024:.0f} KB, section 数: {args.sections}, 嵌套深度: {args.depth}")
+
+    bs4_time, bs4_article = time_backend(spider, "bs4", html, args.repeat)
+    lxml_time, lxml_article = time_backend(spider, "lxml", html, args.repeat)
+
+    print(f"bs4:  {bs4_time * 1000:.1f} ms")
+    print(f"lxml: {lxml_time * 1000:.1f} ms")
+    print(f"加速: {bs4_time / lxml_time:.1f}x")
+    print(f"输出一致: {bs4_article == lxml_article}")
+
+
+if __name__ == "__main__":
+    main()
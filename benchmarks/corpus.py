@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试用的文章页面语料
+页面由固定种子生成，每次运行内容完全相同，不同版本的测试结果可以直接比较。
+页面中的 __BASE__ 与 __ID__ 由测试服务器在返回时替换为图片主机地址和文章编号。
+"""
+
+import random
+
+# 语料中的文章类型：名称 -> (段落数, 图片间隔, 嵌套深度, 说明)
+FIXTURES = {
+    "small": (12, 6, 2, "短文，少量图片"),
+    "typical": (120, 8, 4, "常见长度的图文文章"),
+    "image_heavy": (60, 1, 3, "几乎每段都配图"),
+    "nested": (300, 25, 40, "编辑器生成的深层嵌套 section"),
+    "huge": (2000, 5, 12, "超长文章（约 1MB 以上）"),
+}
+
+WORDS = ("公众号", "文章", "数据", "模型", "性能", "优化", "内存", "网络", "缓存", "并发",
+         "解析", "图片", "索引", "线程", "进程", "请求", "延迟", "吞吐", "测试", "基准")
+
+
+def _sentence(rng, n=18):
+    return "".join(rng.choice(WORDS) for _ in range(n)) + "。"
+
+
+def build_page(sections, depth, image_every=5, seed=0, base="https://mmbiz.qpic.cn", article_id="bench"):
+    """
+    生成一篇文章页面
+    :param sections: 段落数
+    :param depth: 每段外层包裹的 section 层数
+    :param image_every: 每隔几段插入一张图片
+    :param base: 图片 URL 前缀（需包含 mmbiz.qpic.cn 才会被识别为正文图片）
+    """
+    rng = random.Random(seed)
+    parts = []
+    for i in range(sections):
+        inner = f'<p><span>第{i}段：{_sentence(rng)}<strong>加粗</strong>与<em>强调</em>。</span></p>'
+        if image_every and i % image_every == 0:
+            inner += f'<p><img data-src="{base}/mmbiz_png/{article_id}/img{i}/640?wx_fmt=png"></p>'
+        if i % 7 == 0:
+            inner += (f'<h2>小标题{i}</h2><blockquote>{_sentence(rng, 10)}</blockquote>'
+                      f'<ul><li>要点{i}a</li><li>要点{i}b</li></ul>')
+        if i % 11 == 0:
+            inner += f'<section><span>叶子文本{i}</span><!-- 注释 --> 尾随{i}</section>'
+        for d in range(depth):
+            inner = f'<section style="margin:{d}px">{inner}</section>'
+        parts.append(inner)
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8">
+<meta property="og:url" content="https://mp.weixin.qq.com/s/{article_id}"></head><body>
+<h1 class="rich_media_title" id="activity-name">基准测试文章 {article_id}</h1>
+<a class="weui-wa-hotarea">基准公众号{seed % 5}</a><span class="rich_media_meta_text">作者</span>
+<em id="publish_time">2024-0{seed % 9 + 1}-01</em>
+<div class="rich_media_content" id="js_content">{''.join(parts)}</div></body></html>"""
+
+
+def fixture_template(name):
+    """某类文章的页面模板（图片主机与文章编号留作占位符）"""
+    sections, image_every, depth, _ = FIXTURES[name]
+    seed = sum(map(ord, name))
+    return build_page(sections, depth, image_every, seed=seed, base="__BASE__/mmbiz.qpic.cn", article_id="__ID__")
+
+
+def corpus():
+    """全部模板：{名称: 页面模板}"""
+    return {name: fixture_template(name) for name in FIXTURES}
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+离线基准测试套件
+用本地测试服务器（benchmarks/server.py）代替微信服务器，对语料（benchmarks/corpus.py）中的文章
+测量解析、单篇爬取、批量爬取、重新渲染的吞吐量（篇/秒）、各阶段 p50/p99 耗时和峰值内存。
+每个场景在独立的子进程中运行，峰值内存互不影响；结果保存为 JSON，可与之前的结果对比。
+
+用法：
+    python benchmarks/run.py                                  # 全部场景
+    python benchmarks/run.py --only parse,batch --batch 500 --workers 16
+    python benchmarks/run.py --latency 0.05 --error-rate 0.02 # 模拟慢网络与偶发错误
+    python benchmarks/run.py --compare benchmarks/results/上次结果.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+SCENARIOS = ("parse", "single", "batch", "batch_stream", "async", "rerender")
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB）"""
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def quantiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+    return {"count": len(ordered), "p50": round(pick(0.50), 6), "p99": round(pick(0.99), 6),
+            "max": round(ordered[-1], 6) if ordered else 0.0}
+
+
+def make_spider(config, cls=None, **kwargs):
+    import wechat_article_spider as wx
+    cls = cls or wx.WechatArticleSpider
+    spider = cls(output_dir=tempfile.mkdtemp(prefix="wx_bench_"), **kwargs)
+    spider.use_rate_limit = False
+    spider.use_random_ua = False
+    # 语料中同类文章的正文完全相同，不关闭近似重复检测的话除第一篇外都不会保存
+    spider.near_duplicates = "off"
+    spider.retry_policy = wx.RetryPolicy(base_delay=config["retry_delay"], max_delay=config["retry_delay"] * 8)
+    spider.parser_backend = config["backend"] if wx.HAS_LXML or config["backend"] == "bs4" else "bs4"
+    return spider
+
+
+def start_server(config):
+    from server import FixtureServer
+    return FixtureServer(latency=config["latency"], image_latency=config["image_latency"], jitter=config["jitter"],
+                         error_rate=config["error_rate"], image_error_rate=config["image_error_rate"],
+                         image_size=config["image_size"]).start()
+
+
+def batch_urls(server, count):
+    """按语料中的类型轮流取文章，huge 类型只占少数"""
+    mix = ["small", "typical", "typical", "typical", "image_heavy", "nested", "small", "typical", "typical", "huge"]
+    return [server.url(mix[i % len(mix)], i) for i in range(count)]
+
+
+def crawl_result(spider, articles, seconds, server):
+    snap = spider.metrics.snapshot()
+    return {
+        "articles": articles,
+        "seconds": round(seconds, 3),
+        "articles_per_sec": round(articles / seconds, 2) if seconds > 0 else 0.0,
+        "stages": {k: {"count": v["count"], "p50": v["p50"], "p99": v["p99"], "max": v["max"]}
+                   for k, v in snap["stages"].items()},
+        "counters": snap["counters"],
+        "server": dict(server.counters),
+    }
+
+
+def scenario_parse(config):
+    """纯解析：每类文章按两种后端各解析若干次"""
+    import wechat_article_spider as wx
+    from corpus import corpus
+
+    spider = make_spider(config)
+    pages = {name: tpl.replace("__ID__", name).replace("__BASE__", "https://x") for name, tpl in corpus().items()}
+    backends = ["bs4", "lxml"] if wx.HAS_LXML else ["bs4"]
+    result = {"fixtures": {}}
+    total = 0
+    started = time.perf_counter()
+    for name, html in pages.items():
+        entry = {"bytes": len(html.encode("utf-8"))}
+        outputs = {}
+        for backend in backends:
+            spider.parser_backend = backend
+            samples = []
+            for _ in range(config["repeat"]):
+                t = time.perf_counter()
+                outputs[backend] = spider.parse_article(html, "https://mp.weixin.qq.com/s/bench")
+                samples.append(time.perf_counter() - t)
+            entry[backend] = quantiles(samples)
+            total += len(samples)
+        entry["same_output"] = len({json.dumps(o, sort_keys=True) for o in outputs.values()}) == 1
+        result["fixtures"][name] = entry
+    seconds = time.perf_counter() - started
+    result.update(articles=total, seconds=round(seconds, 3), articles_per_sec=round(total / seconds, 2))
+    return result
+
+
+def scenario_single(config):
+    """单篇爬取：逐篇调用 crawl"""
+    server = start_server(config)
+    spider = make_spider(config)
+    urls = batch_urls(server, config["single"])
+    started = time.perf_counter()
+    for url in urls:
+        spider.crawl(url)
+    seconds = time.perf_counter() - started
+    result = crawl_result(spider, len(urls), seconds, server)
+    server.stop()
+    return result
+
+
+def scenario_batch(config, stream=False):
+    """批量爬取：crawl_many 多线程"""
+    server = start_server(config)
+    spider = make_spider(config)
+    spider.stream_images = stream
+    urls = batch_urls(server, config["batch"])
+    started = time.perf_counter()
+    spider.crawl_many(urls, workers=config["workers"])
+    seconds = time.perf_counter() - started
+    result = crawl_result(spider, len(urls), seconds, server)
+    server.stop()
+    return result
+
+
+def scenario_async(config):
+    """异步引擎批量爬取"""
+    import wechat_article_spider as wx
+    if not wx.HAS_AIOHTTP:
+        return {"skipped": "未安装 aiohttp"}
+    server = start_server(config)
+    spider = make_spider(config, wx.AsyncWechatArticleSpider, concurrency=config["workers"] * 4)
+    urls = batch_urls(server, config["batch"])
+    started = time.perf_counter()
+    spider.crawl_many(urls)
+    seconds = time.perf_counter() - started
+    result = crawl_result(spider, len(urls), seconds, server)
+    server.stop()
+    return result
+
+
+def scenario_rerender(config):
+    """重新渲染：先批量爬取准备数据，只计量 rerender 本身"""
+    server = start_server(config)
+    spider = make_spider(config)
+    spider.crawl_many(batch_urls(server, config["batch"]), workers=config["workers"])
+    server.stop()
+    stats = spider.rerender(workers=config["parse_workers"] or None)
+    return {"articles": stats["total"], "seconds": round(stats["seconds"], 3),
+            "articles_per_sec": round(stats["rate"], 2), "changed": stats["changed"], "failed": stats["failed"]}
+
+
+def run_scenario(name, config):
+    """在子进程中执行一个场景，返回结果（附带峰值内存）"""
+    func = {
+        "parse": scenario_parse,
+        "single": scenario_single,
+        "batch": scenario_batch,
+        "batch_stream": lambda c: scenario_batch(c, stream=True),
+        "async": scenario_async,
+        "rerender": scenario_rerender,
+    }[name]
+    # 爬虫的过程输出很多，基准测试时丢弃
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(config)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_result(name, result, baseline=None):
+    if "skipped" in result:
+        print(f"{name:<14} 跳过: {result['skipped']}")
+        return
+    line = f"{name:<14} {result['articles_per_sec']:>9.1f} 篇/秒  峰值内存 {result['peak_rss_mb']:>7.1f} MB"
+    if baseline and baseline.get("articles_per_sec"):
+        change = result["articles_per_sec"] / baseline["articles_per_sec"] - 1
+        line += f"  (对比基线 {change * 100:+.1f}%)"
+    print(line)
+    if name == "parse":
+        for fixture, entry in result["fixtures"].items():
+            timings = "  ".join(f"{b} p50 {entry[b]['p50'] * 1000:.1f}ms p99 {entry[b]['p99'] * 1000:.1f}ms"
+                                for b in ("bs4", "lxml") if b in entry)
+            print(f"    {fixture:<12} {entry['bytes'] / 1024:>7.0f} KB  {timings}  输出一致: {entry['same_output']}")
+    for stage, st in sorted(result.get("stages", {}).items()):
+        print(f"    {stage:<12} p50 {st['p50'] * 1000:>8.1f}ms  p99 {st['p99'] * 1000:>8.1f}ms  次数 {st['count']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="微信文章爬虫离线基准测试")
+    parser.add_argument("--only", default=",".join(SCENARIOS), help=f"逗号分隔的场景: {','.join(SCENARIOS)}")
+    parser.add_argument("--backend", default="lxml", choices=["bs4", "lxml"], help="爬取场景使用的解析后端")
+    parser.add_argument("--repeat", type=int, default=5, help="parse 场景中每类文章的解析次数")
+    parser.add_argument("--single", type=int, default=20, help="single 场景的文章数")
+    parser.add_argument("--batch", type=int, default=200, help="批量场景的文章数")
+    parser.add_argument("--workers", type=int, default=8, help="批量爬取的线程数")
+    parser.add_argument("--parse-workers", type=int, default=0, help="rerender 的解析进程数，0 为 CPU 核数")
+    parser.add_argument("--latency", type=float, default=0.0, help="页面响应延迟（秒）")
+    parser.add_argument("--image-latency", type=float, default=0.0, help="图片响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机抖动上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="页面请求出错概率")
+    parser.add_argument("--image-error-rate", type=float, default=0.0, help="图片请求出错概率")
+    parser.add_argument("--image-size", type=int, default=20 * 1024, help="合成图片大小（字节）")
+    parser.add_argument("--retry-delay", type=float, default=0.05, help="重试退避的基础时间（秒）")
+    parser.add_argument("--output", help="结果 JSON 路径，默认 benchmarks/results/<时间>.json")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比吞吐量")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.only.split(",") if n.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    config = {k: v for k, v in vars(args).items() if k not in ("only", "output", "compare")}
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("scenarios", {})
+
+    report = {
+        "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "scenarios": {},
+    }
+
+    # spawn：每个场景使用全新的解释器，峰值内存只反映该场景
+    # （用 ProcessPoolExecutor 而不是 multiprocessing.Pool：后者的子进程不能再创建进程，rerender 场景需要）
+    ctx = multiprocessing.get_context("spawn")
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            result = pool.submit(run_scenario, name, config).result()
+        report["scenarios"][name] = result
+        print_result(name, result, baseline.get(name))
+
+    output = args.output or os.path.join(BENCH_DIR, "results", datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output}")
+
+
+if __name__ == "__main__":
+    main()
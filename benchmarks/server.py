@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地测试服务器：代替微信服务器返回语料中的文章页面和合成图片
+可配置延迟和出错率，用于在没有网络的情况下稳定地测量抓取流程
+用法：python benchmarks/server.py [--port 8000] [--latency 0.05] [--error-rate 0.02]
+页面地址：http://127.0.0.1:<port>/s/<类型>/<编号>，如 /s/typical/1
+"""
+
+import argparse
+import hashlib
+import http.server
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import corpus  # noqa: E402
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split("?", 1)[0]
+        is_image = "/mmbiz.qpic.cn/" in path
+
+        delay = server.image_latency if is_image else server.latency
+        if server.jitter:
+            delay += server.rng_uniform(0, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if server.rng_uniform(0, 1) < (server.image_error_rate if is_image else server.error_rate):
+            server.count("errors")
+            self._send(server.error_status, b"error", headers={"Retry-After": "0"})
+            return
+
+        if is_image:
+            server.count("images")
+            self._send(200, server.image_bytes(path), content_type="image/png")
+            return
+
+        # /s/<类型>/<编号>
+        parts = path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "s" or parts[1] not in server.templates:
+            self._send(404, b"not found")
+            return
+        server.count("pages")
+        html = server.templates[parts[1]].replace("__ID__", f"{parts[1]}-{parts[2]}").replace("__BASE__", server.base)
+        self._send(200, html.encode("utf-8"))
+
+
+class FixtureServer(http.server.ThreadingHTTPServer):
+    """
+    :param latency: 页面响应前的等待时间（秒）
+    :param image_latency: 图片响应前的等待时间（秒）
+    :param jitter: 在等待时间上叠加的 0~jitter 秒随机抖动
+    :param error_rate: 页面请求返回错误的概率
+    :param image_error_rate: 图片请求返回错误的概率
+    :param error_status: 出错时的状态码（默认 503，可重试）
+    :param image_size: 合成图片的字节数
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, image_latency=0.0, jitter=0.0, error_rate=0.0,
+                 image_error_rate=0.0, error_status=503, image_size=20 * 1024, seed=0):
+        super().__init__(("127.0.0.1", port), FixtureHandler)
+        self.latency = latency
+        self.image_latency = image_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.image_error_rate = image_error_rate
+        self.error_status = error_status
+        self.image_size = image_size
+        self.templates = corpus()
+        self.base = f"http://127.0.0.1:{self.server_address[1]}"
+        self.counters = {"pages": 0, "images": 0, "errors": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def rng_uniform(self, a, b):
+        with self._lock:
+            return self._rng.uniform(a, b)
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def image_bytes(self, path):
+        """按路径生成固定内容的图片数据（PNG 文件头 + 重复的路径哈希）"""
+        digest = hashlib.sha256(path.encode("utf-8")).digest()
+        body = b"\x89PNG\r\n\x1a\n" + digest * (self.image_size // len(digest) + 1)
+        return body[:max(self.image_size, 8)]
+
+    def url(self, fixture, n):
+        return f"{self.base}/s/{fixture}/{n}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基准测试用的本地文章服务器")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--image-latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--image-error-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", type=int, default=20 * 1024)
+    args = parser.parse_args()
+
+    server = FixtureServer(args.port, args.latency, args.image_latency, args.jitter, args.error_rate,
+                           args.image_error_rate, image_size=args.image_size)
+    print(f"服务地址: {server.base}/s/<{'|'.join(server.templates)}>/<编号>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
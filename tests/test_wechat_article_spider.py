@@ -0,0 +1,748 @@
+# -*- coding: utf-8 -*-
+"""
+爬虫的自动化测试
+抓取相关的用例以 benchmarks/server.py 中的本地测试服务器代替微信服务器，不依赖网络。
+运行：python -m pytest -q
+"""
+
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import time
+from queue import Queue
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, ROOT)
+
+import wechat_article_spider as wx  # noqa: E402
+from corpus import corpus  # noqa: E402
+from server import FixtureServer  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def server():
+    srv = FixtureServer().start()
+    yield srv
+    srv.stop()
+
+
+def make_spider(output_dir, cls=None, **kwargs):
+    spider = (cls or wx.WechatArticleSpider)(output_dir=str(output_dir), **kwargs)
+    spider.use_rate_limit = False
+    spider.use_random_ua = False
+    # 语料中同类文章的正文完全相同，只在去重用例中开启近似重复检测
+    spider.near_duplicates = "off"
+    spider.retry_policy = wx.RetryPolicy(base_delay=0.01, max_delay=0.05)
+    return spider
+
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def image_blobs(spider):
+    return [f for f in os.listdir(spider.images.images_dir) if not f.startswith(".")]
+
+
+def markdown_files(output_dir):
+    return sorted(f for f in os.listdir(output_dir) if f.endswith(".md"))
+
+
+def run_main(*argv):
+    """执行命令行，返回 (退出码, 标准输出中的 JSON 行)"""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        code = wx.main(["-q", *argv])
+    return code, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+# 链接规范化
+
+def test_canonicalize_long_link_drops_share_params():
+    url = "https://mp.weixin.qq.com/s?__biz=MzA&mid=1&idx=2&sn=abc&chksm=x&scene=21#wechat_redirect"
+    assert wx.canonicalize_wechat_url(url) == ("https://mp.weixin.qq.com/s?__biz=MzA&mid=1&idx=2&sn=abc",
+                                               "biz:MzA:1:2:abc")
+
+
+def test_canonicalize_unescapes_only_amp():
+    assert wx.url_key("https://mp.weixin.qq.com/s?__biz=MzA&amp;mid=1&amp;idx=2&amp;sn=abc") == "biz:MzA:1:2:abc"
+    temp = "https://mp.weixin.qq.com/s?src=11&timestamp=1&ver=2&signature=x&copy=1&lt=2"
+    assert wx.canonicalize_wechat_url(temp)[0] == temp
+
+
+def test_canonicalize_short_link():
+    assert wx.url_key("https://mp.weixin.qq.com/s/AbC_d-1/?from=timeline") == "s:AbC_d-1"
+
+
+# 重试策略
+
+def test_retry_after_beyond_deadline_gives_up():
+    policy = wx.RetryPolicy(deadline=180)
+    throttled = wx.FetchFailure(wx.FetchFailure.THROTTLED, "429", retry_after=500)
+    assert policy.next_delay(1, throttled, 0) is None
+    throttled = wx.FetchFailure(wx.FetchFailure.THROTTLED, "429", retry_after=30)
+    assert policy.next_delay(1, throttled, 0) == 30
+    assert policy.next_delay(1, throttled, 160) is None
+
+
+# 自适应限速
+
+def test_rate_limiter_increases_additively_and_decreases_once_per_window():
+    limiter = wx.AdaptiveRateLimiter(initial_rate=1.0, min_rate=0.1, max_rate=1.2, increase=0.1, decrease=0.5)
+    assert limiter.reserve("h") == 0.0
+    assert limiter.reserve("h") == pytest.approx(1.0, abs=0.01)
+    for _ in range(5):
+        limiter.on_success("h")
+    assert limiter.rates() == {"h": 1.2}
+    quiet(limiter.on_throttle, "h")
+    # 同一时间窗内的并发限流只减速一次
+    quiet(limiter.on_throttle, "h")
+    assert limiter.rates() == {"h": 0.6}
+    limiter.set_initial_rate(0.3)
+    assert limiter.rates() == {}
+
+
+# 代理池
+
+def test_proxy_pool_ejects_failing_proxy_and_recovers_after_probe():
+    pool = wx.ProxyPool(failure_threshold=2, cooldown=0.05)
+    pool.set_proxies(["a:1", "b:2"])
+    pool.report_success("b:2", 0.1)
+    for _ in range(2):
+        quiet(pool.report_failure, "a:1")
+    stats = {s["proxy"]: s for s in pool.stats()}
+    assert stats["a:1"]["state"] == "ejected" and stats["a:1"]["success_rate"] < stats["b:2"]["success_rate"]
+    assert {pool.select() for _ in range(20)} == {"b:2"}
+
+    time.sleep(0.06)
+    pool.set_proxies(["a:1"])
+    # 冷却结束后放行一次探测，探测失败冷却时间翻倍
+    assert pool.select() == "a:1"
+    quiet(pool.report_failure, "a:1")
+    assert pool.stats()[0]["state"] == "ejected" and pool.stats()[0]["cooldown_left"] > 0.05
+    time.sleep(0.11)
+    assert pool.select() == "a:1"
+    quiet(pool.report_success, "a:1", 0.2)
+    assert pool.stats()[0]["state"] == "ok"
+
+
+def test_cli_menu_sets_and_disables_proxies(tmp_path, monkeypatch):
+    spider = quiet(make_spider, tmp_path)
+    answers = iter(["7", "1.1.1.1:80, 2.2.2.2:80", "9"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    quiet(wx.run_cli, spider)
+    assert spider.use_proxy and spider.proxies_list == ["1.1.1.1:80", "2.2.2.2:80"]
+    assert len(spider.proxy_stats()) == 2
+
+    answers = iter(["7", "", "9"])
+    quiet(wx.run_cli, spider)
+    assert spider.use_proxy and len(spider.proxies_list) == 2
+
+    answers = iter(["7", "off", "9"])
+    quiet(wx.run_cli, spider)
+    assert not spider.use_proxy and spider.proxies_list == []
+
+
+def test_cli_proxy_options_enable_proxies(tmp_path):
+    proxy_file = tmp_path / "proxies.txt"
+    proxy_file.write_text("# 注释\n1.1.1.1:80\n2.2.2.2:80\n", encoding="utf-8")
+    args = wx.build_parser().parse_args(["--proxies", "3.3.3.3:80", "--proxy-file", str(proxy_file), "tags"])
+    spider = quiet(wx.apply_proxy_args, quiet(make_spider, tmp_path / "out"), args)
+    assert spider.use_proxy
+    assert spider.proxies_list == ["3.3.3.3:80", "1.1.1.1:80", "2.2.2.2:80"]
+    assert len(spider.proxy_stats()) == 3
+
+
+# 抓取队列与租约
+
+def test_lease_owner_guards_completion(tmp_path):
+    queue = wx.CrawlQueue(str(tmp_path / "frontier.db"))
+    assert queue.enqueue([("http://a/1", ""), ("http://a/1#x", ""), ("http://a/2", "t")]) == 2
+    task = queue.claim("w1", lease_seconds=60)
+    assert queue.claim("w2", lease_seconds=60)["id"] != task["id"]
+    assert not queue.complete(task["id"], "p.md", owner="w2")
+    assert queue.complete(task["id"], "p.md", owner="w1")
+    assert queue.counts() == {"pending": 0, "inflight": 1, "done": 1, "failed": 0}
+    assert [lease["owner"] for lease in queue.leases()] == ["w2"]
+    # 只剩自己持有的任务时不必等待
+    assert queue.next_ready_in() > 50 and queue.next_ready_in(exclude_owner="w2") is None
+
+
+def test_expired_lease_is_reclaimed_with_a_fresh_budget(tmp_path):
+    queue = wx.CrawlQueue(str(tmp_path / "frontier.db"))
+    queue.enqueue([("http://a/1", "")])
+    task = queue.claim("dead", lease_seconds=0.05)
+    assert queue.claim("w", lease_seconds=60) is None
+    time.sleep(0.1)
+    reclaimed = queue.claim("w", lease_seconds=60)
+    assert reclaimed["id"] == task["id"] and reclaimed["attempts"] == 2
+    assert time.time() - reclaimed["first_started"] < 1
+    # 原持有者的结果不再写回
+    assert not queue.fail(task["id"], "late", owner="dead")
+
+
+def test_renew_extends_only_own_leases(tmp_path):
+    queue = wx.CrawlQueue(str(tmp_path / "frontier.db"))
+    queue.enqueue([("http://a/1", ""), ("http://a/2", "")])
+    queue.claim("w1", lease_seconds=1)
+    queue.claim("w2", lease_seconds=1)
+    assert queue.renew("w1", lease_seconds=100) == 1
+    leases = {lease["owner"]: lease["lease_until"] for lease in queue.leases()}
+    assert leases["w1"] - time.time() > 50 > leases["w2"] - time.time()
+
+
+def test_takeover_resets_deadline(tmp_path):
+    queue = wx.CrawlQueue(str(tmp_path / "frontier.db"))
+    queue.enqueue([("http://a/1", "")])
+    task = queue.claim("old", lease_seconds=60)
+    queue._conn.execute("UPDATE frontier SET first_started = ? WHERE id = ?", (time.time() - 1000, task["id"]))
+    assert queue.requeue_inflight() == 1
+    assert queue.get("http://a/1")["first_started"] is None
+
+
+def test_failed_url_is_requeued_on_resubmit(tmp_path):
+    queue = wx.CrawlQueue(str(tmp_path / "frontier.db"))
+    queue.enqueue([("http://a/1", ""), ("http://a/2", "")])
+    first, second = queue.claim("w"), queue.claim("w")
+    queue.fail(first["id"], "404")
+    queue.complete(second["id"], "p.md")
+    assert queue.enqueue([("http://a/1", ""), ("http://a/2", "")]) == 1
+    assert queue.get("http://a/1")["state"] == "pending"
+    assert queue.get("http://a/2")["state"] == "done"
+
+
+# 近似重复指纹
+
+def test_simhash_bands_find_near_duplicates(tmp_path):
+    index = wx.ArticleIndex(str(tmp_path / "index.db"))
+    spider = quiet(make_spider, tmp_path / "out")
+    page = corpus()["typical"].replace("__ID__", "a").replace("__BASE__", "https://x")
+    content = spider.parse_article(page, "https://mp.weixin.qq.com/s/a")["content"]
+    index.upsert({"url": "https://mp.weixin.qq.com/s/a", "title": "原文", "filename": "a.md"}, content=content)
+
+    repost = "转载自某公众号。\n" + content.replace("性能", "效率", 1) + "\n点击阅读原文"
+    found = index.find_similar(wx.simhash(repost))
+    assert found is not None and found[0]["title"] == "原文"
+    assert found[1] == wx.hamming_distance(wx.simhash(content), wx.simhash(repost)) <= index.SIMHASH_DISTANCE
+
+    unrelated = spider.parse_article(corpus()["nested"].replace("__BASE__", "https://x"), "u")["content"]
+    assert index.find_similar(wx.simhash(unrelated)) is None
+    assert index.find_similar(wx.simhash(repost), exclude_key=wx.url_key("https://mp.weixin.qq.com/s/a")) is None
+
+
+def test_simhash_skips_short_text():
+    assert wx.simhash("短文本") is None
+
+
+# 索引、页面归档与图片库
+
+def test_json_index_is_migrated_once(tmp_path):
+    legacy = {
+        "articles": [{"url": "https://mp.weixin.qq.com/s/old", "filename": "旧文章.md", "title": "旧文章",
+                      "account": "旧号", "author": "", "publish_time": "", "tags": "历史",
+                      "image_count": 0, "created_at": "2023-01-01 00:00:00"}],
+        "tags": {"历史": 2},
+    }
+    with open(tmp_path / "INDEX.json", "w", encoding="utf-8") as f:
+        json.dump(legacy, f, ensure_ascii=False)
+    with open(tmp_path / "旧文章.md", "w", encoding="utf-8") as f:
+        f.write("# 旧文章\n\n迁移前保存的正文\n")
+    spider = quiet(make_spider, tmp_path)
+    assert not os.path.exists(tmp_path / "INDEX.json")
+    assert os.path.exists(tmp_path / "INDEX.json.migrated")
+    assert spider.index.get("https://mp.weixin.qq.com/s/old")["title"] == "旧文章"
+    assert spider.index.tag_counts() == {"历史": 2}
+    assert [a["title"] for a in spider.index.search_tag("历史")] == ["旧文章"]
+    assert [a["title"] for a in spider.index.search_text("迁移前")] == ["旧文章"]
+
+
+def test_has_key_sees_articles_added_by_other_processes(tmp_path):
+    db = str(tmp_path / "index.db")
+    mine, other = wx.ArticleIndex(db), wx.ArticleIndex(db)
+    assert not mine.has_key(wx.url_key("https://mp.weixin.qq.com/s/x"))
+    other.upsert({"url": "https://mp.weixin.qq.com/s/x", "title": "t", "filename": "x.md"})
+    assert mine.has_key(wx.url_key("https://mp.weixin.qq.com/s/x"))
+
+
+def test_archive_sees_pages_appended_by_other_processes(tmp_path):
+    mine, other = wx.HtmlArchive(str(tmp_path)), wx.HtmlArchive(str(tmp_path))
+    mine.append("k1", "http://a/1", "<p>一</p>")
+    other.append("k2", "http://a/2", "<p>二</p>")
+    mine.append("k3", "http://a/3", "<p>三</p>")
+    assert mine.read("k2") == "<p>二</p>" and other.read("k3") == "<p>三</p>"
+    assert other.read("k1") == "<p>一</p>"
+
+
+def test_archive_keeps_latest_version_and_rebuilds_its_index(tmp_path):
+    archive = wx.HtmlArchive(str(tmp_path))
+    archive.append("k1", "http://a/1", "<p>旧</p>")
+    archive.append("k2", "http://a/2", "<p>二</p>")
+    archive.append("k1", "http://a/1", "<p>新</p>")
+    # 末尾的残缺记录（写入中断）在重建索引时忽略
+    with open(archive.pack_path, "ab") as f:
+        f.write(b"partial")
+    os.remove(archive.index_path)
+    reopened = wx.HtmlArchive(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.read("k1") == "<p>新</p>" and reopened.read("k2") == "<p>二</p>"
+
+
+def test_image_store_dedupes_content_and_collects_unreferenced(tmp_path):
+    store = wx.ImageStore(str(tmp_path / "images"), str(tmp_path / "index.db"))
+    png = b"\x89PNG\r\n" + b"x" * 100
+    name = store.add("http://img/1", [png[:10], png[10:]])
+    assert name.endswith(".png") and store.add("http://img/2", [png]) == name
+    other = store.add("http://img/3", [b"GIF89a" + b"y" * 10])
+    assert store.lookup("http://img/2") == name and store.stats()["images"] == 2
+
+    store.set_refs("a", ["http://img/1", "http://img/3"])
+    store.set_refs("b", ["http://img/2"])
+    assert (store.refcount(name), store.refcount(other)) == (2, 1)
+    store.release("a")
+    assert store.gc() == (1, 16)
+    assert store.lookup("http://img/3") is None and not os.path.exists(store.path(other))
+    assert store.lookup("http://img/1") == name and os.path.exists(store.path(name))
+
+
+# 运行指标
+
+def test_metrics_export_json_and_prometheus(tmp_path):
+    metrics = wx.Metrics()
+    metrics.inc("pages_fetched")
+    metrics.inc("fetch_failures", kind="timeout")
+    metrics.observe("fetch", 0.02)
+    metrics.observe("fetch", 3.0)
+    snap = json.loads(open(metrics.export(str(tmp_path / "m.json")), encoding="utf-8").read())
+    assert snap["counters"] == {"pages_fetched": 1, 'fetch_failures{kind="timeout"}': 1}
+    assert snap["stages"]["fetch"]["count"] == 2 and snap["stages"]["fetch"]["max"] == 3.0
+
+    text = open(metrics.export(str(tmp_path / "m.prom")), encoding="utf-8").read()
+    assert 'wechat_spider_fetch_failures_total{kind="timeout"} 1' in text
+    assert 'wechat_spider_stage_seconds_bucket{stage="fetch",le="0.025"} 1' in text
+    assert 'wechat_spider_stage_seconds_bucket{stage="fetch",le="+Inf"} 2' in text
+    assert 'wechat_spider_stage_seconds_count{stage="fetch"} 2' in text
+
+
+# 解析
+
+@pytest.mark.skipif(not wx.HAS_LXML, reason="未安装 lxml")
+@pytest.mark.parametrize("fixture", sorted(corpus()))
+def test_lxml_parser_matches_bs4(tmp_path, fixture):
+    spider = quiet(make_spider, tmp_path)
+    html = corpus()[fixture].replace("__ID__", "p").replace("__BASE__", "http://127.0.0.1")
+    url = "https://mp.weixin.qq.com/s/p"
+    spider.parser_backend = "bs4"
+    expected = spider.parse_article(html, url)
+    spider.parser_backend = "lxml"
+    assert spider.parse_article(html, url) == expected
+
+
+# 抓取（本地测试服务器）
+
+def test_crawl_many_reports_each_url_in_order(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    urls = [server.url("small", i) for i in range(3)] + [server.base + "/s/missing/1"]
+    reports = quiet(spider.crawl_many, urls, tags="测试", workers=2)
+    assert [r["url"] for r in reports] == urls
+    assert [r["status"] for r in reports] == ["success"] * 3 + ["failed"]
+    assert len(markdown_files(tmp_path)) == 3
+    assert spider.index.count() == 3 and spider.index.tag_counts() == {"测试": 3}
+
+
+def test_crawl_many_rerun_skips_finished_and_retries_failed(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    urls = [server.url("small", 30 + i) for i in range(2)] + [server.base + "/s/missing/3"]
+    quiet(spider.crawl_many, urls, workers=2)
+    pages = server.counters["pages"]
+    rerun = quiet(quiet(make_spider, tmp_path).crawl_many, urls, workers=2)
+    assert [r["status"] for r in rerun] == ["skipped", "skipped", "failed"]
+    assert rerun[2]["attempts"] == 1
+    assert server.counters["pages"] == pages
+
+
+def test_client_errors_are_not_retried(tmp_path, server):
+    failure = wx.FetchFailure.from_response(404, {})
+    assert wx.RetryPolicy().next_delay(1, failure, 0) is None
+    spider = quiet(make_spider, tmp_path)
+    report, = quiet(spider.crawl_many, [server.base + "/s/missing/2"])
+    assert report["status"] == "failed" and report["attempts"] == 1
+
+
+def test_indexed_article_is_skipped_by_any_of_its_links(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    quiet(spider.crawl, server.url("small", 50))
+    pages = server.counters["pages"]
+    # 页面中的 og:url 别名与带锚点的原链接都指向同一篇文章
+    reports = quiet(spider.crawl_many, ["https://mp.weixin.qq.com/s/small-50", server.url("small", 50) + "#top"])
+    assert [r["status"] for r in reports] == ["skipped", "skipped"]
+    assert server.counters["pages"] == pages
+    assert len(markdown_files(tmp_path)) == 1
+
+
+def test_search_matches_single_cjk_character(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    quiet(spider.crawl, server.url("small", 20))
+    assert len(spider.index.search_text("基准")) == 1
+    assert len(spider.index.search_text("章")) == 1
+    assert spider.index.search_text("鲸") == []
+
+
+def test_images_download_concurrently_into_the_store(tmp_path):
+    srv = FixtureServer(image_latency=0.1).start()
+    try:
+        spider = quiet(make_spider, tmp_path)
+        urls = [f"{srv.base}/mmbiz.qpic.cn/mmbiz_png/p/img{i}/640?wx_fmt=png" for i in range(8)]
+        started = time.time()
+        names = quiet(spider.download_images, urls + urls[:2])
+        assert time.time() - started < 0.4
+        assert len(names) == 8 and srv.counters["images"] == 8
+        assert len(quiet(spider.download_images, urls)) == 8 and srv.counters["images"] == 8
+    finally:
+        srv.stop()
+
+
+def test_parse_pool_matches_in_thread_parsing(tmp_path, server):
+    urls = [server.url("typical", 40 + i) for i in range(3)]
+    pooled = quiet(make_spider, tmp_path / "pool")
+    assert [r["status"] for r in quiet(pooled.crawl_many, urls, workers=2, parse_workers=4)] == ["success"] * 3
+    plain = quiet(make_spider, tmp_path / "plain")
+    quiet(plain.crawl_many, urls, workers=2)
+    assert markdown_files(tmp_path / "pool") == markdown_files(tmp_path / "plain")
+    for name in markdown_files(tmp_path / "plain"):
+        rendered = [[line for line in (tmp_path / d / name).read_text(encoding="utf-8").splitlines()
+                     if not line.startswith("收藏时间")] for d in ("pool", "plain")]
+        assert rendered[0] == rendered[1]
+
+
+@pytest.mark.skipif(not wx.HAS_LXML, reason="未安装 lxml")
+def test_streamed_page_prefetches_images_once_and_saves_same_article(tmp_path, server):
+    urls = [server.url("typical", 110 + i) for i in range(2)]
+    plain = quiet(make_spider, tmp_path / "plain")
+    quiet(plain.crawl_many, urls)
+    streamed = quiet(make_spider, tmp_path / "stream")
+    streamed.stream_images = True
+    images = server.counters["images"]
+    assert [r["status"] for r in quiet(streamed.crawl_many, urls)] == ["success"] * 2
+    assert server.counters["images"] - images == 30
+    assert markdown_files(tmp_path / "stream") == markdown_files(tmp_path / "plain")
+    for name in markdown_files(tmp_path / "plain"):
+        rendered = [[line for line in (tmp_path / d / name).read_text(encoding="utf-8").splitlines()
+                     if not line.startswith("收藏时间")] for d in ("stream", "plain")]
+        assert rendered[0] == rendered[1]
+
+
+def test_refresh_overwrites_changed_article_in_place(tmp_path):
+    srv = FixtureServer().start()
+    try:
+        spider = quiet(make_spider, tmp_path)
+        url = srv.url("small", 1)
+        quiet(spider.crawl, url)
+        filename = spider.index.get(url)["filename"]
+        pages = srv.counters["pages"]
+        assert [r["status"] for r in quiet(spider.refresh)] == ["success"]
+        assert srv.counters["pages"] == pages + 1
+
+        srv.templates["small"] = srv.templates["small"].replace("叶子文本11", "更新后的叶子文本")
+        assert [r["status"] for r in quiet(spider.refresh)] == ["success"]
+        assert quiet(spider.crawl, url, force=True).endswith(filename)
+        assert markdown_files(tmp_path) == [filename]
+        assert "更新后的叶子文本" in (tmp_path / filename).read_text(encoding="utf-8")
+        assert spider.index.get(url)["filename"] == filename
+    finally:
+        srv.stop()
+
+
+def test_rerender_leaves_unchanged_articles_alone(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    quiet(spider.crawl_many, [server.url("typical", 90 + i) for i in range(2)], workers=2)
+    stats = quiet(spider.rerender, workers=0)
+    assert (stats["total"], stats["changed"], stats["failed"]) == (2, 0, 0)
+
+
+def test_rerender_backfills_missing_fingerprints(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    quiet(spider.crawl_many, [server.url("typical", 170 + i) for i in range(2)], workers=2)
+    spider.index._conn.execute("DELETE FROM article_simhash")
+    spider.index._conn.commit()
+    assert len(spider.index.unfingerprinted()) == 2
+    stats = quiet(spider.rerender, workers=0)
+    assert (stats["changed"], stats["unchanged"]) == (0, 2)
+    assert not spider.index.unfingerprinted()
+
+
+def test_near_duplicate_is_linked_instead_of_saved(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    spider.near_duplicates = "link"
+    original = quiet(spider.crawl, server.url("small", 180))
+    reports = quiet(spider.crawl_many, [server.url("small", 181)])
+    assert reports[0]["status"] == "success" and reports[0]["path"] == original
+    assert markdown_files(tmp_path) == [os.path.basename(original)]
+    assert len(spider.index.duplicates_of(server.url("small", 180))) == 1
+    # 登记为转载的链接再次提交时直接跳过
+    assert [r["status"] for r in quiet(spider.crawl_many, [server.url("small", 181)])] == ["skipped"]
+
+
+def test_rerender_keeps_links_of_skipped_images(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    spider.near_duplicates = "skip-images"
+    quiet(spider.crawl, server.url("small", 190))
+    path = quiet(spider.crawl, server.url("small", 191))
+    before = open(path, encoding="utf-8").read()
+    assert "mmbiz.qpic.cn" in before
+    stats = quiet(spider.rerender, workers=0)
+    assert (stats["changed"], stats["failed"]) == (0, 0)
+    assert open(path, encoding="utf-8").read() == before
+
+
+def test_stream_prefetch_of_near_duplicate_is_discarded(tmp_path):
+    srv = FixtureServer(image_latency=0.05).start()
+    try:
+        spider = quiet(make_spider, tmp_path)
+        spider.stream_images = True
+        spider.near_duplicates = "link"
+        quiet(spider.crawl, srv.url("small", 1))
+        before = image_blobs(spider)
+        reports = quiet(spider.crawl_many, [srv.url("small", 2)], workers=1)
+        time.sleep(0.3)
+        assert reports[0]["status"] == "success"
+        assert image_blobs(spider) == before
+        assert not [f for f in os.listdir(spider.images.images_dir) if f.startswith(".")]
+        assert len(spider.index.duplicates_of(srv.url("small", 1))) == 1
+    finally:
+        srv.stop()
+
+
+def test_worker_waits_for_other_owners_leases(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    spider.frontier.enqueue([(server.url("small", 200 + i), "") for i in range(3)])
+    held = spider.frontier.claim("other:1", lease_seconds=1.0)
+    started = time.time()
+    reports = quiet(spider.run_worker, workers=2)
+    # 其他进程持有的任务只在租约过期后才被接手
+    assert time.time() - started >= 0.9
+    assert sorted(r["status"] for r in reports) == ["success"] * 3
+    assert spider.frontier.get(held["url"])["attempts"] == 2
+
+
+def test_migrate_layout_moves_articles_and_fixes_image_links(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    urls = [server.url("small", 100 + i) for i in range(2)]
+    quiet(spider.crawl_many, urls)
+    flat = markdown_files(tmp_path)
+
+    assert quiet(spider.migrate_layout, "hash") == 2
+    assert not markdown_files(tmp_path)
+    for url in urls:
+        aid = wx.WechatArticleSpider.article_id(url)
+        filename = spider.index.get(url)["filename"]
+        assert filename == f"{aid[:2]}/{aid[2:4]}/{aid}.md"
+        content = (tmp_path / filename).read_text(encoding="utf-8")
+        links = re.findall(r'\]\((\.\./\.\./images/[^)]+)\)', content)
+        assert links and all((tmp_path / aid[:2] / aid[2:4] / link).exists() for link in links)
+    # 分层布局下重新爬取写回同一个位置
+    path = quiet(spider.crawl, urls[0], force=True)
+    assert path == os.path.join(str(tmp_path), spider.index.get(urls[0])["filename"])
+
+    assert quiet(spider.migrate_layout, "flat") == 2
+    assert markdown_files(tmp_path) == flat
+
+
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_both_engines_count_pages_and_failures(tmp_path, server, engine):
+    if engine == "async" and not wx.HAS_AIOHTTP:
+        pytest.skip("未安装 aiohttp")
+    spider = quiet(make_spider, tmp_path, wx.AsyncWechatArticleSpider if engine == "async" else None)
+    urls = [server.url("small", 120 + i) for i in range(2)] + [server.base + "/s/missing/2"]
+    quiet(spider.crawl_many, urls)
+    counters = spider.metrics.snapshot()["counters"]
+    assert counters["pages_fetched"] == 2 and counters["articles_saved"] == 2
+    assert counters['fetch_failures{kind="client"}'] == 1
+    assert counters["images_downloaded"] == 4
+
+
+def test_session_pool_grows_existing_sessions():
+    pool = wx.SessionPool(pool_size=2)
+    session = pool._get_session(("", "example.com"))
+    pool.ensure_size(16)
+    assert session.get_adapter("https://example.com")._pool_maxsize == 16
+    pool.close()
+
+
+# 异步引擎
+
+@pytest.mark.skipif(not wx.HAS_AIOHTTP, reason="未安装 aiohttp")
+def test_async_crawl_many_saves_without_changing_concurrency(tmp_path, server):
+    spider = quiet(make_spider, tmp_path, wx.AsyncWechatArticleSpider, concurrency=5)
+    urls = [server.url("small", 10 + i) for i in range(3)]
+    reports = quiet(spider.crawl_many, urls, workers=1)
+    assert [r["status"] for r in reports] == ["success"] * 3
+    assert len(markdown_files(tmp_path)) == 3
+    assert len(os.listdir(tmp_path / "images")) == 6
+    assert spider.concurrency == 5
+
+
+@pytest.mark.skipif(not wx.HAS_AIOHTTP, reason="未安装 aiohttp")
+def test_async_engine_skips_indexed_urls(tmp_path, server):
+    urls = [server.url("small", 60 + i) for i in range(2)]
+    quiet(quiet(make_spider, tmp_path).crawl_many, urls)
+    pages = server.counters["pages"]
+    spider = quiet(make_spider, tmp_path, wx.AsyncWechatArticleSpider)
+    assert [r["status"] for r in quiet(spider.crawl_many, urls)] == ["skipped", "skipped"]
+    assert server.counters["pages"] == pages
+    assert len(markdown_files(tmp_path)) == 2
+
+
+@pytest.mark.skipif(not wx.HAS_AIOHTTP, reason="未安装 aiohttp")
+def test_async_engine_accepts_force(tmp_path, server):
+    spider = quiet(make_spider, tmp_path, wx.AsyncWechatArticleSpider)
+    url = server.url("small", 70)
+    path = quiet(spider.crawl, url)
+    pages = server.counters["pages"]
+    assert quiet(spider.crawl, url) == path
+    assert server.counters["pages"] == pages
+    assert quiet(spider.crawl, url, force=True) == path
+    assert server.counters["pages"] == pages + 1
+    assert [r["status"] for r in quiet(spider.refresh)] == ["success"]
+    assert markdown_files(tmp_path) == [os.path.basename(path)]
+
+
+@pytest.mark.skipif(not wx.HAS_AIOHTTP, reason="未安装 aiohttp")
+def test_async_engine_uses_cache_archive_and_queue(tmp_path, server):
+    spider = quiet(make_spider, tmp_path, wx.AsyncWechatArticleSpider)
+    urls = [server.url("small", 80 + i) for i in range(3)]
+    assert [r["status"] for r in quiet(spider.crawl_many, urls)] == ["success"] * 3
+    assert len(spider.html_cache.archive) == 3
+    assert spider.frontier.counts()["done"] == 3
+
+    # 强制重新爬取时发送条件请求，内容未变的文章不重写
+    before = {name: os.path.getmtime(tmp_path / name) for name in markdown_files(tmp_path)}
+    assert [r["status"] for r in quiet(spider.crawl_many, urls, force=True)] == ["success"] * 3
+    assert {name: os.path.getmtime(tmp_path / name) for name in markdown_files(tmp_path)} == before
+
+
+# 命令行
+
+def test_cli_crawl_list_search_status_and_migrate(tmp_path, server):
+    out = str(tmp_path)
+    urls = [server.url("small", 130 + i) for i in range(2)]
+    code, reports = run_main("-o", out, "crawl", *urls, "--tags", "技术,测试", "--near-duplicates", "off")
+    assert code == 0 and [r["status"] for r in reports] == ["success"] * 2
+    code, reports = run_main("-o", out, "crawl", urls[0], server.base + "/s/missing/3")
+    assert code == 1 and [r["status"] for r in reports] == ["skipped", "failed"]
+
+    code, listed = run_main("-o", out, "list", "--tag", "测试", "--limit", "1")
+    assert code == 0 and len(listed) == 1 and listed[0]["url"] in urls
+    assert [t["tag"] for t in run_main("-o", out, "tags")[1]] == ["技术", "测试"]
+    found = run_main("-o", out, "search", "叶子文本", "--tag", "技术")[1]
+    assert sorted(a["url"] for a in found) == sorted(urls)
+    assert run_main("-o", out, "status")[1] == [{"pending": 0, "inflight": 0, "done": 2, "failed": 1, "workers": []}]
+
+    assert run_main("-o", out, "migrate-layout", "hash")[1] == [{"layout": "hash", "moved": 2}]
+    assert not markdown_files(tmp_path)
+    assert len(run_main("-o", out, "list")[1]) == 2
+
+
+@pytest.mark.skipif(not wx.HAS_AIOHTTP, reason="未安装 aiohttp")
+def test_cli_enqueue_then_worker(tmp_path, server, monkeypatch):
+    # worker 会安装信号处理函数，测试中不替换 pytest 的处理
+    monkeypatch.setattr("signal.signal", lambda *args: None)
+    out = str(tmp_path)
+    urls = [server.url("small", 210 + i) for i in range(2)]
+    assert run_main("-o", out, "enqueue", *urls)[1] == [{"added": 2, "skipped": 0, "pending": 2}]
+    code, reports = run_main("-o", out, "worker", "--jobs", "2", "--near-duplicates", "off")
+    assert code == 0 and sorted(r["url"] for r in reports) == sorted(urls)
+    # 已收录的链接不再入队
+    assert run_main("-o", out, "enqueue", urls[0])[1] == [{"added": 0, "skipped": 1, "pending": 0}]
+
+
+def test_cli_async_crawl_honours_force(tmp_path, server):
+    url = server.url("small", 140)
+    assert run_main("-o", str(tmp_path), "crawl", "--async", url)[1][0]["status"] == "success"
+    assert run_main("-o", str(tmp_path), "crawl", "--async", url)[1][0]["status"] == "skipped"
+    pages = server.counters["pages"]
+    assert run_main("-o", str(tmp_path), "crawl", "--async", "--force", url)[1][0]["status"] == "success"
+    assert server.counters["pages"] == pages + 1
+
+
+def test_cli_rejects_parse_jobs_with_async(tmp_path):
+    with pytest.raises(SystemExit) as exc, contextlib.redirect_stderr(io.StringIO()):
+        wx.main(["-o", str(tmp_path), "crawl", "--async", "--parse-jobs", "2", "http://x"])
+    assert exc.value.code == 2
+
+
+# 图形界面（不创建窗口，用替身代替 Tk 变量和控件）
+
+class FakeVar:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+def make_gui(spider, **values):
+    gui = object.__new__(wx.WechatSpiderGUI)
+    gui.spider = spider
+    gui.progress_queue = Queue()
+    settings = {"proxy_enable_var": False, "proxy_list_var": "", "rate_enable_var": True, "ua_enable_var": True,
+                "stream_enable_var": False, "rate_val_var": "0.5"}
+    settings.update(values)
+    for name, value in settings.items():
+        setattr(gui, name, FakeVar(value))
+    return gui
+
+
+def test_gui_settings_apply_to_spider(tmp_path):
+    spider = quiet(make_spider, tmp_path)
+    gui = make_gui(spider, proxy_enable_var=True, proxy_list_var="1.1.1.1:80, 2.2.2.2:80", rate_enable_var=False,
+                   ua_enable_var=False, stream_enable_var=True, rate_val_var="1.5")
+    quiet(gui.apply_settings)
+    assert spider.use_proxy and spider.proxies_list == ["1.1.1.1:80", "2.2.2.2:80"]
+    assert (spider.use_rate_limit, spider.use_random_ua, spider.stream_images) == (False, False, True)
+    assert spider.rate_limiter.initial_rate == 1.5
+
+    gui.rate_val_var.set("快一点")
+    quiet(gui.apply_settings)
+    assert gui.rate_val_var.get() == "1.5"
+
+
+def test_gui_crawl_thread_reports_progress_through_queue(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    gui = make_gui(spider)
+    spider.on_progress = lambda report: gui.progress_queue.put(("progress", report))
+    urls = [server.url("small", 150 + i) for i in range(2)]
+    quiet(gui.crawl_thread, urls, ["", ""], 2)
+    events = []
+    while not gui.progress_queue.empty():
+        events.append(gui.progress_queue.get())
+    kind, reports, error = events[-1]
+    assert kind == "finished" and error is None and [r["status"] for r in reports] == ["success"] * 2
+    finished = [e[1]["url"] for e in events[:-1] if e[1]["status"] == "success"]
+    assert sorted(finished) == sorted(urls)
+
+    log = Queue()
+    stream = wx.QueueLogStream(log)
+    with contextlib.redirect_stdout(stream):
+        print("日志")
+    assert log.get_nowait() == "日志"
+
+
+def test_cancelled_batch_leaves_urls_pending(tmp_path, server):
+    spider = quiet(make_spider, tmp_path)
+    urls = [server.url("small", 160 + i) for i in range(2)]
+    spider.cancel_event.set()
+    assert [r["status"] for r in quiet(spider.crawl_many, urls)] == ["pending"] * 2
+    assert spider.frontier.counts()["pending"] == 2
+
+    spider.cancel_event.clear()
+    assert [r["status"] for r in quiet(spider.resume_crawl)] == ["success"] * 2
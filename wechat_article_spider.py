@@ -9,18 +9,2100 @@ import os
 import re
 import hashlib
 import json
-import requests
-from bs4 import BeautifulSoup
+import gzip
+import codecs
+import shutil
+import struct
+import socket
+import sqlite3
+import tempfile
+import importlib.util
+import queue
+import sys
 from datetime import datetime
+from urllib.parse import urlparse, parse_qs, urlencode
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 
 import time
 import random
+import threading
+from functools import partial
+from collections import Counter
+from contextlib import contextmanager, redirect_stdout
+from email.utils import parsedate_to_datetime
 try:
-    from fake_useragent import UserAgent
-    HAS_FAKE_UA = True
+    import fcntl
+    HAS_FCNTL = True
 except ImportError:
-    HAS_FAKE_UA = False
+    # Windows 上没有 fcntl，归档包的跨进程写锁退化为进程内锁
+    HAS_FCNTL = False
+
+# 以下依赖导入较慢，只检查是否安装，用到时再导入（requests、BeautifulSoup、tkinter 同样延迟导入），
+# 命令行查询等短任务不必为用不到的模块付出启动时间
+HAS_LXML = importlib.util.find_spec("lxml") is not None
+HAS_FAKE_UA = importlib.util.find_spec("fake_useragent") is not None
+HAS_AIOHTTP = importlib.util.find_spec("aiohttp") is not None
+
+# lxml 单遍转换器中需要关注的标签
+HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+TEXT_BLOCK_TAGS = {'p', 'span', 'section'}
+
+# 风控/限流页面的特征文字
+BLOCK_PAGE_MARKERS = ("环境异常", "访问过于频繁", "操作频繁", "完成验证后即可继续访问")
+
+# 图片流式下载的分块大小
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+# Markdown 中指向图片库的链接（分层布局下带有若干级 ../ 前缀）
+IMAGE_LINK_RE = re.compile(r'\]\((?:\.\./)*images/([^)\s]+)\)')
+
+# 输出布局：flat 按标题命名平铺；hash 按文章 ID 前缀分两级目录；account 按 公众号/年-月 分目录
+LAYOUTS = ("flat", "hash", "account")
+
+# 近似重复文章（转载稍作改动）的处理方式：link 不另存，登记为已收录文章的别名；
+# skip-images 照常保存正文，但不下载图片（保留原图链接）；off 不检测
+DUPLICATE_MODES = ("link", "skip-images", "off")
+
+
+class AdaptiveRateLimiter:
+    """
+    自适应限速器：每个 key（主机，或主机+代理）一个令牌桶
+    请求成功时速率加性增加，遇到 429/5xx 或风控页面时乘性减小 (AIMD)，线程安全
+    """
+
+    def __init__(self, initial_rate=0.5, min_rate=0.05, max_rate=2.0, increase=0.05, decrease=0.5, burst=1.0):
+        """
+        :param initial_rate: 新 key 的初始速率（次/秒）
+        :param min_rate: 速率下限
+        :param max_rate: 速率上限
+        :param increase: 每次成功增加的速率
+        :param decrease: 被限流时速率乘以的系数
+        :param burst: 令牌桶容量，即空闲后允许连续发出的请求数
+        """
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = {"rate": self.initial_rate, "tokens": self.burst, "last": now, "last_decrease": 0.0}
+            self._buckets[key] = bucket
+        return bucket
+
+    def reserve(self, key):
+        """
+        预约一个令牌
+        令牌不足时记为欠账，并发调用者按欠账顺序排队
+        :return: 调用方需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(key, now)
+            bucket["tokens"] = min(self.burst, bucket["tokens"] + (now - bucket["last"]) * bucket["rate"])
+            bucket["last"] = now
+            bucket["tokens"] -= 1.0
+            if bucket["tokens"] >= 0:
+                return 0.0
+            return -bucket["tokens"] / bucket["rate"]
+
+    def on_success(self, key):
+        """请求成功：加性增加速率"""
+        with self._lock:
+            bucket = self._bucket(key, time.monotonic())
+            bucket["rate"] = min(self.max_rate, bucket["rate"] + self.increase)
+
+    def on_throttle(self, key):
+        """
+        被限流：乘性减小速率并清空令牌
+        同一时间窗内的多次限流只减一次，避免并发请求同时失败时速率被连续砍到底
+        """
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(key, now)
+            if now - bucket["last_decrease"] < 1.0 / bucket["rate"]:
+                return
+            bucket["rate"] = max(self.min_rate, bucket["rate"] * self.decrease)
+            bucket["tokens"] = min(bucket["tokens"], 0.0)
+            bucket["last_decrease"] = now
+            print(f"检测到限流，降低请求速率: {key} -> {bucket['rate']:.2f} 次/秒")
+
+    def set_initial_rate(self, rate):
+        """修改初始速率，已学习到的速率一并重置"""
+        with self._lock:
+            if rate != self.initial_rate:
+                self.initial_rate = max(self.min_rate, min(self.max_rate, rate))
+                self._buckets.clear()
+
+    def rates(self):
+        """当前各 key 的有效速率（次/秒）"""
+        with self._lock:
+            return {key: round(b["rate"], 3) for key, b in self._buckets.items()}
+
+
+WECHAT_HOST = "mp.weixin.qq.com"
+SHORT_LINK_RE = re.compile(r'^/s/([A-Za-z0-9_-]+)$')
+# 文章页中指向规范链接的位置：og:url 与 msg_link 变量
+ALIAS_URL_RE = re.compile(r'<meta[^>]+property="og:url"[^>]+content="([^"]+)"|var\s+msg_link\s*=\s*"([^"]+)"')
+
+
+def canonicalize_wechat_url(url):
+    """
+    规范化公众号文章链接
+    长链接按 __biz/mid/idx/sn 定位文章，短链接按 /s/<id> 定位，
+    chksm、scene、sessionid 等分享参数全部去掉
+    :return: (规范化后的链接, 去重键)
+    """
+    # 从页面中复制的链接常带 HTML 转义的 &amp;；不能整体反转义，否则 &timestamp、&copy 这类
+    # 无分号的参数名会被当作旧式实体（×tamp、©）
+    url = url.strip().replace("&amp;", "&")
+    parsed = urlparse(url)
+    if parsed.netloc.lower() == WECHAT_HOST:
+        path = parsed.path.rstrip('/')
+        m = SHORT_LINK_RE.match(path)
+        if m:
+            return f"https://{WECHAT_HOST}/s/{m.group(1)}", f"s:{m.group(1)}"
+        
+        query = parse_qs(parsed.query)
+        
+        def first(*names):
+            for name in names:
+                if query.get(name):
+                    return query[name][0]
+            return ""
+        
+        parts = (
+            ("__biz", first("__biz")),
+            ("mid", first("mid", "appmsgid")),
+            ("idx", first("idx", "itemidx")),
+            ("sn", first("sn", "sign")),
+        )
+        if all(v for _, v in parts):
+            return f"https://{WECHAT_HOST}/s?{urlencode(parts)}", "biz:" + ":".join(v for _, v in parts)
+    
+    canonical = parsed._replace(fragment="").geturl()
+    return canonical, "url:" + canonical
+
+
+def url_key(url):
+    """文章去重键，见 canonicalize_wechat_url"""
+    return canonicalize_wechat_url(url)[1]
+
+
+class FetchFailure:
+    """一次请求失败的分类结果"""
+
+    # 失败类型：超时、代理故障、连接错误、4xx、5xx、429 限流、风控页面
+    TIMEOUT = "timeout"
+    PROXY = "proxy"
+    CONNECTION = "connection"
+    CLIENT = "client"
+    SERVER = "server"
+    THROTTLED = "throttled"
+    BLOCKED = "blocked"
+
+    NAMES = {
+        TIMEOUT: "请求超时",
+        PROXY: "代理故障",
+        CONNECTION: "连接错误",
+        CLIENT: "客户端错误",
+        SERVER: "服务器错误",
+        THROTTLED: "请求过多",
+        BLOCKED: "风控拦截",
+    }
+
+    def __init__(self, kind, message="", status=None, retry_after=None):
+        self.kind = kind
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+    def __str__(self):
+        text = self.NAMES.get(self.kind, self.kind)
+        if self.status:
+            text += f" (状态码 {self.status})"
+        if self.message:
+            text += f": {self.message}"
+        return text
+
+    @classmethod
+    def from_exception(cls, exc, via_proxy=False):
+        """按异常类型分类，不再依赖异常消息的字符串匹配"""
+        import requests
+        if isinstance(exc, requests.exceptions.ProxyError):
+            return cls(cls.PROXY, str(exc))
+        if isinstance(exc, requests.exceptions.Timeout):
+            return cls(cls.PROXY if via_proxy else cls.TIMEOUT, str(exc))
+        if isinstance(exc, requests.exceptions.ConnectionError):
+            return cls(cls.PROXY if via_proxy else cls.CONNECTION, str(exc))
+        return cls(cls.CONNECTION, repr(exc))
+
+    @classmethod
+    def from_response(cls, status, headers=None, via_proxy=False):
+        """按状态码分类"""
+        retry_after = parse_retry_after((headers or {}).get("Retry-After"))
+        if status == 429:
+            return cls(cls.THROTTLED, status=status, retry_after=retry_after)
+        if status in (403, 407) and via_proxy:
+            return cls(cls.PROXY, status=status)
+        if status >= 500:
+            return cls(cls.SERVER, status=status, retry_after=retry_after)
+        return cls(cls.CLIENT, status=status)
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 头，支持秒数和 HTTP 日期两种格式
+    :return: 需要等待的秒数，无法解析时返回 None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """
+    重试策略
+    只重试可恢复的失败；退避时间按指数增长并加抖动，服务器给出 Retry-After 时以其为准；
+    每个 URL 有总时间预算，超出预算不再重试
+    """
+
+    RETRYABLE = {
+        FetchFailure.TIMEOUT, FetchFailure.PROXY, FetchFailure.CONNECTION,
+        FetchFailure.SERVER, FetchFailure.THROTTLED, FetchFailure.BLOCKED,
+    }
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0, deadline=180.0):
+        """
+        :param max_attempts: 最多尝试次数（含首次）
+        :param base_delay: 首次重试的基础等待（秒）
+        :param max_delay: 单次等待上限（秒）
+        :param deadline: 单个 URL 从首次请求起的总时间预算（秒）
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt, failure):
+        """第 attempt 次失败后的等待时间：指数退避，一半固定一半随机；服务器要求的 Retry-After 不缩短"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        if failure.retry_after is not None:
+            delay = max(delay, failure.retry_after)
+        return delay
+
+    def next_delay(self, attempt, failure, elapsed):
+        """
+        决定是否重试
+        :param attempt: 已尝试次数
+        :param failure: 本次失败（FetchFailure）
+        :param elapsed: 距首次请求已过去的秒数
+        :return: 重试前需要等待的秒数；不再重试时返回 None
+        """
+        if failure.kind not in self.RETRYABLE or attempt >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt, failure)
+        # 包括 Retry-After 超出剩余预算的情况：等到预算用完再重试只会再次被限流
+        if elapsed + delay > self.deadline:
+            return None
+        return delay
+
+
+class CrawlQueue:
+    """
+    持久化抓取队列（SQLite）
+    每个 URL 有 pending / inflight / done / failed 四种状态；取出任务时加租约，
+    进程中断后租约过期或重新启动时，未完成的任务会被重新认领
+    多个进程（工作进程模式）可共用同一个队列：认领在 BEGIN IMMEDIATE 事务中互斥，
+    持有者定期续租（心跳），进程退出后租约过期，任务由其他进程接手
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS frontier (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL UNIQUE,
+        tags TEXT NOT NULL DEFAULT '',
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        not_before REAL NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_until REAL,
+        first_started REAL,
+        path TEXT,
+        error TEXT NOT NULL DEFAULT '',
+        updated_at REAL NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_frontier_ready ON frontier(state, not_before, id);
+    CREATE INDEX IF NOT EXISTS idx_frontier_lease ON frontier(state, lease_until);
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._ensure_url_key()
+
+    def _ensure_url_key(self):
+        """按规范化去重键去重：旧队列补充 url_key 列，同一文章的重复链接只保留最早一条"""
+        columns = [r["name"] for r in self._conn.execute("PRAGMA table_info(frontier)")]
+        if "url_key" not in columns:
+            self._conn.execute("ALTER TABLE frontier ADD COLUMN url_key TEXT")
+        rows = self._conn.execute("SELECT id, url FROM frontier WHERE url_key IS NULL ORDER BY id").fetchall()
+        if rows:
+            def run(conn):
+                seen = {r[0] for r in conn.execute("SELECT url_key FROM frontier WHERE url_key IS NOT NULL")}
+                for row in rows:
+                    key = url_key(row["url"])
+                    if key in seen:
+                        conn.execute("DELETE FROM frontier WHERE id = ?", (row["id"],))
+                    else:
+                        seen.add(key)
+                        conn.execute("UPDATE frontier SET url_key = ? WHERE id = ?", (key, row["id"]))
+            self._write(run)
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_frontier_key ON frontier(url_key)")
+
+    def _write(self, fn, *args):
+        """在一个写事务中执行 fn(conn, *args)，BEGIN IMMEDIATE 保证多进程认领时互斥"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn, *args)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, items, force=False):
+        """
+        批量入队，按规范化去重键去重（同一文章的不同分享链接只入队一次）
+        再次提交此前已失败的 URL 时重新置为待处理（重新计算尝试次数和时间预算）
+        :param items: (url, tags) 序列
+        :param force: 已完成的 URL 也重新置为待处理
+        :return: 新加入（含重新入队）的 URL 数
+        """
+        items = [(url, tags, url_key(url)) for url, tags in items]
+        now = time.time()
+
+        def run(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO frontier (url, url_key, tags, updated_at) VALUES (?, ?, ?, ?)",
+                [(url, key, tags or "", now) for url, tags, key in items],
+            )
+            states = "('done', 'failed')" if force else "('failed')"
+            conn.executemany(
+                "UPDATE frontier SET state = 'pending', attempts = 0, not_before = 0, first_started = NULL, "
+                f"tags = ?, error = '', updated_at = ? WHERE url_key = ? AND state IN {states}",
+                [(tags or "", now, key) for url, tags, key in items],
+            )
+            return conn.total_changes - before
+
+        return self._write(run)
+
+    def claim(self, owner, lease_seconds=300):
+        """
+        认领一个到期的待处理任务（租约过期的任务视为待处理）
+        :return: 任务字典；暂无可执行任务时返回 None
+        """
+        def run(conn):
+            now = time.time()
+            # 租约过期的任务（持有者已退出）重新计算时间预算，预算不包括无人处理的这段时间
+            conn.execute(
+                "UPDATE frontier SET state = 'pending', lease_owner = NULL, lease_until = NULL, first_started = NULL "
+                "WHERE state = 'inflight' AND lease_until < ?",
+                (now,),
+            )
+            row = conn.execute(
+                "SELECT id FROM frontier WHERE state = 'pending' AND not_before <= ? "
+                "ORDER BY not_before, id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            return self._lease(conn, row["id"], owner, lease_seconds, now)
+
+        return self._write(run)
+
+    def claim_url(self, url, tags, owner, lease_seconds=300):
+        """单篇爬取：入队（如不存在）并直接认领该 URL"""
+        key = url_key(url)
+
+        def run(conn):
+            now = time.time()
+            conn.execute(
+                "INSERT OR IGNORE INTO frontier (url, url_key, tags, updated_at) VALUES (?, ?, ?, ?)",
+                (url, key, tags or "", now),
+            )
+            row = conn.execute("SELECT id FROM frontier WHERE url_key = ?", (key,)).fetchone()
+            conn.execute("UPDATE frontier SET tags = ?, first_started = NULL WHERE id = ?", (tags or "", row["id"]))
+            return self._lease(conn, row["id"], owner, lease_seconds, now)
+
+        return self._write(run)
+
+    @staticmethod
+    def _lease(conn, task_id, owner, lease_seconds, now):
+        conn.execute(
+            "UPDATE frontier SET state = 'inflight', attempts = attempts + 1, lease_owner = ?, lease_until = ?, "
+            "first_started = COALESCE(first_started, ?), updated_at = ? WHERE id = ?",
+            (owner, now + lease_seconds, now, now, task_id),
+        )
+        return dict(conn.execute("SELECT * FROM frontier WHERE id = ?", (task_id,)).fetchone())
+
+    def renew(self, owner, lease_seconds=300):
+        """
+        心跳：延长 owner 持有的全部租约
+        :return: 续租的任务数
+        """
+        def run(conn):
+            return conn.execute(
+                "UPDATE frontier SET lease_until = ? WHERE state = 'inflight' AND lease_owner = ?",
+                (time.time() + lease_seconds, owner),
+            ).rowcount
+
+        return self._write(run)
+
+    def complete(self, task_id, path, owner=None):
+        """标记任务完成"""
+        return self._finish(task_id, "done", path=path, owner=owner)
+
+    def fail(self, task_id, error, owner=None):
+        """标记任务最终失败"""
+        return self._finish(task_id, "failed", error=error, owner=owner)
+
+    def retry(self, task_id, delay, error, owner=None):
+        """任务放回队列，delay 秒后才能再次被认领"""
+        return self._finish(task_id, "pending", error=error, not_before=time.time() + delay, owner=owner)
+
+    def _finish(self, task_id, state, path=None, error="", not_before=0, owner=None):
+        """
+        更新任务状态
+        :param owner: 传入时只有租约仍属于 owner 才更新（租约过期后已被其他进程接手的任务不再改动）
+        :return: 是否更新
+        """
+        def run(conn):
+            sql = ("UPDATE frontier SET state = ?, path = COALESCE(?, path), error = ?, not_before = ?, "
+                   "lease_owner = NULL, lease_until = NULL, updated_at = ? WHERE id = ?")
+            params = [state, path, error, not_before, time.time(), task_id]
+            if owner is not None:
+                sql += " AND state = 'inflight' AND lease_owner = ?"
+                params.append(owner)
+            return conn.execute(sql, params).rowcount > 0
+
+        return self._write(run)
+
+    def requeue_inflight(self):
+        """
+        把所有进行中的任务放回待处理（单进程批量模式启动时调用，接管上次中断留下的任务）
+        未完成任务的时间预算从本次重新计算，否则中断期间也计入预算，可重试的失败第一次就会被放弃
+        有其他工作进程在运行时不要调用，否则会抢走它们正在处理的任务
+        :return: 放回的任务数
+        """
+        def run(conn):
+            count = conn.execute(
+                "UPDATE frontier SET state = 'pending', lease_owner = NULL, lease_until = NULL "
+                "WHERE state = 'inflight'"
+            ).rowcount
+            conn.execute("UPDATE frontier SET first_started = NULL WHERE state = 'pending'")
+            return count
+
+        return self._write(run)
+
+    def next_ready_in(self, exclude_owner=None):
+        """
+        距离最早的任务可认领还有多少秒（待处理任务到期，或进行中任务的租约过期）
+        :param exclude_owner: 不考虑该持有者的租约（本进程其他线程手里的任务由它们自己完成，不必等待）
+        :return: 秒数；没有待处理和进行中的任务时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(t) FROM ("
+                "SELECT MIN(not_before) AS t FROM frontier WHERE state = 'pending' "
+                "UNION ALL SELECT MIN(lease_until) FROM frontier WHERE state = 'inflight' "
+                "AND lease_owner IS NOT ?)",
+                (exclude_owner,),
+            ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def get(self, url):
+        """按 URL（规范化后）查询任务，不存在返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM frontier WHERE url_key = ?", (url_key(url),)).fetchone()
+        return dict(row) if row else None
+
+    def leases(self):
+        """
+        当前有效的租约，按持有者汇总
+        :return: 列表 [{"owner", "tasks", "lease_until"}]
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lease_owner AS owner, COUNT(*) AS tasks, MAX(lease_until) AS lease_until FROM frontier "
+                "WHERE state = 'inflight' AND lease_until >= ? GROUP BY lease_owner ORDER BY lease_owner",
+                (time.time(),),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def counts(self):
+        """各状态的任务数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM frontier GROUP BY state").fetchall()
+        result = {"pending": 0, "inflight": 0, "done": 0, "failed": 0}
+        result.update({r[0]: r[1] for r in rows})
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class HtmlArchive:
+    """
+    原始页面归档包
+    所有抓到的页面按记录追加写入一个只增不改的包文件，每条记录单独 gzip 压缩；
+    另有一个偏移索引文件记录 去重键 -> (偏移, 长度)，读取任意一页只需一次 seek
+    多个进程共用时，追加在文件锁下进行；其他进程追加的记录在查不到某个键时从索引文件末尾增量读入
+    """
+
+    MAGIC = b"WXA1"
+    # 记录头：魔数 + 头部 JSON 长度 + 压缩正文长度
+    RECORD_HEAD = struct.Struct(">4sII")
+
+    def __init__(self, archive_dir, name="pages"):
+        os.makedirs(archive_dir, exist_ok=True)
+        self.pack_path = os.path.join(archive_dir, name + ".pack")
+        self.index_path = os.path.join(archive_dir, name + ".idx")
+        self._lock = threading.RLock()
+        self._offsets = {}
+        # 偏移索引文件已读入的字节数
+        self._index_pos = 0
+        if os.path.exists(self.pack_path) and not os.path.exists(self.index_path):
+            self.rebuild_index()
+        else:
+            self._load_index()
+
+    def _load_index(self):
+        """载入偏移索引，同一个键以最后一条为准"""
+        with self._lock:
+            self._offsets = {}
+            self._index_pos = 0
+            self._refresh()
+
+    def _refresh(self):
+        """读入索引文件中新增的行（其他进程追加的记录），只处理完整的行"""
+        try:
+            size = os.path.getsize(self.index_path)
+        except OSError:
+            return
+        with self._lock:
+            if size <= self._index_pos:
+                return
+            with open(self.index_path, 'rb') as f:
+                f.seek(self._index_pos)
+                data = f.read(size - self._index_pos)
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].decode('utf-8').splitlines():
+                parts = line.split("\t")
+                if len(parts) == 4:
+                    key, offset, length, url = parts
+                    self._offsets[key] = (int(offset), int(length), url)
+            self._index_pos += end
+
+    @contextmanager
+    def _locked(self):
+        """进程内与跨进程的写锁（跨进程部分锁在索引文件上）"""
+        with self._lock:
+            if not HAS_FCNTL:
+                yield
+                return
+            with open(self.index_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def rebuild_index(self):
+        """顺序扫描包文件重建偏移索引（索引文件丢失时使用）"""
+        offsets = {}
+        with open(self.pack_path, 'rb') as f:
+            offset = 0
+            while True:
+                head = f.read(self.RECORD_HEAD.size)
+                if len(head) < self.RECORD_HEAD.size:
+                    break
+                magic, head_len, body_len = self.RECORD_HEAD.unpack(head)
+                if magic != self.MAGIC:
+                    # 末尾的残缺记录（写入时中断），忽略
+                    break
+                meta = json.loads(f.read(head_len).decode('utf-8'))
+                f.seek(body_len, os.SEEK_CUR)
+                length = self.RECORD_HEAD.size + head_len + body_len
+                offsets[meta["key"]] = (offset, length, meta["url"])
+                offset += length
+        
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, (offset, length, url) in offsets.items():
+                f.write(f"{key}\t{offset}\t{length}\t{url}\n")
+        os.replace(tmp_path, self.index_path)
+        with self._lock:
+            self._offsets = offsets
+            self._index_pos = os.path.getsize(self.index_path)
+        return len(offsets)
+
+    def __contains__(self, key):
+        if key not in self._offsets:
+            self._refresh()
+        return key in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, key, url, html, content_hash=""):
+        """追加一页，返回记录偏移"""
+        meta = json.dumps({
+            "key": key,
+            "url": url,
+            "hash": content_hash,
+            "fetched_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }, ensure_ascii=False).encode('utf-8')
+        body = gzip.compress(html.encode('utf-8'))
+        record = self.RECORD_HEAD.pack(self.MAGIC, len(meta), len(body)) + meta + body
+        
+        with self._locked():
+            # 先读入其他进程追加的索引行，再写自己的一行
+            self._refresh()
+            with open(self.pack_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(record)
+            with open(self.index_path, 'ab') as f:
+                f.write(f"{key}\t{offset}\t{len(record)}\t{url}\n".encode('utf-8'))
+                self._index_pos = f.tell()
+            self._offsets[key] = (offset, len(record), url)
+        return offset
+
+    @classmethod
+    def read_at(cls, pack_path, offset, length):
+        """按偏移读取一条记录的正文（不依赖索引，可在子进程中直接调用）"""
+        with open(pack_path, 'rb') as f:
+            f.seek(offset)
+            record = f.read(length)
+        _, head_len, _ = cls.RECORD_HEAD.unpack_from(record)
+        body = record[cls.RECORD_HEAD.size + head_len:]
+        return gzip.decompress(body).decode('utf-8')
+
+    def read(self, key):
+        """读取某一页的最新版本，不存在返回 None"""
+        if key not in self:
+            return None
+        entry = self._offsets[key]
+        offset, length, _ = entry
+        return self.read_at(self.pack_path, offset, length)
+
+    def entries(self):
+        """
+        每个键最新版本的位置
+        :return: 列表 [(key, url, offset, length)]
+        """
+        self._refresh()
+        with self._lock:
+            return [(key, url, offset, length) for key, (offset, length, url) in self._offsets.items()]
+
+    def items(self):
+        """
+        遍历每个键的最新版本
+        :return: 迭代 (key, url, html)
+        """
+        for key, url, offset, length in self.entries():
+            yield key, url, self.read_at(self.pack_path, offset, length)
+
+
+class HtmlCache:
+    """
+    原始页面缓存
+    记录每篇文章最近一次响应的校验信息（ETag / Last-Modified / 内容哈希），正文存放在归档包中，
+    重新爬取时据此发送条件请求，并判断内容是否变化
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS http_cache (
+        key TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        content_hash TEXT NOT NULL,
+        fetched_at TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "cache.db"), timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self.archive = HtmlArchive(cache_dir)
+        self._migrate_page_files()
+
+    def _migrate_page_files(self):
+        """旧版按文件保存的页面（cache/pages/*.html.gz）并入归档包"""
+        pages_dir = os.path.join(self.cache_dir, "pages")
+        if not os.path.isdir(pages_dir):
+            return
+        with self._lock:
+            rows = self._conn.execute("SELECT key, url, content_hash FROM http_cache").fetchall()
+        for row in rows:
+            name = hashlib.sha1(row["key"].encode('utf-8')).hexdigest()
+            path = os.path.join(pages_dir, name[:2], name + ".html.gz")
+            if os.path.exists(path) and row["key"] not in self.archive:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    self.archive.append(row["key"], row["url"], f.read(), row["content_hash"])
+        shutil.rmtree(pages_dir, ignore_errors=True)
+
+    @staticmethod
+    def content_hash(html):
+        return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """查询缓存的校验信息，不存在或正文不在归档中时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM http_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or key not in self.archive:
+            return None
+        return dict(row)
+
+    def load_body(self, key):
+        """从归档包读取页面正文"""
+        try:
+            return self.archive.read(key)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def store(self, key, url, html, etag=None, last_modified=None):
+        """
+        保存一次 200 响应
+        :return: 内容是否与缓存不同（没有缓存时视为不同）
+        """
+        digest = self.content_hash(html)
+        old = self.get(key)
+        changed = old is None or old["content_hash"] != digest
+        if changed:
+            self.archive.append(key, url, html, digest)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO http_cache (key, url, etag, last_modified, content_hash, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, url, etag, last_modified, digest, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+        return changed
+
+    def touch(self, key):
+        """收到 304 时刷新抓取时间"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE http_cache SET fetched_at = ? WHERE key = ?",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), key),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ImageStore:
+    """
+    按内容寻址的图片库
+    图片以内容哈希命名，不同 URL 下载到相同字节只保存一份；URL -> 图片 的映射保存在 SQLite 中并常驻内存，
+    已知 URL 的查询不访问文件系统。每篇文章登记自己引用的图片，没有文章引用的图片可以回收
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS image_blobs (
+        digest TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        size INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL DEFAULT ''
+    );
+    CREATE TABLE IF NOT EXISTS image_urls (
+        url TEXT PRIMARY KEY,
+        digest TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_image_urls_digest ON image_urls(digest);
+    CREATE TABLE IF NOT EXISTS image_refs (
+        article_url TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        PRIMARY KEY (article_url, digest)
+    );
+    CREATE INDEX IF NOT EXISTS idx_image_refs_digest ON image_refs(digest);
+    """
+
+    # 文件头魔数 -> 扩展名；识别不出时退回 URL 中的 wx_fmt
+    SIGNATURES = (
+        (b"\x89PNG", "png"),
+        (b"\xff\xd8\xff", "jpeg"),
+        (b"GIF8", "gif"),
+        (b"BM", "bmp"),
+    )
+
+    def __init__(self, images_dir, db_path, sharded=False):
+        """
+        :param sharded: 新图片按哈希前两位分子目录保存（images/ab/ab12....png）
+        """
+        self.images_dir = images_dir
+        self.sharded = sharded
+        os.makedirs(images_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        # digest -> 文件名；url -> (digest, 文件名)
+        self._names = dict(self._conn.execute("SELECT digest, name FROM image_blobs"))
+        self._urls = {
+            url: (digest, self._names[digest])
+            for url, digest in self._conn.execute("SELECT url, digest FROM image_urls")
+            if digest in self._names
+        }
+
+    @classmethod
+    def sniff_ext(cls, head, url=""):
+        """根据文件头判断图片格式"""
+        for magic, ext in cls.SIGNATURES:
+            if head.startswith(magic):
+                return ext
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return "webp"
+        fmt = re.search(r'wx_fmt=(\w+)', url)
+        return fmt.group(1) if fmt else "png"
+
+    def lookup(self, url):
+        """
+        已下载过的 URL 返回图片文件名，否则返回 None
+        先查内存；内存中没有时再查一次数据库（可能是共用输出目录的其他工作进程刚下载的）
+        """
+        entry = self._urls.get(url)
+        if entry is None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT b.digest, b.name FROM image_urls u JOIN image_blobs b ON b.digest = u.digest WHERE u.url = ?",
+                    (url,),
+                ).fetchone()
+            if row is None or not os.path.exists(self.path(row[1])):
+                return None
+            entry = self._urls[url] = (row[0], row[1])
+            self._names.setdefault(row[0], row[1])
+        return entry[1]
+
+    def path(self, name):
+        return os.path.join(self.images_dir, name)
+
+    def _blob_name(self, digest, ext):
+        name = f"{digest[:24]}.{ext}"
+        return f"{digest[:2]}/{name}" if self.sharded else name
+
+    def add(self, url, chunks):
+        """
+        边接收边计算哈希写入临时文件，完成后入库
+        :param chunks: 图片数据块的可迭代对象
+        :return: 图片文件名
+        """
+        return self.commit(url, *self.stage(chunks))
+
+    def stage(self, chunks):
+        """
+        边接收边计算哈希写入图片库目录下的临时文件，暂不入库（之后交给 commit，或由调用方删除）
+        :return: (临时文件路径, 内容哈希, 文件头)
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.images_dir, prefix=".", suffix=".part")
+        digest = hashlib.sha256()
+        head = b""
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        if len(head) < 16:
+                            head += chunk[:16]
+                        digest.update(chunk)
+                        f.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest(), head
+
+    def commit(self, url, tmp_path, digest, head=b""):
+        """
+        将已写完的临时文件入库：内容已存在时丢弃临时文件，否则重命名为以哈希命名的文件
+        :return: 图片文件名
+        """
+        with self._lock:
+            name = self._names.get(digest)
+            if name is not None:
+                os.remove(tmp_path)
+            else:
+                name = self._blob_name(digest, self.sniff_ext(head, url))
+                size = os.path.getsize(tmp_path)
+                if self.sharded:
+                    os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+                os.replace(tmp_path, self.path(name))
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO image_blobs (digest, name, size, created_at) VALUES (?, ?, ?, ?)",
+                        (digest, name, size, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+                    )
+                self._names[digest] = name
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO image_urls (url, digest) VALUES (?, ?)", (url, digest))
+            self._urls[url] = (digest, name)
+        return name
+
+    def set_refs(self, article_url, img_urls):
+        """登记文章引用的图片（覆盖该文章原有的引用），未下载成功的 URL 忽略"""
+        digests = {self._urls[u][0] for u in img_urls if u in self._urls}
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM image_refs WHERE article_url = ?", (article_url,))
+            self._conn.executemany(
+                "INSERT INTO image_refs (article_url, digest) VALUES (?, ?)",
+                [(article_url, d) for d in digests],
+            )
+
+    def release(self, article_url):
+        """撤销文章对图片的全部引用"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM image_refs WHERE article_url = ?", (article_url,))
+
+    def refcount(self, name):
+        """引用某张图片的文章数"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM image_refs r JOIN image_blobs b ON b.digest = r.digest WHERE b.name = ?",
+                (name,),
+            ).fetchone()[0]
+
+    def gc(self):
+        """
+        删除没有任何文章引用的图片
+        应在没有抓取任务进行时调用：刚下载、尚未登记引用的图片也会被视为无引用
+        :return: (删除的图片数, 释放的字节数)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT digest, name, size FROM image_blobs "
+                "WHERE digest NOT IN (SELECT digest FROM image_refs)"
+            ).fetchall()
+            if not rows:
+                return 0, 0
+            digests = [(r[0],) for r in rows]
+            with self._conn:
+                self._conn.executemany("DELETE FROM image_urls WHERE digest = ?", digests)
+                self._conn.executemany("DELETE FROM image_blobs WHERE digest = ?", digests)
+            dead = {r[0] for r in rows}
+            for digest in dead:
+                self._names.pop(digest, None)
+            self._urls = {u: e for u, e in self._urls.items() if e[0] not in dead}
+        
+        freed = 0
+        for _, name, size in rows:
+            try:
+                os.remove(self.path(name))
+                freed += size
+            except FileNotFoundError:
+                pass
+        return len(rows), freed
+
+    def reshard(self, sharded):
+        """
+        切换是否分目录保存，并移动已有图片
+        :return: {旧文件名: 新文件名}
+        """
+        with self._lock:
+            self.sharded = sharded
+            renamed = {}
+            for digest, name in self._names.items():
+                new_name = self._blob_name(digest, name.rsplit(".", 1)[-1])
+                if new_name == name:
+                    continue
+                new_path = self.path(new_name)
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                if os.path.exists(self.path(name)):
+                    os.replace(self.path(name), new_path)
+                renamed[name] = new_name
+            if renamed:
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE image_blobs SET name = ? WHERE name = ?",
+                        [(new, old) for old, new in renamed.items()],
+                    )
+                self._names = {d: renamed.get(n, n) for d, n in self._names.items()}
+                self._urls = {u: (d, renamed.get(n, n)) for u, (d, n) in self._urls.items()}
+        
+        # 清理移空的分片目录
+        if not sharded:
+            for entry in os.scandir(self.images_dir):
+                if entry.is_dir():
+                    try:
+                        os.rmdir(entry.path)
+                    except OSError:
+                        pass
+        return renamed
+
+    def stats(self):
+        """返回 {"images", "urls", "bytes"}"""
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM image_blobs").fetchone()
+            return {"images": count, "urls": len(self._urls), "bytes": total}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SessionPool:
+    """按 (代理, 主机) 维护长连接会话，文章页和图片请求共用连接池，避免每次重新握手"""
+
+    def __init__(self, pool_size=16):
+        """
+        :param pool_size: 每个会话连接池的最大连接数，应不小于并发线程数
+        """
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._requests = {}
+
+    @staticmethod
+    def _key(url, proxies):
+        proxy = proxies.get("https") or proxies.get("http") if proxies else ""
+        return (proxy or "", urlparse(url).netloc)
+
+    def _mount(self, session):
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    def _get_session(self, key):
+        import requests
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                self._mount(session)
+                self._sessions[key] = session
+                self._requests[key] = 0
+            self._requests[key] += 1
+            return session
+
+    def ensure_size(self, pool_size):
+        """
+        把连接池扩大到至少 pool_size 个连接
+        已创建的会话换上新的适配器（原适配器上进行中的请求不受影响，其连接用完后随之释放）
+        """
+        with self._lock:
+            if pool_size <= self.pool_size:
+                return
+            self.pool_size = pool_size
+            for session in self._sessions.values():
+                self._mount(session)
+
+    def get(self, url, proxies=None, **kwargs):
+        """通过复用的会话发送 GET 请求，参数同 requests.get"""
+        session = self._get_session(self._key(url, proxies))
+        return session.get(url, proxies=proxies, **kwargs)
+
+    def stats(self):
+        """
+        连接池统计
+        :return: 列表，每项包含 proxy、host、requests（请求数）、connections（新建连接数）
+        """
+        with self._lock:
+            items = list(self._sessions.items())
+            counts = dict(self._requests)
+        result = []
+        for (proxy, host), session in items:
+            adapter = session.get_adapter("https://")
+            managers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+            connections = 0
+            for manager in managers:
+                for pool_key in list(manager.pools.keys()):
+                    pool = manager.pools.get(pool_key)
+                    if pool is not None:
+                        connections += pool.num_connections
+            result.append({
+                "proxy": proxy or "直连",
+                "host": host,
+                "requests": counts.get((proxy, host), 0),
+                "connections": connections,
+            })
+        return result
+
+    def close(self):
+        """关闭所有会话"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._requests.clear()
+
+
+# 中日韩文字按字二元切分，其余按单词切分
+CJK_RUN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+')
+WORD_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+|[0-9A-Za-z_]+')
+
+
+def tokenize_text(text):
+    """
+    全文检索分词：中文等 CJK 文字切成相邻二字组（单字时保留单字），英文数字按单词并转小写
+    :return: 词元列表
+    """
+    tokens = []
+    for run in WORD_RE.findall(text or ""):
+        if CJK_RUN_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+# 计算指纹前去掉的 Markdown 图片（文件名由图片 URL 决定，转载时往往不同），以及空白、标点和 Markdown 标记
+MARKDOWN_IMAGE_RE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+# 正文少于 SIMHASH_MIN_CHARS 字的短文不计算指纹（特征太少，指纹不稳定）；
+# 超长文章只取前 SIMHASH_MAX_CHARS 字，转载改动通常在开头结尾，取前一部分足以判断
+SIMHASH_MIN_CHARS = 100
+SIMHASH_MAX_CHARS = 20000
+SIMHASH_SHINGLE = 4
+
+
+def simhash(text):
+    """
+    正文的 64 位 SimHash 指纹，用于发现转载时稍作改动的近似重复文章
+    特征为相邻 4 个字，按出现次数加权；各字节位置的取值分布一次性统计，避免对每个特征逐位循环
+    :return: 无符号 64 位整数，短文返回 None
+    """
+    text = NON_WORD_RE.sub("", MARKDOWN_IMAGE_RE.sub("", text or "").lower())[:SIMHASH_MAX_CHARS]
+    if len(text) < SIMHASH_MIN_CHARS:
+        return None
+    
+    k = SIMHASH_SHINGLE
+    weights = Counter(text[i:i + k] for i in range(len(text) - k + 1))
+    # 每个特征的 8 字节哈希按权重重复后拼接，第 i 个字节位于 blob[i::8]
+    blob = b"".join(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest() * w for f, w in weights.items())
+    total = sum(weights.values())
+    
+    fingerprint = 0
+    for i in range(8):
+        counts = Counter(blob[i::8])
+        for bit in range(8):
+            if 2 * sum(c for b, c in counts.items() if b >> bit & 1) > total:
+                fingerprint |= 1 << (i * 8 + bit)
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+class ArticleIndex:
+    """
+    基于 SQLite 的文章索引（WAL 模式）
+    URL 唯一，公众号、标签、收藏时间均建有索引，单篇更新不再重写整个索引文件
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS articles (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL UNIQUE,
+        filename TEXT NOT NULL DEFAULT '',
+        title TEXT NOT NULL DEFAULT '',
+        account TEXT NOT NULL DEFAULT '',
+        author TEXT NOT NULL DEFAULT '',
+        publish_time TEXT NOT NULL DEFAULT '',
+        tags TEXT NOT NULL DEFAULT '',
+        image_count INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL DEFAULT ''
+    );
+    CREATE INDEX IF NOT EXISTS idx_articles_account ON articles(account);
+    CREATE INDEX IF NOT EXISTS idx_articles_created_at ON articles(created_at);
+    CREATE TABLE IF NOT EXISTS article_tags (
+        article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+        tag TEXT NOT NULL COLLATE NOCASE,
+        PRIMARY KEY (article_id, tag)
+    );
+    CREATE INDEX IF NOT EXISTS idx_article_tags_tag ON article_tags(tag);
+    CREATE TABLE IF NOT EXISTS tag_counts (
+        tag TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS article_fts USING fts5(title, body);
+    CREATE TABLE IF NOT EXISTS article_keys (
+        key TEXT PRIMARY KEY,
+        article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_article_keys_article ON article_keys(article_id);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS article_simhash (
+        article_id INTEGER PRIMARY KEY REFERENCES articles(id) ON DELETE CASCADE,
+        simhash INTEGER NOT NULL,
+        band0 INTEGER NOT NULL,
+        band1 INTEGER NOT NULL,
+        band2 INTEGER NOT NULL,
+        band3 INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_simhash_band0 ON article_simhash(band0);
+    CREATE INDEX IF NOT EXISTS idx_simhash_band1 ON article_simhash(band1);
+    CREATE INDEX IF NOT EXISTS idx_simhash_band2 ON article_simhash(band2);
+    CREATE INDEX IF NOT EXISTS idx_simhash_band3 ON article_simhash(band3);
+    CREATE TABLE IF NOT EXISTS article_duplicates (
+        url TEXT PRIMARY KEY,
+        canonical_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+        distance INTEGER NOT NULL,
+        title TEXT NOT NULL DEFAULT '',
+        account TEXT NOT NULL DEFAULT '',
+        created_at TEXT NOT NULL DEFAULT ''
+    );
+    CREATE INDEX IF NOT EXISTS idx_article_duplicates_canonical ON article_duplicates(canonical_id);
+    """
+
+    # SimHash 指纹分成 4 段各 16 位分别建索引：汉明距离不超过 3 的两个指纹至少有一段完全相同，
+    # 查找时只需取出任一段相同的候选再精确比较
+    SIMHASH_BANDS = 4
+    SIMHASH_DISTANCE = 3
+
+    FIELDS = ("url", "filename", "title", "account", "author", "publish_time",
+              "tags", "image_count", "created_at")
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(self.SCHEMA)
+        self._keys = None
+        self._backfill_keys()
+
+    def _backfill_keys(self):
+        """旧索引中的文章补充去重键"""
+        rows = self._conn.execute(
+            "SELECT a.id, a.url FROM articles a LEFT JOIN article_keys k ON k.article_id = a.id WHERE k.key IS NULL"
+        ).fetchall()
+        if rows:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO article_keys (key, article_id) VALUES (?, ?)",
+                    [(url_key(r["url"]), r["id"]) for r in rows],
+                )
+
+    def has_key(self, key):
+        """
+        判断去重键是否已收录
+        首次调用时把全部键载入内存集合；集合中没有的键再查一次数据库，
+        以便看到共用 index.db 的其他工作进程在此之后收录的文章
+        """
+        with self._lock:
+            if self._keys is None:
+                self._keys = {r[0] for r in self._conn.execute("SELECT key FROM article_keys")}
+            if key in self._keys:
+                return True
+            if self._conn.execute("SELECT 1 FROM article_keys WHERE key = ?", (key,)).fetchone():
+                self._keys.add(key)
+                return True
+            return False
+
+    def get_by_key(self, key):
+        """按去重键查询文章，不存在返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT a.* FROM article_keys k JOIN articles a ON a.id = k.article_id WHERE k.key = ?",
+                (key,),
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def _add_keys(self, article_id, urls):
+        """为文章登记去重键（调用方负责事务）"""
+        keys = {url_key(u) for u in urls if u}
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO article_keys (key, article_id) VALUES (?, ?)",
+            [(k, article_id) for k in keys],
+        )
+        if self._keys is not None:
+            self._keys.update(keys)
+
+    @staticmethod
+    def split_tags(tags):
+        """将逗号分隔的标签字符串拆成列表"""
+        return [t.strip() for t in (tags or "").split(',') if t.strip()]
+
+    def _upsert(self, info):
+        """写入一条记录（调用方负责事务），返回文章 id"""
+        values = [info.get(k, "") for k in self.FIELDS]
+        values[self.FIELDS.index("image_count")] = int(info.get("image_count") or 0)
+        self._conn.execute(
+            f"INSERT INTO articles ({', '.join(self.FIELDS)}) VALUES ({', '.join('?' * len(self.FIELDS))}) "
+            f"ON CONFLICT(url) DO UPDATE SET "
+            + ", ".join(f"{k}=excluded.{k}" for k in self.FIELDS if k != "url"),
+            values,
+        )
+        article_id = self._conn.execute("SELECT id FROM articles WHERE url = ?", (info["url"],)).fetchone()[0]
+        tags = self.split_tags(info.get("tags"))
+        self._conn.execute("DELETE FROM article_tags WHERE article_id = ?", (article_id,))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO article_tags (article_id, tag) VALUES (?, ?)",
+            [(article_id, t) for t in tags],
+        )
+        return article_id
+
+    def _count_tags(self, tags):
+        """标签统计与原 INDEX.json 一致：每次收藏累加一次"""
+        self._conn.executemany(
+            "INSERT INTO tag_counts (tag, count) VALUES (?, 1) "
+            "ON CONFLICT(tag) DO UPDATE SET count = count + 1",
+            [(t,) for t in self.split_tags(tags)],
+        )
+
+    def _index_fulltext(self, article_id, title, content):
+        """写入全文索引（调用方负责事务），文本预先切分成以空格分隔的词元"""
+        self._conn.execute("DELETE FROM article_fts WHERE rowid = ?", (article_id,))
+        self._conn.execute(
+            "INSERT INTO article_fts (rowid, title, body) VALUES (?, ?, ?)",
+            (article_id, " ".join(tokenize_text(title)), " ".join(tokenize_text(content))),
+        )
+
+    def _index_simhash(self, article_id, fingerprint):
+        """写入正文指纹（调用方负责事务），指纹为 None 时删除"""
+        if fingerprint is None:
+            self._conn.execute("DELETE FROM article_simhash WHERE article_id = ?", (article_id,))
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO article_simhash (article_id, simhash, band0, band1, band2, band3) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (article_id, self._signed64(fingerprint), *self._bands(fingerprint)),
+        )
+
+    @staticmethod
+    def _signed64(value):
+        """SQLite 的 INTEGER 是有符号 64 位"""
+        return value - (1 << 64) if value >= 1 << 63 else value
+
+    @classmethod
+    def _bands(cls, fingerprint):
+        width = 64 // cls.SIMHASH_BANDS
+        return [(fingerprint >> (i * width)) & ((1 << width) - 1) for i in range(cls.SIMHASH_BANDS)]
+
+    def upsert(self, info, content=None, aliases=(), fingerprint=None):
+        """
+        新增或更新一篇文章
+        :param info: 文章信息字典，字段同 INDEX.json 中的条目
+        :param content: 正文（Markdown），传入时同步更新全文索引和正文指纹
+        :param aliases: 指向同一篇文章的其他链接，一并登记去重键
+        :param fingerprint: 预先算好的正文指纹，不传则由 content 计算
+        """
+        with self._lock, self._conn:
+            article_id = self._upsert(info)
+            self._add_keys(article_id, [info["url"], *aliases])
+            self._count_tags(info.get("tags"))
+            if content is not None:
+                self._index_fulltext(article_id, info.get("title", ""), content)
+                self._index_simhash(article_id, simhash(content) if fingerprint is None else fingerprint)
+
+    def update_many(self, entries):
+        """
+        在同一个事务中批量更新已收录文章（用于重新渲染，不累加标签统计）
+        :param entries: 可迭代的 (info, content)，可以是生成器，边产生边写入
+        :return: 更新的文章数
+        """
+        count = 0
+        with self._lock, self._conn:
+            for info, content in entries:
+                article_id = self._upsert(info)
+                self._index_fulltext(article_id, info.get("title", ""), content)
+                self._index_simhash(article_id, simhash(content))
+                count += 1
+        return count
+
+    def get_meta(self, key, default=None):
+        """读取输出目录级别的设置（如输出布局）"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    def rename_many(self, renames):
+        """
+        在同一个事务中批量修改文章的文件名
+        :param renames: 可迭代的 (url, 新文件名)
+        """
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE articles SET filename = ? WHERE url = ?",
+                                   [(name, url) for url, name in renames])
+
+    def delete(self, url):
+        """删除一篇文章及其标签、去重键和全文索引（标签统计保持不变）"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM articles WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return False
+            if self._keys is not None:
+                self._keys.difference_update(
+                    r[0] for r in self._conn.execute("SELECT key FROM article_keys WHERE article_id = ?", (row[0],))
+                )
+            self._conn.execute("DELETE FROM article_fts WHERE rowid = ?", (row[0],))
+            self._conn.execute("DELETE FROM articles WHERE id = ?", (row[0],))
+        return True
+
+    def index_fulltext(self, url, title, content):
+        """为已收录的文章补建全文索引和正文指纹"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM articles WHERE url = ?", (url,)).fetchone()
+            if row:
+                self._index_fulltext(row[0], title, content)
+                self._index_simhash(row[0], simhash(content))
+            return row is not None
+
+    def unfingerprinted(self):
+        """没有正文指纹的文章 URL（旧版本收录的文章，以及不计算指纹的短文）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT a.url FROM articles a LEFT JOIN article_simhash s ON s.article_id = a.id "
+                "WHERE s.article_id IS NULL"
+            ).fetchall()
+        return {r[0] for r in rows}
+    
+    def find_similar(self, fingerprint, exclude_key=None, max_distance=None):
+        """
+        查找正文指纹最接近的已收录文章
+        :param exclude_key: 不与该去重键对应的文章比较（重新爬取同一篇文章时）
+        :param max_distance: 汉明距离上限，默认 SIMHASH_DISTANCE（不能超过分段数 - 1）
+        :return: (文章信息, 汉明距离)，没有足够接近的文章时返回 None
+        """
+        if fingerprint is None:
+            return None
+        max_distance = self.SIMHASH_DISTANCE if max_distance is None else min(max_distance, self.SIMHASH_BANDS - 1)
+        sql = " UNION ".join(f"SELECT article_id, simhash FROM article_simhash WHERE band{i} = ?"
+                             for i in range(self.SIMHASH_BANDS))
+        with self._lock:
+            candidates = self._conn.execute(sql, self._bands(fingerprint)).fetchall()
+            excluded = None
+            if exclude_key and candidates:
+                row = self._conn.execute("SELECT article_id FROM article_keys WHERE key = ?", (exclude_key,)).fetchone()
+                excluded = row[0] if row else None
+            
+            best = None
+            for article_id, value in candidates:
+                distance = hamming_distance(fingerprint, value)
+                if article_id != excluded and distance <= max_distance and (best is None or distance < best[1]):
+                    best = (article_id, distance)
+            if best is None:
+                return None
+            row = self._conn.execute("SELECT * FROM articles WHERE id = ?", (best[0],)).fetchone()
+        return self._row_to_dict(row), best[1]
+
+    def link_duplicate(self, canonical_url, info, distance):
+        """
+        把近似重复的文章登记到已收录的文章下：记录来源信息，并登记去重键，之后再遇到该链接直接跳过
+        :param info: 重复文章的信息（url、title、account）
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM articles WHERE url = ?", (canonical_url,)).fetchone()
+            if row is None:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO article_duplicates (url, canonical_id, distance, title, account, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (info["url"], row[0], distance, info.get("title", ""), info.get("account", ""),
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            self._add_keys(row[0], [info["url"]])
+        return True
+
+    def duplicates_of(self, url):
+        """已登记到该文章下的近似重复文章"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.url, d.distance, d.title, d.account, d.created_at FROM article_duplicates d "
+                "JOIN articles a ON a.id = d.canonical_id WHERE a.url = ? ORDER BY d.created_at",
+                (url,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def search_text(self, query, account=None, tag=None, limit=20):
+        """
+        全文检索，按 BM25 相关度排序（标题权重高于正文）
+        :param query: 查询文本，所有词元都需命中（单个汉字按子串匹配，不参与相关度排序）
+        :param account: 只返回该公众号的文章
+        :param tag: 只返回带有该标签的文章
+        :return: 文章信息列表，附带 score 字段（越小越相关）
+        """
+        tokens = list(dict.fromkeys(tokenize_text(query)))
+        if not tokens:
+            return []
+        # 单个汉字构不成二字组，索引中没有这样的词元，改为在索引文本中做子串匹配（需要扫描全表，较慢）
+        chars = [t for t in tokens if len(t) == 1 and CJK_RUN_RE.match(t)]
+        terms = [t for t in tokens if t not in chars]
+        
+        score = "bm25(article_fts, 10.0, 1.0)" if terms else "0.0"
+        sql = f"SELECT a.*, {score} AS score FROM article_fts JOIN articles a ON a.id = article_fts.rowid "
+        params = []
+        if tag:
+            sql += "JOIN article_tags t ON t.article_id = a.id AND t.tag = ? "
+            params.append(tag)
+        conditions = []
+        if terms:
+            conditions.append("article_fts MATCH ?")
+            params.append(" ".join('"' + t.replace('"', '""') + '"' for t in terms))
+        for char in chars:
+            conditions.append("(article_fts.title LIKE ? OR article_fts.body LIKE ?)")
+            params += [f"%{char}%"] * 2
+        sql += "WHERE " + " AND ".join(conditions) + " "
+        if account:
+            sql += "AND a.account = ? "
+            params.append(account)
+        sql += "ORDER BY score LIMIT ?"
+        params.append(limit)
+        
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(r) for r in rows]
+
+    def get(self, url):
+        """按 URL 查询文章，不存在返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM articles WHERE url = ?", (url,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def count(self):
+        """文章总数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def all(self):
+        """按收录顺序返回全部文章"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM articles ORDER BY id").fetchall()
+        return [self._row_to_dict(r) for r in rows]
+
+    def tag_counts(self):
+        """返回 {标签: 收藏次数}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT tag, count FROM tag_counts").fetchall()
+        return {r["tag"]: r["count"] for r in rows}
+
+    def search_tag(self, tag):
+        """
+        按标签搜索
+        先按标签精确匹配（走索引，忽略大小写），没有结果时退回到原来的子串匹配
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT a.* FROM articles a JOIN article_tags t ON t.article_id = a.id "
+                "WHERE t.tag = ? ORDER BY a.id",
+                (tag,),
+            ).fetchall()
+            if not rows:
+                pattern = "%" + tag.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                rows = self._conn.execute(
+                    "SELECT * FROM articles WHERE tags LIKE ? ESCAPE '\\' ORDER BY id",
+                    (pattern,),
+                ).fetchall()
+        return [self._row_to_dict(r) for r in rows]
+
+    def migrate_json(self, json_path):
+        """
+        一次性导入旧版 INDEX.json
+        :return: 导入的文章数
+        """
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        articles = data.get("articles", [])
+        with self._lock, self._conn:
+            for info in articles:
+                if info.get("url"):
+                    self._add_keys(self._upsert(info), [info["url"]])
+            self._conn.executemany(
+                "INSERT INTO tag_counts (tag, count) VALUES (?, ?) "
+                "ON CONFLICT(tag) DO UPDATE SET count = count + excluded.count",
+                list(data.get("tags", {}).items()),
+            )
+        return len(articles)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row_to_dict(row):
+        info = dict(row)
+        info.pop("id", None)
+        return info
+
+
+class ProxyPool:
+    """
+    带健康评分的代理池
+    按成功率与延迟的指数加权平均 (EWMA) 加权选择代理；
+    连续失败的代理被熔断，冷却期后放行一次探测请求，探测成功才恢复
+    """
+
+    # 判定为代理问题的状态码（被封、需要认证、限流、上游错误）
+    FAILURE_STATUS = {403, 407, 429}
+
+    def __init__(self, alpha=0.3, failure_threshold=3, cooldown=60.0, max_cooldown=600.0):
+        """
+        :param alpha: EWMA 平滑系数，越大越看重最近的结果
+        :param failure_threshold: 连续失败多少次后熔断
+        :param cooldown: 首次熔断的冷却时间（秒），再次熔断时翻倍
+        :param max_cooldown: 冷却时间上限（秒）
+        """
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @staticmethod
+    def _new_entry():
+        return {
+            "success": 1.0,       # 成功率 EWMA，新代理先按健康处理
+            "latency": 1.0,       # 延迟 EWMA（秒）
+            "requests": 0,
+            "failures": 0,
+            "consecutive": 0,     # 连续失败次数
+            "state": "ok",        # ok / ejected / probing
+            "cooldown": 0.0,      # 当前冷却时长
+            "until": 0.0,         # 冷却结束时间（monotonic）
+        }
+
+    def set_proxies(self, addrs):
+        """替换代理列表，保留仍在列表中的代理的历史统计"""
+        with self._lock:
+            self._stats = {a: self._stats.get(a) or self._new_entry() for a in addrs}
+
+    def __len__(self):
+        return len(self._stats)
+
+    def select(self):
+        """
+        选择一个代理地址
+        :return: ip:port，代理池为空时返回 None
+        """
+        with self._lock:
+            if not self._stats:
+                return None
+            now = time.monotonic()
+            candidates = []
+            for addr, st in self._stats.items():
+                # 冷却结束的代理（包括探测结果迟迟未回报的）可以再次被选中
+                if st["state"] == "ok" or now >= st["until"]:
+                    candidates.append(addr)
+            
+            if not candidates:
+                # 全部熔断：选冷却最快结束的那个，总比无代理可用强
+                addr = min(self._stats, key=lambda a: self._stats[a]["until"])
+            else:
+                weights = [self._weight(self._stats[a]) for a in candidates]
+                addr = random.choices(candidates, weights=weights)[0]
+            
+            st = self._stats[addr]
+            if st["state"] != "ok":
+                # 半开状态：放行这一次探测，冷却期内不再放行其他请求
+                st["state"] = "probing"
+                st["until"] = now + st["cooldown"]
+            return addr
+
+    @staticmethod
+    def _weight(st):
+        """成功率越高、延迟越低，权重越大"""
+        return max(st["success"], 0.01) / max(st["latency"], 0.05)
+
+    def report_success(self, addr, latency):
+        """记录一次成功请求及其耗时"""
+        with self._lock:
+            st = self._stats.get(addr)
+            if st is None:
+                return
+            st["requests"] += 1
+            st["success"] += self.alpha * (1.0 - st["success"])
+            st["latency"] += self.alpha * (latency - st["latency"])
+            st["consecutive"] = 0
+            if st["state"] != "ok":
+                print(f"代理已恢复: {addr}")
+            st["state"] = "ok"
+            st["cooldown"] = 0.0
+
+    def report_failure(self, addr):
+        """记录一次失败请求，必要时熔断该代理"""
+        with self._lock:
+            st = self._stats.get(addr)
+            if st is None:
+                return
+            st["requests"] += 1
+            st["failures"] += 1
+            st["consecutive"] += 1
+            st["success"] += self.alpha * (0.0 - st["success"])
+            if st["state"] == "probing" or st["consecutive"] >= self.failure_threshold:
+                st["cooldown"] = min(self.max_cooldown, st["cooldown"] * 2 or self.cooldown)
+                st["until"] = time.monotonic() + st["cooldown"]
+                st["state"] = "ejected"
+                print(f"代理连续失败，暂停使用 {st['cooldown']:.0f} 秒: {addr}")
+
+    def stats(self):
+        """
+        各代理的健康统计
+        :return: 列表，按健康度从高到低排序
+        """
+        now = time.monotonic()
+        with self._lock:
+            result = [{
+                "proxy": addr,
+                "state": st["state"],
+                "success_rate": round(st["success"], 3),
+                "latency": round(st["latency"], 3),
+                "requests": st["requests"],
+                "failures": st["failures"],
+                "cooldown_left": round(max(0.0, st["until"] - now), 1) if st["state"] != "ok" else 0.0,
+            } for addr, st in self._stats.items()]
+        result.sort(key=lambda x: (x["state"] != "ok", -x["success_rate"], x["latency"]))
+        return result
+
+
+class UserAgentPool:
+    """
+    随机 User-Agent 列表
+    首次使用时才加载：优先读取本地缓存；缓存缺失或过期时才构造 fake_useragent 的 UserAgent()
+    （较慢，且可能联网）生成一批写入缓存；fake_useragent 不可用时使用内置列表
+    """
+
+    BUILTIN = (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36 Edg/119.0.0.0",
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15",
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    )
+    # 缓存有效期（秒）与每次生成的数量
+    MAX_AGE = 30 * 86400
+    SAMPLE_SIZE = 200
+
+    def __init__(self, cache_path=None):
+        if cache_path is None:
+            cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+            cache_path = os.path.join(cache_dir, "wechat_article_spider", "user_agents.json")
+        self.cache_path = cache_path
+        self._agents = None
+        self._lock = threading.Lock()
+
+    @property
+    def random(self):
+        if self._agents is None:
+            with self._lock:
+                if self._agents is None:
+                    self._agents = self._load()
+        return random.choice(self._agents)
+
+    def _load(self):
+        try:
+            if time.time() - os.path.getmtime(self.cache_path) < self.MAX_AGE:
+                with open(self.cache_path, 'r', encoding='utf-8') as f:
+                    agents = [a for a in json.load(f) if isinstance(a, str) and a]
+                if agents:
+                    return agents
+        except (OSError, ValueError):
+            pass
+        
+        agents = self._generate()
+        if not agents:
+            return list(self.BUILTIN)
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            WechatArticleSpider._write_atomic(self.cache_path, [json.dumps(agents, ensure_ascii=False).encode('utf-8')])
+        except OSError:
+            pass
+        return agents
+
+    def _generate(self):
+        """用 fake_useragent 生成一批不重复的 UA，不可用时返回空列表"""
+        if not HAS_FAKE_UA:
+            return []
+        try:
+            from fake_useragent import UserAgent
+            ua = UserAgent()
+            return list(dict.fromkeys(ua.random for _ in range(self.SAMPLE_SIZE)))
+        except Exception:
+            return []
+
+
+class Metrics:
+    """
+    运行指标：各阶段耗时（直方图 + 分位数）与计数器，线程安全
+    可导出为 JSON 或 Prometheus 文本格式
+    """
+
+    # 耗时直方图的桶上界（秒）
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    # 每个阶段保留的样本数上限（蓄水池抽样），用于计算分位数
+    SAMPLE_SIZE = 4096
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._counters = {}
+            self._stages = {}
+
+    def inc(self, name, value=1, **labels):
+        """计数器累加，labels 作为维度（如 kind="timeout"）"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, stage, seconds):
+        """记录某阶段的一次耗时"""
+        with self._lock:
+            st = self._stages.get(stage)
+            if st is None:
+                st = self._stages[stage] = {"count": 0, "sum": 0.0, "max": 0.0,
+                                            "buckets": [0] * len(self.BUCKETS), "samples": []}
+            st["count"] += 1
+            st["sum"] += seconds
+            st["max"] = max(st["max"], seconds)
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    st["buckets"][i] += 1
+                    break
+            if len(st["samples"]) < self.SAMPLE_SIZE:
+                st["samples"].append(seconds)
+            else:
+                j = random.randrange(st["count"])
+                if j < self.SAMPLE_SIZE:
+                    st["samples"][j] = seconds
+
+    @contextmanager
+    def timer(self, stage):
+        """计时上下文：with metrics.timer("parse"): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    @staticmethod
+    def _quantile(samples, q):
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @staticmethod
+    def _series(name, labels):
+        if not labels:
+            return name
+        return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+    def snapshot(self):
+        """
+        当前指标的快照
+        :return: {"uptime", "counters": {序列名: 值}, "stages": {阶段: {count, sum, mean, max, p50, p90, p99}}}
+        """
+        with self._lock:
+            counters = {self._series(name, labels): value
+                        for (name, labels), value in sorted(self._counters.items())}
+            stages = {}
+            for stage, st in self._stages.items():
+                stages[stage] = {
+                    "count": st["count"],
+                    "sum": round(st["sum"], 6),
+                    "mean": round(st["sum"] / st["count"], 6),
+                    "max": round(st["max"], 6),
+                    "p50": round(self._quantile(st["samples"], 0.50), 6),
+                    "p90": round(self._quantile(st["samples"], 0.90), 6),
+                    "p99": round(self._quantile(st["samples"], 0.99), 6),
+                }
+            return {"uptime": round(time.time() - self.started, 3), "counters": counters, "stages": stages}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, prefix="wechat_spider"):
+        """Prometheus 文本格式（计数器 + 各阶段耗时直方图）"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            stages = {k: dict(v, buckets=list(v["buckets"])) for k, v in self._stages.items()}
+        
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{prefix}_{name}_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{self._series(metric, labels)} {value}")
+        
+        metric = f"{prefix}_stage_seconds"
+        lines.append(f"# HELP {metric} 各阶段耗时")
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, st in sorted(stages.items()):
+            cumulative = 0
+            for bound, n in zip(self.BUCKETS, st["buckets"]):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {st["count"]}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {st["sum"]:.6f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {st["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """按扩展名导出：.prom / .txt 为 Prometheus 文本格式，其余为 JSON"""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def report(self):
+        """打印各阶段耗时与计数器"""
+        snap = self.snapshot()
+        print(f"\n运行指标（{snap['uptime']:.1f} 秒）")
+        print(f"{'阶段':<14}{'次数':>8}{'总耗时':>10}{'平均':>10}{'p50':>10}{'p99':>10}{'最大':>10}")
+        for stage, st in sorted(snap["stages"].items(), key=lambda kv: -kv[1]["sum"]):
+            print(f"{stage:<16}{st['count']:>8}{st['sum']:>10.2f}{st['mean']:>10.3f}"
+                  f"{st['p50']:>10.3f}{st['p99']:>10.3f}{st['max']:>10.3f}")
+        for name, value in snap["counters"].items():
+            print(f"  {name}: {value}")
+
+
+class RunProfiler:
+    """
+    多线程 cProfile：cProfile 只统计启用它的线程，因此每个工作线程各自采样，结束后合并为一份报告
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = []
+
+    def wrap(self, fn):
+        """返回在当前线程内带采样执行 fn 的包装函数"""
+        import cProfile
+        
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._profiles.append(profile)
+        return run
+
+    def dump(self, prefix, top=50):
+        """
+        写出 <prefix>.prof（pstats 格式，可用 snakeviz / flameprof 等工具生成火焰图）
+        和 <prefix>.txt（按累计耗时排序的前 top 项）
+        """
+        import pstats
+        
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        pstats.Stats(*profiles).dump_stats(prefix + ".prof")
+        with open(prefix + ".txt", 'w', encoding='utf-8') as f:
+            stats = pstats.Stats(*profiles, stream=f)
+            stats.sort_stats("cumulative").print_stats(top)
+            stats.sort_stats("tottime").print_stats(top)
+        return prefix + ".prof"
+
+
+class ImageStreamScanner:
+    """
+    边下载边扫描页面：正文按块喂给 lxml 的增量解析器，正文容器内一出现图片就回调，
+    图片下载因此可以和页面剩余部分的传输重叠进行
+    """
+
+    def __init__(self, on_image):
+        from lxml import etree
+        self._parser = etree.HTMLPullParser(events=("start", "end"))
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._on_image = on_image
+        self._parts = []
+        # 当前位于正文容器内的嵌套层数，0 表示不在正文中
+        self._depth = 0
+
+    def feed(self, chunk):
+        text = self._decoder.decode(chunk)
+        if not text:
+            return
+        self._parts.append(text)
+        self._parser.feed(text)
+        for event, elem in self._parser.read_events():
+            if event == "end":
+                if self._depth:
+                    self._depth -= 1
+                continue
+            if self._depth:
+                self._depth += 1
+                if elem.tag == "img":
+                    img_url = elem.get("data-src") or elem.get("src")
+                    if img_url and 'mmbiz.qpic.cn' in img_url:
+                        self._on_image(img_url)
+            elif elem.tag == "div" and (elem.get("id") == "js_content"
+                                        or "rich_media_content" in (elem.get("class") or "").split()):
+                self._depth = 1
+
+    def close(self):
+        """结束扫描，返回完整的页面文本"""
+        from lxml import etree
+        self._parts.append(self._decoder.decode(b"", final=True))
+        try:
+            self._parser.close()
+        except etree.LxmlError:
+            pass
+        return "".join(self._parts)
+
 
 class WechatArticleSpider:
     def __init__(self, output_dir="articles"):
@@ -31,14 +2113,8 @@ class WechatArticleSpider:
         # UA 轮换相关（必须最先设置）
         self.use_random_ua = True
         
-        # 初始化 UserAgent 生成器
-        if HAS_FAKE_UA:
-            try:
-                self.ua = UserAgent()
-            except:
-                self.ua = None
-        else:
-            self.ua = None
+        # 随机 UA 列表（首次使用时从本地缓存加载）
+        self.ua = UserAgentPool()
         
         # 默认请求头
         self.default_ua = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
@@ -54,10 +2130,57 @@ class WechatArticleSpider:
         self.proxies_list = []
         self.use_proxy = False
         self.current_proxy = None
+        self.proxy_pool = ProxyPool()
         
-        # 延迟相关
-        self.base_delay = 1.0
-        self.use_random_delay = True
+        # 长连接会话池（按代理和主机复用）
+        self.sessions = SessionPool()
+        
+        # 单篇文章内同时下载的图片数
+        self.image_workers = 8
+        
+        # 运行指标（各阶段耗时与计数器），以及可选的多线程性能采样
+        self.metrics = Metrics()
+        self.profiler = None
+        
+        # 流式解析：页面边下载边扫描，正文中的图片一出现就提交下载（需要 lxml）
+        self.stream_images = False
+        self._prefetch_pool = None
+        self._prefetch_size = 0
+        self._prefetching = {}
+        # 同时在处理页面的线程数（批量模式下为工作线程数），预取线程池按此扩容
+        self._active_workers = 1
+        self._prefetch_lock = threading.Lock()
+        
+        # 近似重复文章的处理方式，见 DUPLICATE_MODES
+        self.near_duplicates = "link"
+        
+        # 批量爬取的取消信号与进度回调：设置 cancel_event 后工作线程不再认领新任务（未处理的留在队列中），
+        # on_progress(report) 在每个 URL 开始、等待重试和结束时于工作线程中调用
+        self.cancel_event = threading.Event()
+        self.on_progress = None
+        
+        # 批量模式下的解析进程池
+        self._parse_pool = None
+        
+        # HTML 解析后端："lxml"（单遍转换，速度快）或 "bs4"（BeautifulSoup + html.parser）
+        self.parser_backend = "lxml" if HAS_LXML else "bs4"
+        
+        # 重试策略
+        self.retry_policy = RetryPolicy()
+        
+        # 持久化抓取队列的认领者标识与租约时长
+        # 持有租约期间后台心跳线程每 lease_seconds / 3 秒续租一次，进程退出后租约很快过期，任务由其他进程接手
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = 60
+        self._heartbeat_thread = None
+        self._heartbeat_lock = threading.Lock()
+        
+        # 限速相关：按主机（使用代理时按主机+代理）自适应调整请求速率
+        self.use_rate_limit = True
+        self.rate_limiter = AdaptiveRateLimiter()
+        
+        # 并发写入保护（批量爬取时多个线程共用）
+        self._file_lock = threading.Lock()
         
         # 设置输出目录
         self.set_output_dir(output_dir)
@@ -96,6 +2219,8 @@ class WechatArticleSpider:
         """设置并创建输出目录"""
         self.output_dir = output_dir
         self.index_file = os.path.join(output_dir, "INDEX.json")
+        self.index_db = os.path.join(output_dir, "index.db")
+        self.frontier_db = os.path.join(output_dir, "frontier.db")
         
         # 确保输出目录存在
         if not os.path.exists(self.output_dir):
@@ -106,85 +2231,312 @@ class WechatArticleSpider:
         if not os.path.exists(img_dir):
             os.makedirs(img_dir)
         
+        # 打开索引库，旧版 INDEX.json 自动迁移一次
+        if getattr(self, "index", None) is not None:
+            self.index.close()
+        self.index = ArticleIndex(self.index_db)
+        if os.path.exists(self.index_file):
+            self.migrate_json_index()
+        
+        # 持久化抓取队列，中断后可续爬
+        if getattr(self, "frontier", None) is not None:
+            self.frontier.close()
+        self.frontier = CrawlQueue(self.frontier_db)
+        
+        # 输出布局随输出目录保存，切换布局请使用 migrate_layout
+        self.layout = self.index.get_meta("layout", "flat")
+        
+        # 按内容寻址的图片库，URL 映射与引用计数存放在 index.db 中
+        if getattr(self, "images", None) is not None:
+            self.images.close()
+        self.images = ImageStore(img_dir, self.index_db, sharded=self.layout != "flat")
+        
+        # 原始页面缓存，重新爬取时发送条件请求
+        if getattr(self, "html_cache", None) is not None:
+            self.html_cache.close()
+        self.html_cache = HtmlCache(os.path.join(output_dir, "cache"))
+        
         print(f"下载位置已设置为: {os.path.abspath(self.output_dir)}")
     
     def set_proxies(self, proxies_str):
         """设置代理列表，格式：ip:port, 每行一个或逗号分隔"""
         if not proxies_str:
             self.proxies_list = []
+            self.proxy_pool.set_proxies([])
             return
         
-        # 分割并清理
-        raw_list = proxies_str.replace('\n', ',').split(',')
-        self.proxies_list = [p.strip() for p in raw_list if p.strip()]
-        if self.proxies_list:
-            print(f"成功加载 {len(self.proxies_list)} 个代理")
+        # 分割并清理
+        raw_list = proxies_str.replace('\n', ',').split(',')
+        self.proxies_list = list(dict.fromkeys(p.strip() for p in raw_list if p.strip()))
+        self.proxy_pool.set_proxies(self.proxies_list)
+        if self.proxies_list:
+            print(f"成功加载 {len(self.proxies_list)} 个代理")
+    
+    def _get_random_proxy(self):
+        """从代理池按健康度加权选择一个代理"""
+        if len(self.proxy_pool) != len(self.proxies_list):
+            # proxies_list 被直接赋值时同步到代理池
+            self.proxy_pool.set_proxies(self.proxies_list)
+        proxy_addr = self.proxy_pool.select()
+        if not proxy_addr:
+            return None
+        return {
+            "http": f"http://{proxy_addr}",
+            "https": f"http://{proxy_addr}"
+        }
+    
+    def _report_proxy(self, proxies, ok, latency=0.0):
+        """向代理池反馈一次请求结果"""
+        if not proxies:
+            return
+        addr = proxies["http"][len("http://"):]
+        if ok:
+            self.proxy_pool.report_success(addr, latency)
+        else:
+            self.metrics.inc("proxy_failures")
+            self.proxy_pool.report_failure(addr)
+    
+    def proxy_stats(self):
+        """代理健康统计，见 ProxyPool.stats"""
+        return self.proxy_pool.stats()
+    
+    def show_proxy_stats(self):
+        """打印代理健康统计"""
+        stats = self.proxy_stats()
+        if not stats:
+            print("未设置代理")
+            return stats
+        
+        state_names = {"ok": "正常", "ejected": "熔断", "probing": "探测中"}
+        print(f"\n共有 {len(stats)} 个代理：")
+        print("=" * 80)
+        for item in stats:
+            line = (f"{item['proxy']:<22} {state_names[item['state']]:<4} "
+                    f"成功率 {item['success_rate'] * 100:5.1f}%  延迟 {item['latency']:.2f}s  "
+                    f"请求 {item['requests']}  失败 {item['failures']}")
+            if item["cooldown_left"]:
+                line += f"  剩余冷却 {item['cooldown_left']:.0f}s"
+            print(line)
+        return stats
+
+    @staticmethod
+    def _rate_key(url, proxies):
+        """限速 key：直连按主机，使用代理时按主机+代理（每个出口 IP 单独计速）"""
+        host = urlparse(url).netloc
+        if proxies:
+            return f"{host}|{proxies['http'][len('http://'):]}"
+        return host
+    
+    def _wait_rate_limit(self, key):
+        """按限速器的预约结果等待，另加少量随机抖动"""
+        if not self.use_rate_limit:
+            return
+        wait = self.rate_limiter.reserve(key) + random.uniform(0, 0.3)
+        if wait > 0.05:
+            print(f"等待 {wait:.2f} 秒...")
+        self.metrics.observe("rate_wait", wait)
+        time.sleep(wait)
+    
+    @staticmethod
+    def _is_block_page(html):
+        """没有正文容器且带有风控提示的页面视为被限流"""
+        if 'js_content' in html:
+            return False
+        return any(marker in html for marker in BLOCK_PAGE_MARKERS)
+    
+    def _fetch_once(self, url, headers):
+        """
+        发送一次请求（含限速等待、代理选择与结果反馈）
+        有缓存时带上 If-None-Match / If-Modified-Since，304 或内容哈希未变时返回缓存正文
+        :return: (html, None, unchanged) 或 (None, FetchFailure, False)
+        """
+        html, failure, unchanged = self._request_page(url, headers)
+        if failure is not None:
+            self.metrics.inc("fetch_failures", kind=failure.kind)
+        else:
+            self.metrics.inc("pages_unchanged" if unchanged else "pages_fetched")
+        return html, failure, unchanged
+    
+    def _pick_proxies(self):
+        """选择本次页面请求使用的代理，不使用代理时返回 None"""
+        proxies = None
+        if self.use_proxy and self.proxies_list:
+            proxies = self._get_random_proxy()
+            if proxies:
+                print(f"正在使用代理: {proxies['http']}")
+        elif self.use_proxy:
+            print("警告: 已启用代理但代理列表为空，使用直连")
+        return proxies
+    
+    def _conditional_headers(self, key, headers):
+        """
+        有缓存时带上 If-None-Match / If-Modified-Since
+        :return: (请求头, 缓存记录或 None)
+        """
+        cached = self.html_cache.get(key)
+        if cached:
+            headers = dict(headers)
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        return headers, cached
+    
+    def _page_result(self, url, key, cached, status, html, response_headers, proxies, rate_key, latency):
+        """
+        处理一次页面响应（同步与异步引擎共用）：反馈代理健康度与限速器，
+        200 写入页面缓存，304 从归档中取回缓存的正文
+        :return: (html, None, unchanged) 或 (None, FetchFailure, False)
+        """
+        if status == 304 and cached:
+            self._report_proxy(proxies, True, latency)
+            self.rate_limiter.on_success(rate_key)
+            body = self.html_cache.load_body(key)
+            if body is not None:
+                self.html_cache.touch(key)
+                return body, None, True
+            return None, FetchFailure(FetchFailure.CLIENT, "缓存正文丢失", status=304), False
+        
+        if status == 200:
+            self._report_proxy(proxies, True, latency)
+            if self._is_block_page(html):
+                self.rate_limiter.on_throttle(rate_key)
+                return None, FetchFailure(FetchFailure.BLOCKED, "环境异常/访问频繁"), False
+            self.rate_limiter.on_success(rate_key)
+            changed = self.html_cache.store(key, url, html, response_headers.get("ETag"),
+                                            response_headers.get("Last-Modified"))
+            return html, None, not changed
+        
+        failure = FetchFailure.from_response(status, response_headers, via_proxy=bool(proxies))
+        self._report_proxy(proxies, failure.kind not in (FetchFailure.PROXY, FetchFailure.THROTTLED, FetchFailure.SERVER),
+                           latency)
+        if failure.kind in (FetchFailure.THROTTLED, FetchFailure.SERVER):
+            self.rate_limiter.on_throttle(rate_key)
+        return None, failure, False
     
-    def _get_random_proxy(self):
-        """从代理池随机获取一个代理"""
-        if not self.proxies_list:
-            return None
-        proxy_addr = random.choice(self.proxies_list)
-        return {
-            "http": f"http://{proxy_addr}",
-            "https": f"http://{proxy_addr}"
-        }
-
-    def fetch_article(self, url):
-        """获取文章页面内容"""
-        # 随机延迟
-        if self.use_random_delay:
-            delay = self.base_delay + random.uniform(0.5, 2.0)
-            print(f"等待 {delay:.2f} 秒...")
-            time.sleep(delay)
+    def _request_page(self, url, headers):
+        """_fetch_once 的实现部分"""
+        import requests
+        proxies = self._pick_proxies()
+        key = url_key(url)
+        headers, cached = self._conditional_headers(key, headers)
+        rate_key = self._rate_key(url, proxies)
+        self._wait_rate_limit(rate_key)
+        
+        streaming = self.stream_images and HAS_LXML
+        started = time.monotonic()
+        try:
+            with self.metrics.timer("fetch"):
+                response = self.sessions.get(url, headers=headers, proxies=proxies, timeout=15, stream=streaming)
+                if streaming and response.status_code == 200:
+                    html = self._read_streaming(response)
+                else:
+                    response.encoding = 'utf-8'
+                    html = response.text
+                    self.metrics.inc("page_bytes", len(response.content))
+        except requests.exceptions.RequestException as e:
+            self._report_proxy(proxies, False)
+            return None, FetchFailure.from_exception(e, via_proxy=bool(proxies)), False
         
-        # 每次请求重新生成 headers（如果启用了随机 UA）
+        return self._page_result(url, key, cached, response.status_code, html, response.headers, proxies, rate_key,
+                                 time.monotonic() - started)
+    
+    def _read_streaming(self, response):
+        """分块读取页面，同时把正文中出现的图片交给预取线程池"""
+        scanner = ImageStreamScanner(self._prefetch_image)
+        try:
+            for chunk in response.iter_content(chunk_size=16 * 1024):
+                self.metrics.inc("page_bytes", len(chunk))
+                scanner.feed(chunk)
+        finally:
+            response.close()
+        return scanner.close()
+    
+    def _prefetch_image(self, img_url):
+        """
+        提交一张图片的预取，已下载或正在下载的跳过
+        预取只下载到临时文件，文章确定保存（download_images）时才入库；
+        页面最终不保存（解析失败、近似重复）时由 _discard_prefetched 取消或删除
+        """
+        with self._prefetch_lock:
+            if img_url in self._prefetching or self.images.lookup(img_url):
+                return
+            # 每个在处理页面的线程都可以有 image_workers 张图片同时预取，与非流式模式的并发度一致
+            size = self.image_workers * self._active_workers
+            if self._prefetch_pool is None or self._prefetch_size < size:
+                if self._prefetch_pool is not None:
+                    self._prefetch_pool.shutdown(wait=False)
+                self._prefetch_pool = ThreadPoolExecutor(max_workers=size)
+                self._prefetch_size = size
+            self._prefetching[img_url] = self._prefetch_pool.submit(self._fetch_image, img_url)
+    
+    def _discard_prefetched(self, img_urls=None):
+        """
+        丢弃预取的图片：未开始的取消，已下载或正在下载的临时文件在下载结束后删除
+        :param img_urls: 要丢弃的图片；None 表示全部（批量爬取结束后清理没有页面认领的预取）
+        """
+        with self._prefetch_lock:
+            urls = list(self._prefetching) if img_urls is None else img_urls
+            futures = [self._prefetching.pop(u) for u in dict.fromkeys(urls) if u in self._prefetching]
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(self._remove_staged)
+    
+    @staticmethod
+    def _remove_staged(future):
+        staged = future.result()
+        if staged and os.path.exists(staged[0]):
+            os.remove(staged[0])
+    
+    def _request_headers(self):
+        """每次请求重新生成 headers（如果启用了随机 UA）"""
+        headers = self.headers
         if self.use_random_ua:
-            self.headers = self._generate_headers()
-            print(f"使用 User-Agent: {self.headers['User-Agent'][:50]}...")
+            headers = self._generate_headers()
+            self.headers = headers
+            print(f"使用 User-Agent: {headers['User-Agent'][:50]}...")
+        return headers
+    
+    def fetch_article(self, url):
+        """获取文章页面内容，失败时按重试策略退避重试"""
+        return self._fetch_with_retry(url)[0]
+    
+    def _fetch_with_retry(self, url):
+        """
+        带重试的抓取
+        :return: (html, unchanged)，unchanged 表示与缓存内容相同；失败时 html 为 None
+        """
+        headers = self._request_headers()
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            html, failure, unchanged = self._fetch_once(url, headers)
+            if html is not None:
+                print("内容未变化（命中缓存）" if unchanged else "请求成功！")
+                return html, unchanged
             
-        max_retries = 3
-        for i in range(max_retries):
-            try:
-                proxies = None
-                if self.use_proxy and self.proxies_list:
-                    proxies = self._get_random_proxy()
-                    if proxies:
-                        print(f"正在使用代理: {proxies['http']}")
-                else:
-                    if self.use_proxy:
-                        print("警告: 已启用代理但代理列表为空，使用直连")
-                
-                response = requests.get(url, headers=self.headers, proxies=proxies, timeout=15)
-                response.encoding = 'utf-8'
-                
-                if response.status_code == 200:
-                    print("请求成功！")
-                    return response.text
-                else:
-                    print(f"请求失败，状态码: {response.status_code}")
-                    
-            except Exception as e:
-                error_msg = str(e)
-                print(f"请求失败 (尝试 {i+1}/{max_retries}): {error_msg}")
-                
-                # 如果是代理问题，尝试切换代理或建议
-                if self.use_proxy and ('ProxyError' in error_msg or 'ConnectionError' in error_msg or 'timeout' in error_msg.lower()):
-                    print("提示: 当前代理可能无效，正在尝试切换...")
-                
-                if i == max_retries - 1:
-                    print("\n爬取失败！所有重试均已失败。")
-                    if self.use_proxy:
-                        print("建议: 请检查代理IP是否有效，或尝试关闭代理后直连。")
-                    return None
-                    
-                # 失败后等待一会再重试
-                time.sleep(1)
-                
-        return None
+            print(f"请求失败 (第 {attempt} 次): {failure}")
+            delay = self.retry_policy.next_delay(attempt, failure, time.monotonic() - started)
+            if delay is None:
+                print("\n爬取失败！已放弃重试。")
+                if failure.kind == FetchFailure.PROXY:
+                    print("建议: 请检查代理IP是否有效，或尝试关闭代理后直连。")
+                return None, False
+            
+            if failure.kind == FetchFailure.PROXY:
+                print("提示: 当前代理可能无效，正在尝试切换...")
+            print(f"{delay:.1f} 秒后重试...")
+            self.metrics.inc("retries")
+            self.metrics.observe("retry_wait", delay)
+            time.sleep(delay)
     
     def parse_article(self, html, url):
         """解析文章内容"""
+        if self.parser_backend == "lxml" and HAS_LXML:
+            return self._parse_article_lxml(html, url)
+        
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html, 'html.parser')
         
         article = {
@@ -262,15 +2614,144 @@ class WechatArticleSpider:
                 if text:
                     markdown_lines.append(f"- {text}\n")
         
-        # 去重
+        return self._join_markdown_lines(markdown_lines), images
+    
+    @staticmethod
+    def _join_markdown_lines(markdown_lines):
+        """去掉空行和重复行后拼接成正文"""
         seen = set()
         cleaned_lines = []
         for line in markdown_lines:
-            if line.strip() and line not in seen:
+            if line and line.strip() and line not in seen:
                 seen.add(line)
                 cleaned_lines.append(line)
         
-        return "\n".join(cleaned_lines), images
+        return "\n".join(cleaned_lines)
+    
+    @staticmethod
+    def _lxml_find(doc, tag, class_=None, id_=None):
+        """等价于 soup.find(tag, class_=...) / soup.find(tag, id=...)"""
+        if class_:
+            path = f"//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_} ')]"
+        else:
+            path = f"//{tag}[@id='{id_}']"
+        found = doc.xpath(path)
+        return found[0] if found else None
+    
+    @staticmethod
+    def _lxml_text(elem):
+        """等价于 get_text(strip=True)"""
+        return "".join(t.strip() for t in elem.itertext())
+    
+    def _parse_article_lxml(self, html, url):
+        """使用 lxml 解析文章内容，输出与 parse_article 相同"""
+        import lxml.html
+        article = {
+            "url": url,
+            "title": "",
+            "author": "",
+            "account": "",
+            "publish_time": "",
+            "content": "",
+            "images": []
+        }
+        
+        if not html or not html.strip():
+            return article
+        try:
+            doc = lxml.html.fromstring(html)
+        except ValueError:
+            # 带 XML 编码声明的字符串需要按字节解析
+            doc = lxml.html.fromstring(html.encode('utf-8'))
+        
+        # 注意 lxml 元素没有子节点时布尔值为假，不能用 or 选择备选项
+        find = self._lxml_find
+        meta = (
+            ("title", (('h1', 'rich_media_title', None), ('h1', None, 'activity-name'))),
+            ("account", (('a', 'weui-wa-hotarea', None), ('strong', 'profile_nickname', None))),
+            ("author", (('span', 'rich_media_meta_text', None),)),
+            ("publish_time", (('em', None, 'publish_time'),)),
+        )
+        for key, candidates in meta:
+            for tag, class_, id_ in candidates:
+                elem = find(doc, tag, class_=class_, id_=id_)
+                if elem is not None:
+                    article[key] = self._lxml_text(elem)
+                    break
+        
+        content_elem = find(doc, 'div', class_='rich_media_content')
+        if content_elem is None:
+            content_elem = find(doc, 'div', id_='js_content')
+        if content_elem is not None:
+            article["content"], article["images"] = self._parse_content_lxml(content_elem)
+        
+        return article
+    
+    def _parse_content_lxml(self, content_elem):
+        """
+        单遍遍历 js_content 子树生成 Markdown，语义与 _parse_content 一致
+        文本片段只收集一次，每个元素记录自己在片段列表中的起止位置，
+        元素结束时再拼出自己的文本，不再对每个节点重复 find / get_text
+        """
+        images = []
+        markdown_lines = []
+        pieces = []
+        # 每帧: [标签名, 输出行位置, 文本起始位置, 是否包含 p/section/span 子孙]
+        frames = []
+        stack = [(child, False) for child in reversed(content_elem)]
+        
+        while stack:
+            elem, closing = stack.pop()
+            
+            if closing:
+                name, slot, start, has_block = frames.pop()
+                if frames and (has_block or name in TEXT_BLOCK_TAGS):
+                    frames[-1][3] = True
+                
+                if slot is not None and not (name in ('section', 'span') and has_block):
+                    text = "".join(pieces[start:])
+                    if text:
+                        if name in TEXT_BLOCK_TAGS:
+                            markdown_lines[slot] = text + "\n"
+                        elif name in HEADING_TAGS:
+                            markdown_lines[slot] = f"{'#' * HEADING_TAGS[name]} {text}\n"
+                        elif name == 'blockquote':
+                            markdown_lines[slot] = f"> {text}\n"
+                        elif name == 'li':
+                            markdown_lines[slot] = f"- {text}\n"
+                
+                if elem.tail:
+                    tail = elem.tail.strip()
+                    if tail:
+                        pieces.append(tail)
+                continue
+            
+            name = elem.tag
+            if not isinstance(name, str):
+                # 注释等节点不计入文本，但其后的尾随文本属于父元素
+                if elem.tail and elem.tail.strip():
+                    pieces.append(elem.tail.strip())
+                continue
+            
+            slot = None
+            if name == 'img':
+                img_url = elem.get('data-src') or elem.get('src')
+                if img_url and 'mmbiz.qpic.cn' in img_url:
+                    images.append(img_url)
+                    markdown_lines.append(f"![图片](images/{self._get_img_filename(img_url)})\n")
+            elif name in TEXT_BLOCK_TAGS or name in HEADING_TAGS or name in ('blockquote', 'li'):
+                slot = len(markdown_lines)
+                markdown_lines.append(None)
+            
+            frames.append([name, slot, len(pieces), False])
+            if elem.text:
+                text = elem.text.strip()
+                if text:
+                    pieces.append(text)
+            stack.append((elem, True))
+            stack.extend((child, False) for child in reversed(elem))
+        
+        return self._join_markdown_lines(markdown_lines), images
     
     def _get_img_filename(self, url):
         """根据图片URL生成文件名"""
@@ -282,56 +2763,313 @@ class WechatArticleSpider:
             ext = 'png'
         return f"{url_hash}.{ext}"
     
-    def download_image(self, img_url, save_dir):
-        """下载图片"""
+    def download_image(self, img_url, save_dir=None):
+        """
+        下载图片到图片库
+        :param save_dir: 保留该参数以兼容旧调用，图片统一保存在图片库目录（images/）
+        :return: 图片库中的文件名，失败返回 None
+        """
+        # 已下载过的 URL 直接从内存映射返回，不访问文件系统
+        name = self.images.lookup(img_url)
+        if name:
+            print(f"图片已存在: {name}")
+            self.metrics.inc("images_cached")
+            return name
+        staged = self._fetch_image(img_url)
+        return self._commit_image(img_url, staged) if staged else None
+    
+    def _fetch_image(self, img_url):
+        """
+        下载一张图片到图片库目录下的临时文件，尚不入库
+        :return: (临时文件路径, 内容哈希, 文件头)，失败返回 None
+        """
         try:
-            filename = self._get_img_filename(img_url)
-            filepath = os.path.join(save_dir, filename)
-            
-            if os.path.exists(filepath):
-                print(f"图片已存在: {filename}")
-                return True
-            
             # 图片下载也使用代理（如果启用）
             proxies = None
             if self.use_proxy and self.proxies_list:
                 proxies = self._get_random_proxy()
             
-            response = requests.get(img_url, headers=self.img_headers, proxies=proxies, timeout=30)
-            if response.status_code == 200:
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
-                print(f"下载成功: {filename}")
-                return True
-            else:
-                print(f"下载失败: {img_url}, 状态码: {response.status_code}")
-                return False
+            # 流式下载，边收边计算内容哈希写入临时文件，内容已存在则丢弃，避免重复保存同一张图
+            started = time.monotonic()
+            try:
+                response = self.sessions.get(img_url, headers=self.img_headers, proxies=proxies, timeout=30, stream=True)
+            except Exception:
+                self._report_proxy(proxies, False)
+                raise
+            self._report_proxy(proxies, response.status_code < 500 and response.status_code not in ProxyPool.FAILURE_STATUS,
+                               time.monotonic() - started)
+            try:
+                if response.status_code != 200:
+                    print(f"下载失败: {img_url}, 状态码: {response.status_code}")
+                    self.metrics.inc("image_failures")
+                    return None
+                return self.images.stage(self._count_bytes(response.iter_content(chunk_size=IMAGE_CHUNK_SIZE)))
+            finally:
+                response.close()
+                self.metrics.observe("image", time.monotonic() - started)
         except Exception as e:
             print(f"下载图片出错: {e}")
-            return False
+            self.metrics.inc("image_failures")
+            return None
     
-    def save_as_markdown(self, article, tags=""):
-        """将文章保存为 Markdown 文件"""
-        # 创建图片目录
-        img_dir = os.path.join(self.output_dir, "images")
+    def _commit_image(self, img_url, staged):
+        """下载好的临时文件入库（内容已存在时丢弃），返回图片库中的文件名"""
+        try:
+            name = self.images.commit(img_url, *staged)
+        except OSError as e:
+            print(f"图片入库出错: {e}")
+            self.metrics.inc("image_failures")
+            return None
+        print(f"下载成功: {name}")
+        self.metrics.inc("images_downloaded")
+        return name
+    
+    def _count_bytes(self, chunks, name="image_bytes"):
+        """透传数据块，同时累计字节数"""
+        for chunk in chunks:
+            self.metrics.inc(name, len(chunk))
+            yield chunk
+    
+    @staticmethod
+    def _write_atomic(filepath, chunks):
+        """将数据块写入同目录临时文件，写完后重命名为目标文件"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix=".", suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def download_images(self, img_urls, save_dir=None):
+        """
+        并发下载多张图片
+        :param img_urls: 图片URL列表
+        :param save_dir: 兼容旧调用，同 download_image
+        :return: {图片URL: 图片库文件名}，只包含成功下载（或已存在）的图片
+        """
+        img_urls = list(dict.fromkeys(img_urls))
         
-        # 下载图片
-        for img_url in article["images"]:
-            self.download_image(img_url, img_dir)
+        # 流式解析时已提交预取的图片，等待其下载完成后入库
+        with self._prefetch_lock:
+            prefetched = {u: self._prefetching.pop(u) for u in img_urls if u in self._prefetching}
+        img_urls = [u for u in img_urls if u not in prefetched]
+        
+        workers = min(self.image_workers, len(img_urls))
+        if workers <= 1:
+            results = [self.download_image(u) for u in img_urls]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.download_image, img_urls))
+        names = {u: name for u, name in zip(img_urls, results) if name}
+        for u, future in prefetched.items():
+            staged = future.result()
+            name = self._commit_image(u, staged) if staged else None
+            if name:
+                names[u] = name
+        return names
+    
+    def _link_images(self, content, names):
+        """
+        把解析时按 URL 生成的图片链接改写为图片库中的文件名
+        :param names: {图片URL: 图片库文件名}，未包含的图片保持原链接
+        """
+        if not names:
+            return content
+        return self._rewrite_image_links(content, {self._get_img_filename(u): name for u, name in names.items()})
+    
+    def _link_existing_images(self, content, img_urls):
+        """不下载图片：图片库中已有的图片指向图片库，其余指向原图地址"""
+        names = {u: self.images.lookup(u) for u in img_urls if self.images.lookup(u)}
+        remote = {self._get_img_filename(u): u for u in img_urls if u not in names}
+        content = IMAGE_LINK_RE.sub(lambda m: f"]({remote[m.group(1)]})" if m.group(1) in remote else m.group(0), content)
+        return self._link_images(content, names)
+    
+    @staticmethod
+    def _rewrite_image_links(content, renamed=None, depth=0):
+        """
+        改写正文中的图片链接
+        :param renamed: {旧图片文件名: 新图片文件名}
+        :param depth: Markdown 文件相对输出目录的层数，链接前加相应个数的 ../
+        """
+        prefix = "../" * depth + "images/"
+        renamed = renamed or {}
+        return IMAGE_LINK_RE.sub(lambda m: f"]({prefix}{renamed.get(m.group(1), m.group(1))})", content)
+    
+    def save_as_markdown(self, article, tags="", download_images=True):
+        """
+        将文章保存为 Markdown 文件
+        :param download_images: 为 False 时只使用图片库中已有的图片，其余图片链接指向原图地址
+        """
+        # 下载图片（并发），并把正文中的图片链接指向图片库
+        if download_images:
+            with self.metrics.timer("images"):
+                names = self.download_images(article["images"])
+            article["content"] = self._link_images(article["content"], names)
+        else:
+            article["content"] = self._link_existing_images(article["content"], article["images"])
         
+        with self.metrics.timer("write"):
+            return self._write_markdown(article, tags)
+    
+    def _write_markdown(self, article, tags=""):
+        """生成 Markdown 内容并写入文件（不下载图片）"""
         # 生成安全的文件名
         safe_title = re.sub(r'[\\/*?:"<>|]', '', article["title"])[:50]
         if not safe_title:
             safe_title = datetime.now().strftime("%Y%m%d_%H%M%S")
         
+        # 收藏时间只取一次，写入文件和索引（created_at）的是同一个值，重新渲染时才能得到相同的输出
+        saved_at = article.setdefault("saved_at", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        md_content = self._render_markdown(article, tags, saved_at)
+        
+        # 分层布局：文件名由文章 ID 决定，同一篇文章总是写到同一个位置，无需检查重名
+        if self.layout != "flat":
+            md_filename = self._sharded_filename(article["url"], article["account"], article["publish_time"])
+            md_path = os.path.join(self.output_dir, md_filename)
+            os.makedirs(os.path.dirname(md_path), exist_ok=True)
+            md_content = self._rewrite_image_links(md_content, depth=md_filename.count("/"))
+            self._write_atomic(md_path, [md_content.encode('utf-8')])
+            return md_path, md_filename
+        
+        # 已收录的文章重新爬取（刷新、--force）时覆盖原文件，不另起新文件名，否则旧文件会成为孤儿
+        md_filename = self._own_flat_filename(article["url"])
+        if md_filename:
+            md_path = os.path.join(self.output_dir, md_filename)
+            self._write_atomic(md_path, [md_content.encode('utf-8')])
+            return md_path, md_filename
+        
+        # 保存 Markdown 文件（加锁，避免并发时两个线程抢到同一个文件名；
+        # 以独占方式创建，共用输出目录的其他进程恰好抢先创建同名文件时重新选择文件名）
+        with self._file_lock:
+            while True:
+                md_filename = self._unique_flat_filename(safe_title)
+                md_path = os.path.join(self.output_dir, md_filename)
+                try:
+                    with open(md_path, 'x', encoding='utf-8') as f:
+                        f.write(md_content)
+                    break
+                except FileExistsError:
+                    continue
+        
+        return md_path, md_filename
+    
+    def _own_flat_filename(self, url):
+        """
+        该 URL 对应的文章已保存过时返回其平铺布局下的文件名，否则返回 None
+        只认文章自身的链接：登记为转载的链接对应的是另一篇文章的文件
+        """
+        existing = self._find_existing(url)
+        if (existing and existing["filename"] and "/" not in existing["filename"]
+                and url_key(existing["url"]) == url_key(url)):
+            return existing["filename"]
+        return None
+    
+    def _unique_flat_filename(self, safe_title):
+        """平铺布局下的文件名，如果文件名冲突，添加时间戳（调用方持有 _file_lock）"""
+        md_filename = f"{safe_title}.md"
+        if os.path.exists(os.path.join(self.output_dir, md_filename)):
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            md_filename = f"{safe_title}_{timestamp}.md"
+            n = 1
+            while os.path.exists(os.path.join(self.output_dir, md_filename)):
+                md_filename = f"{safe_title}_{timestamp}_{n}.md"
+                n += 1
+        return md_filename
+    
+    @staticmethod
+    def article_id(url):
+        """由规范化去重键得到的稳定文章 ID"""
+        return hashlib.sha1(url_key(url).encode('utf-8')).hexdigest()[:16]
+    
+    def _sharded_filename(self, url, account, publish_time):
+        """分层布局下 Markdown 文件相对输出目录的路径（以 / 分隔）"""
+        aid = self.article_id(url)
+        if self.layout == "hash":
+            return f"{aid[:2]}/{aid[2:4]}/{aid}.md"
+        
+        safe_account = re.sub(r'[\\/*?:"<>|]', '', account).strip(" .")[:50] or "未知公众号"
+        m = re.match(r'(\d{4})\D+(\d{1,2})', publish_time or "")
+        month = f"{m.group(1)}-{int(m.group(2)):02d}" if m else "未知时间"
+        return f"{safe_account}/{month}/{aid}.md"
+    
+    def migrate_layout(self, layout):
+        """
+        切换输出布局，并把已有的 Markdown 文件和图片移动到新布局下（同时修正图片相对链接）
+        先写出全部新文件，再在一个事务中更新索引，最后删除旧文件；中途中断时旧文件和索引保持不变
+        :param layout: flat / hash / account
+        :return: 移动的文章数
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"未知的输出布局: {layout}，可选: {', '.join(LAYOUTS)}")
+        
+        renamed = self.images.reshard(layout != "flat")
+        self.layout = layout
+        
+        moves = []
+        with self._file_lock:
+            for info in self.index.all():
+                old_path = os.path.join(self.output_dir, info["filename"])
+                if not info["filename"] or not os.path.exists(old_path):
+                    continue
+                
+                if layout == "flat":
+                    safe_title = re.sub(r'[\\/*?:"<>|]', '', info["title"])[:50] or self.article_id(info["url"])
+                    new_filename = info["filename"] if "/" not in info["filename"] else self._unique_flat_filename(safe_title)
+                else:
+                    new_filename = self._sharded_filename(info["url"], info["account"], info["publish_time"])
+                
+                with open(old_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                new_content = self._rewrite_image_links(content, renamed, depth=new_filename.count("/"))
+                if new_filename == info["filename"] and new_content == content:
+                    continue
+                
+                new_path = os.path.join(self.output_dir, new_filename)
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                self._write_atomic(new_path, [new_content.encode('utf-8')])
+                moves.append((info["url"], info["filename"], new_filename))
+        
+        self.index.rename_many((url, new) for url, _, new in moves)
+        self.index.set_meta("layout", layout)
+        
+        for _, old, new in moves:
+            if old == new:
+                continue
+            old_path = os.path.join(self.output_dir, old)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+            # 清理移空的分层目录
+            if "/" in old:
+                try:
+                    os.removedirs(os.path.dirname(old_path))
+                except OSError:
+                    pass
+        
+        print(f"输出布局已切换为 {layout}，移动文章 {len(moves)} 篇，移动图片 {len(renamed)} 张")
+        return len(moves)
+    
+    @staticmethod
+    def _render_markdown(article, tags="", saved_at=None):
+        """
+        生成 Markdown 文本
+        :param saved_at: 收藏时间，默认为当前时间；重新渲染时传入原收藏时间，保证输出可比较
+        """
         # 格式化标签
         tag_line = ""
         if tags:
             tag_list = [f"#{tag.strip()}" for tag in tags.split(',') if tag.strip()]
             tag_line = " ".join(tag_list)
         
+        if saved_at is None:
+            saved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
         # 生成 Markdown 内容
-        md_content = f"""# {article["title"]}
+        return f"""# {article["title"]}
 
 {tag_line}
 
@@ -346,34 +3084,11 @@ class WechatArticleSpider:
 
 ---
 
-收藏时间: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+收藏时间: {saved_at}
 """
-        
-        # 保存 Markdown 文件
-        md_filename = f"{safe_title}.md"
-        md_path = os.path.join(self.output_dir, md_filename)
-        
-        # 如果文件名冲突，添加时间戳
-        if os.path.exists(md_path):
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            md_filename = f"{safe_title}_{timestamp}.md"
-            md_path = os.path.join(self.output_dir, md_filename)
-        
-        with open(md_path, 'w', encoding='utf-8') as f:
-            f.write(md_content)
-        
-        return md_path, md_filename
     
-    def update_index(self, article, filename, tags=""):
-        """更新索引文件"""
-        # 读取现有索引
-        if os.path.exists(self.index_file):
-            with open(self.index_file, 'r', encoding='utf-8') as f:
-                index = json.load(f)
-        else:
-            index = {"articles": [], "tags": {}}
-        
-        # 添加文章信息
+    def update_index(self, article, filename, tags="", fingerprint=None):
+        """更新索引"""
         article_info = {
             "filename": filename,
             "title": article["title"],
@@ -383,77 +3098,549 @@ class WechatArticleSpider:
             "url": article["url"],
             "tags": tags,
             "image_count": len(article["images"]),
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "created_at": article.get("saved_at") or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
+        with self.metrics.timer("index"):
+            self.index.upsert(article_info, content=article.get("content", ""), aliases=article.get("aliases", ()),
+                              fingerprint=fingerprint)
+            self.images.set_refs(article["url"], article["images"])
         
-        # 检查是否已存在（根据URL）
-        existing = False
-        for i, item in enumerate(index["articles"]):
-            if item["url"] == article["url"]:
-                index["articles"][i] = article_info
-                existing = True
-                break
+        print(f"索引更新成功")
+    
+    def rebuild_fulltext(self):
+        """根据已保存的 Markdown 文件补建全文索引（适用于迁移来的旧文章）"""
+        count = 0
+        for info in self.index.all():
+            md_path = os.path.join(self.output_dir, info["filename"])
+            if not info["filename"] or not os.path.exists(md_path):
+                continue
+            with open(md_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            if self.index.index_fulltext(info["url"], info["title"], content):
+                count += 1
+        print(f"全文索引重建完成，共 {count} 篇")
+        return count
+    
+    def delete_article(self, url, collect_images=True):
+        """
+        删除一篇已收录的文章：Markdown 文件、索引记录和图片引用
+        :param collect_images: 同时回收不再被任何文章引用的图片
+        """
+        info = self._find_existing(url)
+        if not info:
+            print(f"未找到文章: {url}")
+            return False
+        md_path = os.path.join(self.output_dir, info["filename"])
+        if info["filename"] and os.path.exists(md_path):
+            os.remove(md_path)
+        self.index.delete(info["url"])
+        self.images.release(info["url"])
+        print(f"已删除: {info['title']}")
+        if collect_images:
+            self.gc_images()
+        return True
+    
+    def gc_images(self):
+        """回收没有文章引用的图片"""
+        count, freed = self.images.gc()
+        print(f"回收图片 {count} 张，释放 {freed / 1024 / 1024:.1f} MB")
+        return count, freed
+    
+    def migrate_json_index(self):
+        """
+        将旧版 INDEX.json 导入 SQLite 索引，导入后重命名为 INDEX.json.migrated
+        INDEX.json 中没有正文，导入的文章随后根据已保存的 Markdown 文件建立全文索引
+        """
+        count = self.index.migrate_json(self.index_file)
+        os.replace(self.index_file, self.index_file + ".migrated")
+        print(f"已从 INDEX.json 迁移 {count} 篇文章到 {os.path.basename(self.index_db)}")
+        if count:
+            self.rebuild_fulltext()
+        return count
+    
+    def crawl(self, url, tags="", force=False):
+        """
+        爬取文章
+        :param url: 文章URL
+        :param tags: 标签（多个用逗号分隔，如：技术,Python,爬虫）
+        :param force: 文章已收录时仍重新爬取
+        :return: 保存路径
+        """
+        existing = None if force else self._find_existing(url)
+        if existing:
+            print(f"文章已收录，跳过: {existing['title']}")
+            return os.path.join(self.output_dir, existing["filename"])
         
-        if not existing:
-            index["articles"].append(article_info)
+        print(f"开始爬取: {url}")
+        self._start_heartbeat()
+        task = self.frontier.claim_url(url, tags, self.worker_id, self.lease_seconds)
         
-        # 更新标签统计
-        if tags:
-            for tag in tags.split(','):
-                tag = tag.strip()
-                if tag:
-                    index["tags"][tag] = index["tags"].get(tag, 0) + 1
+        try:
+            # 获取页面内容
+            with self.metrics.timer("article"):
+                html, unchanged = self._fetch_with_retry(url)
+                md_path = self._process_html(url, html, tags, unchanged) if html else None
+        except Exception as e:
+            self.frontier.fail(task["id"], str(e), owner=self.worker_id)
+            raise
+        finally:
+            # 没有被文章认领的预取图片（如页面未变化、出错）不入库
+            self._discard_prefetched()
+        
+        if md_path:
+            self.frontier.complete(task["id"], md_path, owner=self.worker_id)
+        else:
+            self.frontier.fail(task["id"], "获取或解析失败", owner=self.worker_id)
+        return md_path
+    
+    def _start_heartbeat(self):
+        """启动续租心跳线程（每个进程一个，随进程退出）"""
+        with self._heartbeat_lock:
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+                self._heartbeat_thread.start()
+    
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(max(1.0, self.lease_seconds / 3))
+            try:
+                self.frontier.renew(self.worker_id, self.lease_seconds)
+            except sqlite3.Error as e:
+                print(f"续租失败: {e}")
+    
+    def _find_existing(self, url):
+        """按规范化去重键查找已收录的文章，不发起任何网络请求"""
+        key = url_key(url)
+        if self.index.has_key(key):
+            return self.index.get_by_key(key)
+        return None
+    
+    @staticmethod
+    def _extract_alias_urls(html):
+        """页面中声明的规范链接（短链接爬取后可借此登记长链接的去重键）"""
+        aliases = []
+        for m in ALIAS_URL_RE.finditer(html):
+            link = m.group(1) or m.group(2)
+            if link:
+                aliases.append(link.replace("\\x26", "&"))
+        return aliases
+    
+    def _process_html(self, url, html, tags, unchanged=False):
+        """
+        解析、保存并索引已抓取的页面，返回保存路径
+        页面与上次抓取的内容相同且文章已保存时，跳过解析、图片下载和写入
+        """
+        if unchanged:
+            path = self._unchanged_path(url)
+            if path:
+                return path
+        
+        # 解析文章
+        article = self._parse(html, url)
+        if not article["title"]:
+            print("解析失败：未找到文章标题")
+            self.metrics.inc("parse_failures")
+            self._discard_prefetched(article["images"])
+            return None
+        article["aliases"] = self._extract_alias_urls(html)
+        
+        print(f"标题: {article['title']}")
+        print(f"公众号: {article['account']}")
+        print(f"标签: {tags if tags else '无'}")
+        print(f"图片数量: {len(article['images'])}")
+        
+        # 近似重复检测：在图片入库之前进行（流式解析时已开始预取的图片随之丢弃）
+        fingerprint, duplicate = self._check_near_duplicate(url, article)
+        if duplicate:
+            self._discard_prefetched(article["images"])
+        if duplicate and self.near_duplicates == "link":
+            return os.path.join(self.output_dir, duplicate["filename"])
+        
+        # 保存为 Markdown（近似重复且设为 skip-images 时不下载图片）
+        md_path, filename = self.save_as_markdown(article, tags, download_images=duplicate is None)
+        print(f"Markdown 保存成功: {md_path}")
         
-        # 保存索引
-        with open(self.index_file, 'w', encoding='utf-8') as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
+        # 更新索引
+        self.update_index(article, filename, tags, fingerprint=fingerprint)
+        self.metrics.inc("articles_saved")
+        
+        return md_path
+    
+    def _unchanged_path(self, url):
+        """页面内容未变化且文章文件仍在时返回其路径，否则返回 None（需要重新解析保存）"""
+        existing = self._find_existing(url)
+        if existing and os.path.exists(os.path.join(self.output_dir, existing["filename"])):
+            print(f"内容未变化，跳过解析与保存: {existing['title']}")
+            self.metrics.inc("articles_unchanged")
+            return os.path.join(self.output_dir, existing["filename"])
+        return None
+    
+    def _check_near_duplicate(self, url, article):
+        """
+        计算正文指纹并查找近似重复的已收录文章；link 模式下直接把本文登记到该文章下
+        :return: (指纹, 近似重复的已收录文章或 None)
+        """
+        if self.near_duplicates == "off":
+            return None, None
+        with self.metrics.timer("dedupe"):
+            fingerprint = simhash(article["content"])
+            found = self.index.find_similar(fingerprint, exclude_key=url_key(url))
+        if not found:
+            return fingerprint, None
+        
+        canonical, distance = found
+        print(f"与已收录文章近似重复（指纹相差 {distance} 位）: {canonical['title']}（{canonical['account']}）")
+        self.metrics.inc("near_duplicates")
+        if self.near_duplicates == "link":
+            self.index.link_duplicate(canonical["url"], article, distance)
+            print("不重复保存，已登记为该文章的转载")
+        return fingerprint, canonical
+    
+    def _parse(self, html, url):
+        """
+        解析页面：批量模式下交给解析进程池，否则在当前线程解析
+        工作线程提交后等待解析结果再继续，因此同时进行的解析数不超过工作线程数
+        """
+        pool = self._parse_pool
+        if pool is None:
+            with self.metrics.timer("parse"):
+                return self.parse_article(html, url)
+        
+        with self.metrics.timer("parse"):
+            return pool.submit(_parse_in_process, type(self), self.parser_backend, html, url).result()
+    
+    def crawl_many(self, urls, tags="", workers=4, parse_workers=0, force=False, takeover=True):
+        """
+        并发批量爬取文章
+        URL 先写入持久化队列再由工作线程认领，进程中断后再次调用（或调用 resume_crawl）会从中断处继续
+        :param urls: 文章URL列表
+        :param tags: 标签，字符串对所有文章生效；也可传入与 urls 等长的列表
+        :param workers: 工作线程数（负责抓取、保存、索引）
+        :param parse_workers: 解析进程数，大于 0 时在进程池中解析（不超过 workers）
+        :param force: 已爬取过的 URL 也重新爬取（此前失败的 URL 再次提交时总会重新爬取）
+        :param takeover: 启动时把队列中进行中的任务全部放回待处理（接管上次中断留下的任务）；
+                         有其他工作进程共用队列时须为 False，它们的任务只在租约过期后才会被认领
+        :return: 状态报告列表，先按 urls 顺序，其后是本次顺带完成的上次遗留任务
+        """
+        if parse_workers > 0:
+            # 每个工作线程同时只等待一个页面的解析，多出的进程只会闲置
+            parse_workers = min(parse_workers, workers)
+            self._parse_pool = ProcessPoolExecutor(max_workers=parse_workers)
+            print(f"启用多进程解析，进程数: {parse_workers}")
+            try:
+                return self._crawl_many(urls, tags, workers, force, takeover)
+            finally:
+                self._parse_pool.shutdown()
+                self._parse_pool = None
+        return self._crawl_many(urls, tags, workers, force, takeover)
+    
+    def refresh(self, workers=4, **kwargs):
+        """
+        重新爬取全部已收录文章
+        借助页面缓存发送条件请求，未变化的文章只花一次 304 或哈希比较，不重新解析和保存
+        """
+        articles = self.index.all()
+        print(f"开始刷新 {len(articles)} 篇文章")
+        return self.crawl_many([a["url"] for a in articles], [a["tags"] for a in articles],
+                               workers=workers, force=True, **kwargs)
+    
+    def resume_crawl(self, workers=4, **kwargs):
+        """继续处理持久化队列中未完成的任务"""
+        return self.crawl_many([], workers=workers, **kwargs)
+    
+    def run_worker(self, workers=4, follow=False, poll_interval=5.0, **kwargs):
+        """
+        工作进程模式：与其他进程（同一主机或共用输出目录的其他主机）一起处理同一个抓取队列
+        不接管其他进程进行中的任务，进程之间只通过队列的租约协调；设置 cancel_event 后处理完手头的任务即退出
+        :param follow: 队列处理完后继续等待新任务（由 enqueue 或其他进程加入），直到 cancel_event 被设置
+        :param poll_interval: follow 模式下队列为空时的检查间隔（秒）
+        :return: 本进程处理的状态报告列表
+        """
+        print(f"工作进程 {self.worker_id} 启动，并发数: {workers}")
+        reports = []
+        while not self.cancel_event.is_set():
+            reports.extend(self.crawl_many([], workers=workers, takeover=False, **kwargs))
+            if not follow:
+                break
+            # 队列暂时为空，或剩下的任务都在其他进程手里（其租约过期后才能认领）
+            while not self.cancel_event.is_set() and self.frontier.next_ready_in() is None:
+                self.cancel_event.wait(poll_interval)
+        print(f"工作进程 {self.worker_id} 退出，共处理 {len(reports)} 个任务")
+        return reports
+    
+    def rerender(self, workers=None, chunksize=16):
+        """
+        离线重新渲染全部已归档的文章（例如升级了 Markdown 转换之后）
+        从原始页面归档包多进程重新解析，不下载图片，收藏时间沿用索引中的 created_at，
+        只重写渲染结果确实变化的文件，索引更新在一个事务中批量提交；
+        没有正文指纹的文章（旧版本收录的）即使渲染结果未变也补建指纹和全文索引
+        :param workers: 解析进程数，默认为 CPU 核数；0 表示在当前进程解析
+        :param chunksize: 每次分发给解析进程的文章数
+        :return: 统计信息 {"total", "changed", "unchanged", "failed", "seconds", "rate"}
+        """
+        # 归档中的每个键对应一篇已收录的文章；同一篇文章有多个键时优先用文章自身链接的页面，
+        # 其次以最后一个为准（登记为近似重复的转载页面内容不同，只在没有原文页面时使用）
+        tasks = {}
+        own = set()
+        for key, url, offset, length in self.html_cache.archive.entries():
+            info = self.index.get_by_key(key)
+            if not info or not info["filename"] or info["url"] in own:
+                continue
+            tasks[info["url"]] = (info, (offset, length, url))
+            if key == url_key(info["url"]):
+                own.add(info["url"])
+        tasks = list(tasks.values())
+        
+        stats = {"total": len(tasks), "changed": 0, "unchanged": 0, "failed": 0}
+        print(f"开始重新渲染 {len(tasks)} 篇文章")
+        started = time.monotonic()
+        
+        parse = partial(_parse_archived, type(self), self.parser_backend, self.html_cache.archive.pack_path)
+        jobs = [job for _, job in tasks]
+        unfingerprinted = self.index.unfingerprinted()
+        if workers == 0:
+            self.index.update_many(self._rerender_entries(tasks, map(parse, jobs), stats, unfingerprinted))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(parse, jobs, chunksize=chunksize)
+                self.index.update_many(self._rerender_entries(tasks, results, stats, unfingerprinted))
         
-        print(f"索引更新成功")
+        stats["seconds"] = time.monotonic() - started
+        stats["rate"] = stats["total"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        print(f"重新渲染完成：共 {stats['total']} 篇，变化 {stats['changed']} 篇，"
+              f"未变化 {stats['unchanged']} 篇，失败 {stats['failed']} 篇，"
+              f"用时 {stats['seconds']:.1f} 秒（{stats['rate']:.1f} 篇/秒）")
+        return stats
     
-    def crawl(self, url, tags=""):
+    def _rerender_entries(self, tasks, results, stats, unfingerprinted=()):
         """
-        爬取文章
-        :param url: 文章URL
-        :param tags: 标签（多个用逗号分隔，如：技术,Python,爬虫）
-        :return: 保存路径
+        比较并写入重新渲染的结果，逐篇产生需要更新索引的 (info, content)
+        与解析进程池并行推进：这里写文件的同时，进程池继续解析后面的文章
+        :param unfingerprinted: 没有正文指纹的文章 URL，渲染结果未变时也要更新索引
         """
-        print(f"开始爬取: {url}")
-        
-        # 获取页面内容
-        html = self.fetch_article(url)
-        if not html:
-            return None
-        
-        # 解析文章
-        article = self.parse_article(html, url)
-        if not article["title"]:
-            print("解析失败：未找到文章标题")
-            return None
+        for done, ((info, _), article) in enumerate(zip(tasks, results), 1):
+            if done % 1000 == 0:
+                print(f"已处理 {done}/{stats['total']}")
+            if not article or not article["title"]:
+                stats["failed"] += 1
+                continue
+            
+            # 不下载图片：图片库中没有的图片（如近似重复文章保存时跳过的）指向原图地址
+            article["content"] = self._link_existing_images(article["content"], article["images"])
+            md_path = os.path.join(self.output_dir, info["filename"])
+            md_content = self._render_markdown(article, info["tags"], info["created_at"] or None)
+            md_content = self._rewrite_image_links(md_content, depth=info["filename"].count("/"))
+            try:
+                with open(md_path, 'r', encoding='utf-8') as f:
+                    unchanged = f.read() == md_content
+            except OSError:
+                unchanged = False
+            if unchanged:
+                stats["unchanged"] += 1
+                if info["url"] in unfingerprinted:
+                    yield info, article["content"]
+                continue
+            
+            self._write_atomic(md_path, [md_content.encode('utf-8')])
+            stats["changed"] += 1
+            yield {
+                **info,
+                "title": article["title"],
+                "account": article["account"],
+                "author": article["author"],
+                "publish_time": article["publish_time"],
+                "image_count": len(article["images"]),
+            }, article["content"]
+    
+    def _crawl_many(self, urls, tags, workers, force, takeover=True):
+        """
+        批量爬取的调度：工作线程从持久化队列认领任务
+        请求失败时不在线程里睡眠等待，而是带着退避时间放回队列，线程去处理其他 URL
+        """
+        urls = list(urls)
+        # 连接池不小于同时进行的请求数：每个工作线程各自还会同时下载 image_workers 张图片（同一图片主机），
+        # 否则多出的连接用完即被丢弃，之后的请求又要重新握手
+        self.sessions.ensure_size(workers * max(1, self.image_workers))
+        added, recovered, counts = self._enqueue_batch(urls, tags, force, takeover)
+        pending = counts["pending"]
+        print(f"开始批量爬取：新增 {added} 个URL，接管中断任务 {recovered} 个，待处理 {pending} 个，并发数: {workers}")
         
-        print(f"标题: {article['title']}")
-        print(f"公众号: {article['account']}")
-        print(f"标签: {tags if tags else '无'}")
-        print(f"图片数量: {len(article['images'])}")
+        start = time.time()
+        reports = {}
+        worker = self.profiler.wrap(self._batch_worker) if self.profiler else self._batch_worker
+        threads = [threading.Thread(target=worker, args=(reports,), daemon=True)
+                   for _ in range(max(1, min(workers, pending + counts["inflight"])))]
+        self._active_workers = max(self._active_workers, len(threads))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 没有被文章认领的预取图片（如页面未变化、出错）不入库
+        self._discard_prefetched()
+        return self._batch_reports(urls, reports, start)
+    
+    def _enqueue_batch(self, urls, tags, force, takeover):
+        """
+        批量爬取的准备（同步与异步引擎共用）：跳过已收录的文章，其余写入队列，按需接管中断的任务
+        :return: (新增 URL 数, 接管的任务数, 各状态任务数)
+        """
+        urls = list(urls)
+        if isinstance(tags, (list, tuple)):
+            tag_list = list(tags) + [""] * (len(urls) - len(tags))
+        else:
+            tag_list = [tags] * len(urls)
         
-        # 保存为 Markdown
-        md_path, filename = self.save_as_markdown(article, tags)
-        print(f"Markdown 保存成功: {md_path}")
+        # 已收录的文章（按规范化链接判断）直接跳过，不入队也不发请求
+        items = list(zip(urls, tag_list))
+        if not force:
+            items = [(u, t) for u, t in items if not self.index.has_key(url_key(u))]
+            if len(items) < len(urls):
+                print(f"跳过已收录文章 {len(urls) - len(items)} 篇")
         
-        # 更新索引
-        self.update_index(article, filename, tags)
+        added = self.frontier.enqueue(items, force=force) if items else 0
+        recovered = self.frontier.requeue_inflight() if takeover else 0
+        self._start_heartbeat()
+        return added, recovered, self.frontier.counts()
+    
+    def _batch_reports(self, urls, reports, start):
+        """
+        汇总批量爬取的状态报告
+        本次未处理的 URL（此前已完成，或在队列中等待其他进程处理）按队列中的记录生成报告；
+        报告按去重键登记，同一文章的不同链接共用一份报告
+        """
+        result = [dict(reports.get(url_key(url)) or self._frontier_report(url), url=url) for url in urls]
+        requested = {url_key(u) for u in urls}
+        result.extend(r for key, r in reports.items() if key not in requested)
         
-        return md_path
+        success = sum(1 for r in reports.values() if r["status"] == "success")
+        elapsed = time.time() - start
+        if self.cancel_event.is_set():
+            print(f"批量爬取已取消，剩余 {self.frontier.counts()['pending']} 个任务保留在队列中，可稍后继续爬取")
+        print(f"批量爬取完成：成功 {success} 篇，失败 {len(reports) - success} 篇，耗时 {elapsed:.2f} 秒")
+        return result
+    
+    def _frontier_report(self, url):
+        """根据队列或索引记录生成状态报告（用于本次跳过的 URL）"""
+        task = self.frontier.get(url)
+        if task:
+            status = {"done": "skipped", "failed": "failed"}.get(task["state"], "pending")
+            return {"url": url, "status": status, "path": task.get("path"), "error": task.get("error", ""),
+                    "attempts": task.get("attempts", 0), "elapsed": 0.0}
+        existing = self._find_existing(url)
+        path = os.path.join(self.output_dir, existing["filename"]) if existing else None
+        return {"url": url, "status": "skipped", "path": path, "error": "", "attempts": 0, "elapsed": 0.0}
+    
+    def _batch_worker(self, reports):
+        """批量爬取工作线程：持续认领任务，队列中没有待处理任务或已取消时退出"""
+        while not self.cancel_event.is_set():
+            task = self.frontier.claim(self.worker_id, self.lease_seconds)
+            if task is None:
+                wait = self.frontier.next_ready_in(exclude_owner=self.worker_id)
+                if wait is None:
+                    return
+                time.sleep(min(wait, 1.0))
+                continue
+            
+            report = reports.setdefault(task["url_key"], {"url": task["url"], "status": "pending", "path": None,
+                                                          "error": "", "attempts": 0, "elapsed": 0.0})
+            self._run_batch_task(task, report)
+    
+    def _run_batch_task(self, task, report):
+        """执行一次抓取尝试；可重试的失败放回队列，其余写入状态报告和队列"""
+        self._start_task(task, report)
+        try:
+            html, failure, unchanged = self._fetch_once(task["url"], self._request_headers())
+            if failure is not None:
+                if self._retry_task(task, report, failure):
+                    return
+            else:
+                self._set_result(report, self._process_html(task["url"], html, task["tags"], unchanged))
+        except Exception as e:
+            self._set_error(report, e)
+        self._finish_task(task, report)
+    
+    # 以下几步由同步与异步引擎的批量任务共用
+    def _start_task(self, task, report):
+        if task["attempts"] == 1:
+            print(f"开始爬取: {task['url']}")
+        report["attempts"] = task["attempts"]
+        report["status"] = "running"
+        report["error"] = ""
+        self._notify_progress(report)
+    
+    def _retry_task(self, task, report, failure):
+        """
+        请求失败时按重试策略带着退避时间放回队列
+        :return: 是否已放回队列；不再重试时把报告标记为失败并返回 False
+        """
+        delay = self.retry_policy.next_delay(task["attempts"], failure, time.time() - task["first_started"])
+        if delay is not None:
+            print(f"请求失败 (第 {task['attempts']} 次): {failure}，{delay:.1f} 秒后重新排队")
+            self.metrics.inc("retries")
+            self._release_task(self.frontier.retry(task["id"], delay, str(failure), owner=self.worker_id), task["url"])
+            report["status"] = "retrying"
+            report["error"] = str(failure)
+            self._notify_progress(report)
+            return True
+        print(f"爬取失败，已放弃重试: {task['url']}, {failure}")
+        report["status"] = "failed"
+        report["error"] = str(failure)
+        return False
+    
+    @staticmethod
+    def _set_result(report, path):
+        report["status"] = "success" if path else "failed"
+        report["path"] = path
+        if not path:
+            report["error"] = "解析失败：未找到文章标题"
+    
+    @staticmethod
+    def _set_error(report, e):
+        report["status"] = "error"
+        report["error"] = str(e)
+        print(f"爬取出错: {report['url']}, {e}")
+    
+    def _finish_task(self, task, report):
+        """把最终结果写回队列（租约仍属于本进程时）并通知进度"""
+        report["elapsed"] = round(time.time() - task["first_started"], 3)
+        self.metrics.observe("article", report["elapsed"])
+        if report["status"] == "success":
+            kept = self.frontier.complete(task["id"], report["path"], owner=self.worker_id)
+        else:
+            kept = self.frontier.fail(task["id"], report["error"], owner=self.worker_id)
+        self._release_task(kept, task["url"])
+        self._notify_progress(report)
+    
+    def _release_task(self, kept, url):
+        """任务状态未能写回（租约已过期并被其他进程接手）时记录下来，结果以接手的进程为准"""
+        if not kept:
+            print(f"租约已失效，任务已由其他进程接手: {url}")
+            self.metrics.inc("leases_lost")
+    
+    def _notify_progress(self, report):
+        """把状态报告的副本交给进度回调，回调出错不影响爬取"""
+        if self.on_progress is not None:
+            try:
+                self.on_progress(dict(report))
+            except Exception as e:
+                print(f"进度回调出错: {e}")
+    
+    def save_profile(self, prefix):
+        """
+        写出本次运行的指标和性能采样报告
+        <prefix>.metrics.json / <prefix>.prom 为运行指标，开启采样时另有 <prefix>.prof / <prefix>.txt
+        """
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        self.metrics.export(prefix + ".metrics.json")
+        self.metrics.export(prefix + ".prom")
+        if self.profiler is not None:
+            self.profiler.dump(prefix)
+        print(f"运行报告已保存: {prefix}.*")
+        return prefix
     
     def list_all(self):
         """列出所有文章"""
-        if not os.path.exists(self.index_file):
-            print("暂无文章")
-            return
-        
-        with open(self.index_file, 'r', encoding='utf-8') as f:
-            index = json.load(f)
-        
-        articles = index.get("articles", [])
+        articles = self.index.all()
         if not articles:
             print("暂无文章")
             return
@@ -469,14 +3656,7 @@ class WechatArticleSpider:
     
     def list_tags(self):
         """列出所有标签"""
-        if not os.path.exists(self.index_file):
-            print("暂无标签")
-            return
-        
-        with open(self.index_file, 'r', encoding='utf-8') as f:
-            index = json.load(f)
-        
-        tags = index.get("tags", {})
+        tags = self.index.tag_counts()
         if not tags:
             print("暂无标签")
             return
@@ -487,15 +3667,7 @@ class WechatArticleSpider:
     
     def search_by_tag(self, tag):
         """按标签搜索文章"""
-        if not os.path.exists(self.index_file):
-            print("暂无文章")
-            return
-        
-        with open(self.index_file, 'r', encoding='utf-8') as f:
-            index = json.load(f)
-        
-        articles = index.get("articles", [])
-        results = [a for a in articles if tag.lower() in a['tags'].lower()]
+        results = self.index.search_tag(tag)
         
         if not results:
             print(f"未找到标签为 '{tag}' 的文章")
@@ -511,21 +3683,423 @@ class WechatArticleSpider:
             print("-" * 80)
 
 
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import threading
+    def search_text(self, query, account=None, tag=None, limit=20):
+        """
+        全文搜索文章（标题与正文）
+        :param query: 关键词，中文可直接输入短语
+        :param account: 按公众号过滤
+        :param tag: 按标签过滤
+        :param limit: 最多返回条数
+        :return: 按相关度排序的文章列表
+        """
+        results = self.index.search_text(query, account=account, tag=tag, limit=limit)
+        
+        if not results:
+            print(f"未找到包含 '{query}' 的文章")
+            return results
+        
+        print(f"\n找到 {len(results)} 篇文章：")
+        print("=" * 80)
+        for i, article in enumerate(results, 1):
+            print(f"{i}. {article['title']}")
+            print(f"   公众号: {article['account']}")
+            print(f"   标签: {article['tags'] if article['tags'] else '无'}")
+            print(f"   文件: {article['filename']}")
+            print("-" * 80)
+        return results
+
+
+def _parse_in_process(spider_cls, parser_backend, html, url):
+    """
+    解析进程池的任务函数
+    子进程只需要解析相关的方法，因此跳过 __init__，不创建目录也不初始化 UA
+    """
+    spider = _WORKER_SPIDERS.get((spider_cls, parser_backend))
+    if spider is None:
+        spider = spider_cls.__new__(spider_cls)
+        spider.parser_backend = parser_backend
+        _WORKER_SPIDERS[(spider_cls, parser_backend)] = spider
+    return spider.parse_article(html, url)
+
+
+def _parse_archived(spider_cls, parser_backend, pack_path, job):
+    """
+    重新渲染时解析进程池的任务函数：子进程直接按偏移读取归档记录，主进程不必传递页面正文
+    :param job: (offset, length, url)
+    :return: 解析结果，读取或解析出错时返回 None
+    """
+    offset, length, url = job
+    try:
+        html = HtmlArchive.read_at(pack_path, offset, length)
+        return _parse_in_process(spider_cls, parser_backend, html, url)
+    except Exception:
+        return None
+
+
+# 解析子进程内按 (类, 后端) 缓存的解析对象
+_WORKER_SPIDERS = {}
+
+
+class AsyncWechatArticleSpider(WechatArticleSpider):
+    """
+    基于 asyncio 的异步爬虫
+    页面请求和图片下载以协程方式并发执行，解析、保存、索引复用同步版逻辑
+    """
+
+    def __init__(self, output_dir="articles", concurrency=20, image_concurrency=50):
+        """
+        初始化异步爬虫
+        :param output_dir: 输出目录
+        :param concurrency: 同时进行的页面请求数
+        :param image_concurrency: 同时进行的图片下载数
+        """
+        if not HAS_AIOHTTP:
+            raise RuntimeError("异步引擎需要安装 aiohttp: pip install aiohttp")
+        super().__init__(output_dir)
+        self.concurrency = concurrency
+        self.image_concurrency = image_concurrency
+
+    async def _fetch_once_async(self, session, url, headers):
+        """
+        异步发送一次页面请求
+        条件请求、页面缓存与归档、代理健康度反馈和限速与同步版 _fetch_once 共用同一套逻辑
+        :return: (html, None, unchanged) 或 (None, FetchFailure, False)
+        """
+        import asyncio
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        proxies = self._pick_proxies()
+        proxy = proxies["http"] if proxies else None
+        key = url_key(url)
+        # 页面缓存、图片库、索引和抓取队列都是 SQLite 与磁盘操作，一律放到线程池执行，不阻塞事件循环
+        headers, cached = await loop.run_in_executor(None, self._conditional_headers, key, headers)
+        rate_key = self._rate_key(url, proxies)
+        if self.use_rate_limit:
+            wait = self.rate_limiter.reserve(rate_key) + random.uniform(0, 0.3)
+            self.metrics.observe("rate_wait", wait)
+            await asyncio.sleep(wait)
+        
+        timeout = aiohttp.ClientTimeout(total=15)
+        started = time.monotonic()
+        failure = None
+        try:
+            with self.metrics.timer("fetch"):
+                async with session.get(url, headers=headers, proxy=proxy, timeout=timeout) as response:
+                    body = await response.read()
+        except asyncio.TimeoutError as e:
+            failure = FetchFailure(FetchFailure.PROXY if proxy else FetchFailure.TIMEOUT, repr(e))
+        except aiohttp.ClientProxyConnectionError as e:
+            failure = FetchFailure(FetchFailure.PROXY, str(e))
+        except aiohttp.ClientError as e:
+            failure = FetchFailure(FetchFailure.PROXY if proxy else FetchFailure.CONNECTION, repr(e))
+        
+        if failure is not None:
+            self._report_proxy(proxies, False)
+            html, unchanged = None, False
+        else:
+            self.metrics.inc("page_bytes", len(body))
+            html, failure, unchanged = await loop.run_in_executor(None, partial(
+                self._page_result, url, key, cached, response.status, body.decode('utf-8', errors='replace'),
+                response.headers, proxies, rate_key, time.monotonic() - started))
+        
+        if failure is not None:
+            self.metrics.inc("fetch_failures", kind=failure.kind)
+        else:
+            self.metrics.inc("pages_unchanged" if unchanged else "pages_fetched")
+        return html, failure, unchanged
+
+    async def _fetch_with_retry_async(self, session, url):
+        """
+        带重试的异步抓取，重试规则与同步版相同
+        :return: (html, unchanged)；失败时 html 为 None
+        """
+        import asyncio
+        headers = self._request_headers()
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            html, failure, unchanged = await self._fetch_once_async(session, url, headers)
+            if html is not None:
+                return html, unchanged
+            
+            delay = self.retry_policy.next_delay(attempt, failure, time.monotonic() - started)
+            if delay is None:
+                print(f"爬取失败，已放弃重试: {url}, {failure}")
+                return None, False
+            print(f"请求失败 (第 {attempt} 次): {failure}，{delay:.1f} 秒后重试")
+            self.metrics.inc("retries")
+            self.metrics.observe("retry_wait", delay)
+            await asyncio.sleep(delay)
+
+    async def fetch_article_async(self, session, url):
+        """异步获取文章页面内容，失败时按重试策略退避重试"""
+        return (await self._fetch_with_retry_async(session, url))[0]
+
+    async def download_image_async(self, session, img_url, save_dir=None):
+        """
+        异步下载图片到图片库
+        :return: 图片库中的文件名，失败返回 None
+        """
+        import asyncio
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        try:
+            name = await loop.run_in_executor(None, self.images.lookup, img_url)
+            if name:
+                self.metrics.inc("images_cached")
+                return name
+            
+            proxies = None
+            if self.use_proxy and self.proxies_list:
+                proxies = self._get_random_proxy()
+            started = time.monotonic()
+            timeout = aiohttp.ClientTimeout(total=30)
+            try:
+                response = await session.get(img_url, headers=self.img_headers,
+                                             proxy=proxies["http"] if proxies else None, timeout=timeout)
+            except Exception:
+                self._report_proxy(proxies, False)
+                raise
+            self._report_proxy(proxies, response.status < 500 and response.status not in ProxyPool.FAILURE_STATUS,
+                               time.monotonic() - started)
+            async with response:
+                if response.status != 200:
+                    print(f"下载失败: {img_url}, 状态码: {response.status}")
+                    self.metrics.inc("image_failures")
+                    return None
+                # 边收边写临时文件并计算内容哈希，完成后入库
+                fd, tmp_path = await loop.run_in_executor(None, partial(
+                    tempfile.mkstemp, dir=self.images.images_dir, prefix=".", suffix=".part"))
+                digest = hashlib.sha256()
+                head = b""
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(IMAGE_CHUNK_SIZE):
+                            if len(head) < 16:
+                                head += chunk[:16]
+                            digest.update(chunk)
+                            await loop.run_in_executor(None, f.write, chunk)
+                            self.metrics.inc("image_bytes", len(chunk))
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+            self.metrics.observe("image", time.monotonic() - started)
+            self.metrics.inc("images_downloaded")
+            return await loop.run_in_executor(None, self.images.commit, img_url, tmp_path, digest.hexdigest(), head)
+        except Exception as e:
+            print(f"下载图片出错: {e!r}")
+            self.metrics.inc("image_failures")
+            return None
+
+    async def _process_html_async(self, session, url, html, tags, unchanged, img_sem):
+        """异步版 _process_html：解析、写文件和索引放到线程池，图片以协程并发下载"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if unchanged:
+            path = await loop.run_in_executor(None, self._unchanged_path, url)
+            if path:
+                return path
+        
+        # 解析属于 CPU 计算，放到线程池里执行，避免阻塞事件循环
+        with self.metrics.timer("parse"):
+            article = await loop.run_in_executor(None, self.parse_article, html, url)
+        if not article["title"]:
+            print(f"解析失败：未找到文章标题 {url}")
+            self.metrics.inc("parse_failures")
+            return None
+        article["aliases"] = self._extract_alias_urls(html)
+        
+        fingerprint, duplicate = await loop.run_in_executor(None, self._check_near_duplicate, url, article)
+        if duplicate and self.near_duplicates == "link":
+            return os.path.join(self.output_dir, duplicate["filename"])
+        
+        async def fetch_image(img_url):
+            async with img_sem:
+                return await self.download_image_async(session, img_url)
+        
+        if duplicate:
+            article["content"] = await loop.run_in_executor(
+                None, self._link_existing_images, article["content"], article["images"])
+        else:
+            img_urls = list(dict.fromkeys(article["images"]))
+            with self.metrics.timer("images"):
+                results = await asyncio.gather(*(fetch_image(u) for u in img_urls))
+            article["content"] = self._link_images(
+                article["content"], {u: name for u, name in zip(img_urls, results) if name})
+        
+        with self.metrics.timer("write"):
+            md_path, filename = await loop.run_in_executor(None, self._write_markdown, article, tags)
+        await loop.run_in_executor(None, partial(self.update_index, article, filename, tags, fingerprint=fingerprint))
+        print(f"Markdown 保存成功: {md_path}")
+        self.metrics.inc("articles_saved")
+        return md_path
+
+    async def crawl_async(self, session, url, tags="", page_sem=None, img_sem=None, force=False):
+        """
+        异步爬取单篇文章（与同步版 crawl 一样记入抓取队列）
+        :param force: 文章已收录时仍重新爬取
+        :return: 保存路径，失败返回 None
+        """
+        import asyncio
+        page_sem = page_sem or asyncio.Semaphore(self.concurrency)
+        img_sem = img_sem or asyncio.Semaphore(self.image_concurrency)
+        loop = asyncio.get_running_loop()
+        
+        existing = None if force else await loop.run_in_executor(None, self._find_existing, url)
+        if existing:
+            print(f"文章已收录，跳过: {existing['title']}")
+            return os.path.join(self.output_dir, existing["filename"])
+        
+        print(f"开始爬取: {url}")
+        self._start_heartbeat()
+        task = await loop.run_in_executor(None, self.frontier.claim_url, url, tags, self.worker_id, self.lease_seconds)
+        try:
+            async with page_sem:
+                html, unchanged = await self._fetch_with_retry_async(session, url)
+            md_path = await self._process_html_async(session, url, html, tags, unchanged, img_sem) if html else None
+        except Exception as e:
+            await loop.run_in_executor(None, partial(self.frontier.fail, task["id"], str(e), owner=self.worker_id))
+            raise
+        
+        if md_path:
+            await loop.run_in_executor(None, partial(self.frontier.complete, task["id"], md_path, owner=self.worker_id))
+        else:
+            await loop.run_in_executor(None, partial(self.frontier.fail, task["id"], "获取或解析失败",
+                                                     owner=self.worker_id))
+        return md_path
+
+    async def _batch_worker_async(self, session, reports, img_sem):
+        """批量爬取的工作协程：与同步版 _batch_worker 一样从持久化队列认领任务"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while not self.cancel_event.is_set():
+            task = await loop.run_in_executor(None, self.frontier.claim, self.worker_id, self.lease_seconds)
+            if task is None:
+                wait = await loop.run_in_executor(None, self.frontier.next_ready_in, self.worker_id)
+                if wait is None:
+                    return
+                await asyncio.sleep(min(wait, 1.0))
+                continue
+            
+            report = reports.setdefault(task["url_key"], {"url": task["url"], "status": "pending", "path": None,
+                                                          "error": "", "attempts": 0, "elapsed": 0.0})
+            self._start_task(task, report)
+            try:
+                html, failure, unchanged = await self._fetch_once_async(session, task["url"], self._request_headers())
+                if failure is not None:
+                    if await loop.run_in_executor(None, self._retry_task, task, report, failure):
+                        continue
+                else:
+                    self._set_result(report, await self._process_html_async(
+                        session, task["url"], html, task["tags"], unchanged, img_sem))
+            except Exception as e:
+                self._set_error(report, e)
+            await loop.run_in_executor(None, self._finish_task, task, report)
+
+    async def crawl_many_async(self, urls, tags="", force=False, takeover=True, concurrency=None):
+        """
+        异步批量爬取文章
+        与同步版 crawl_many 共用持久化队列：URL 先入队再由工作协程认领，失败的请求带着退避时间放回队列，
+        中断后再次调用会从中断处继续
+        :param urls: 文章URL列表
+        :param tags: 标签，字符串对所有文章生效；也可传入与 urls 等长的列表
+        :param force: 已爬取过的 URL 也重新爬取
+        :param takeover: 启动时接管队列中进行中的任务，见 WechatArticleSpider.crawl_many
+        :param concurrency: 本次的页面并发数，不传则使用 self.concurrency
+        :return: 状态报告列表，先按 urls 顺序，其后是本次顺带完成的上次遗留任务
+        """
+        import asyncio
+        import aiohttp
+        concurrency = concurrency or self.concurrency
+        urls = list(urls)
+        loop = asyncio.get_running_loop()
+        added, recovered, counts = await loop.run_in_executor(None, self._enqueue_batch, urls, tags, force, takeover)
+        print(f"开始异步批量爬取：新增 {added} 个URL，接管中断任务 {recovered} 个，待处理 {counts['pending']} 个，"
+              f"页面并发: {concurrency}，图片并发: {self.image_concurrency}")
+        
+        img_sem = asyncio.Semaphore(self.image_concurrency)
+        connector = aiohttp.TCPConnector(limit=concurrency + self.image_concurrency)
+        workers = max(1, min(concurrency, counts["pending"] + counts["inflight"]))
+        reports = {}
+        start = time.time()
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*(self._batch_worker_async(session, reports, img_sem) for _ in range(workers)))
+        return await loop.run_in_executor(None, self._batch_reports, urls, reports, start)
+
+    async def _crawl_one_async(self, url, tags, force):
+        import aiohttp
+        async with aiohttp.ClientSession() as session:
+            return await self.crawl_async(session, url, tags, force=force)
+
+    def crawl(self, url, tags="", force=False):
+        """同步入口：在新的事件循环中爬取单篇文章，参数同 WechatArticleSpider.crawl"""
+        import asyncio
+        return asyncio.run(self._crawl_one_async(url, tags, force))
+
+    def crawl_many(self, urls, tags="", workers=None, force=False, takeover=True):
+        """
+        同步入口：在新的事件循环中批量爬取，refresh、resume_crawl、run_worker 也经由这里
+        :param workers: 本次的页面并发数，不传则使用 concurrency
+        :param force: 已爬取过的 URL 也重新爬取
+        :param takeover: 启动时接管队列中进行中的任务；与其他工作进程共用队列时为 False
+        """
+        import asyncio
+        return asyncio.run(self.crawl_many_async(urls, tags, force, takeover, concurrency=workers))
+
+
+class QueueLogStream:
+    """
+    可替换 sys.stdout 的日志流：写入的文本放进队列，由界面线程定时批量取出显示
+    工作线程不直接操作 Tk 控件；同时照常写到原来的标准输出（如果有）
+    """
+
+    def __init__(self, log_queue, echo=None):
+        self.log_queue = log_queue
+        self.echo = echo
+
+    def write(self, text):
+        if text:
+            self.log_queue.put(text)
+            if self.echo is not None:
+                self.echo.write(text)
+        return len(text)
+
+    def flush(self):
+        if self.echo is not None:
+            self.echo.flush()
+
 
 class WechatSpiderGUI:
+    # 每次刷新界面的间隔（毫秒）、最多取出的日志片段数，以及日志框保留的行数
+    PUMP_INTERVAL = 100
+    LOG_BATCH = 2000
+    MAX_LOG_LINES = 5000
+    
+    STATUS_NAMES = {"pending": "等待中", "running": "爬取中", "retrying": "等待重试", "success": "成功",
+                    "skipped": "已收录", "failed": "失败", "error": "出错"}
+    
     def __init__(self, spider):
+        import tkinter as tk
         self.spider = spider
         self.root = tk.Tk()
         self.root.title("微信公众号文章爬虫")
-        self.root.geometry("600x500")
+        self.root.geometry("760x780")
+        
+        # 日志与批量进度都经由队列交给界面线程
+        self.log_queue = queue.Queue()
+        self.progress_queue = queue.Queue()
+        self.reports = {}
+        self.batch_started = None
+        self.running = False
         
         self.setup_ui()
     
     def setup_ui(self):
         # 路径选择
+        import tkinter as tk
+        from tkinter import ttk
         path_frame = ttk.LabelFrame(self.root, text="设置", padding=10)
         path_frame.pack(fill="x", padx=10, pady=5)
         
@@ -544,106 +4118,548 @@ class WechatSpiderGUI:
         ttk.Label(config_frame, text="代理列表(ip:port, 逗号分隔):").grid(row=0, column=1, sticky="w", padx=5)
         self.proxy_list_var = tk.StringVar()
         ttk.Entry(config_frame, textvariable=self.proxy_list_var, width=35).grid(row=0, column=2)
+        ttk.Button(config_frame, text="代理状态", command=self.show_proxy_stats).grid(row=0, column=3, padx=5)
         
-        self.delay_enable_var = tk.BooleanVar(value=True)
-        ttk.Checkbutton(config_frame, text="随机延迟", variable=self.delay_enable_var).grid(row=1, column=0, sticky="w")
+        self.rate_enable_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(config_frame, text="自适应限速", variable=self.rate_enable_var).grid(row=1, column=0, sticky="w")
         
-        ttk.Label(config_frame, text="基础延迟(秒):").grid(row=1, column=1, sticky="w", padx=5)
-        self.delay_val_var = tk.StringVar(value="1.0")
-        ttk.Entry(config_frame, textvariable=self.delay_val_var, width=10).grid(row=1, column=2, sticky="w")
+        ttk.Label(config_frame, text="初始速率(次/秒):").grid(row=1, column=1, sticky="w", padx=5)
+        self.rate_val_var = tk.StringVar(value=str(self.spider.rate_limiter.initial_rate))
+        ttk.Entry(config_frame, textvariable=self.rate_val_var, width=10).grid(row=1, column=2, sticky="w")
+        self.rate_label_var = tk.StringVar(value="当前速率: -")
+        ttk.Label(config_frame, textvariable=self.rate_label_var).grid(row=1, column=3, sticky="w", padx=5)
         
         self.ua_enable_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(config_frame, text="随机 UA", variable=self.ua_enable_var).grid(row=2, column=0, sticky="w")
         ttk.Label(config_frame, text="模拟真实浏览器，随机轮换 User-Agent", font=('Arial', 8)).grid(row=2, column=1, columnspan=2, sticky="w", padx=5)
+        
+        self.stream_enable_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(config_frame, text="边下载边解析", variable=self.stream_enable_var,
+                        state="normal" if HAS_LXML else "disabled").grid(row=2, column=3, sticky="w", padx=5)
 
-        # 爬取输入
+        # 爬取输入：可一次粘贴多个链接
         crawl_frame = ttk.LabelFrame(self.root, text="爬取新文章", padding=10)
         crawl_frame.pack(fill="x", padx=10, pady=5)
+        crawl_frame.columnconfigure(1, weight=1)
         
-        ttk.Label(crawl_frame, text="文章链接:").grid(row=0, column=0, sticky="w")
-        self.url_var = tk.StringVar()
-        ttk.Entry(crawl_frame, textvariable=self.url_var, width=60).grid(row=0, column=1, columnspan=2, pady=5)
+        ttk.Label(crawl_frame, text="文章链接:\n(每行一个)").grid(row=0, column=0, sticky="nw")
+        self.url_text = tk.Text(crawl_frame, height=5, width=60)
+        self.url_text.grid(row=0, column=1, columnspan=4, sticky="ew", pady=5)
         
         ttk.Label(crawl_frame, text="文章标签:").grid(row=1, column=0, sticky="w")
         self.tags_var = tk.StringVar()
-        ttk.Entry(crawl_frame, textvariable=self.tags_var, width=60).grid(row=1, column=1, columnspan=2, pady=5)
+        ttk.Entry(crawl_frame, textvariable=self.tags_var).grid(row=1, column=1, columnspan=4, sticky="ew", pady=5)
+        
+        ttk.Label(crawl_frame, text="并发数:").grid(row=2, column=0, sticky="w")
+        self.workers_var = tk.StringVar(value="4")
+        ttk.Spinbox(crawl_frame, from_=1, to=32, textvariable=self.workers_var, width=5).grid(row=2, column=1, sticky="w")
         
         self.crawl_btn = ttk.Button(crawl_frame, text="开始爬取", command=self.start_crawl)
-        self.crawl_btn.grid(row=2, column=1, pady=10)
+        self.crawl_btn.grid(row=2, column=2, pady=10)
+        self.cancel_btn = ttk.Button(crawl_frame, text="取消", command=self.cancel_crawl, state="disabled")
+        self.cancel_btn.grid(row=2, column=3, pady=10)
+        
+        # 批量进度：每个链接一行
+        progress_frame = ttk.LabelFrame(self.root, text="爬取进度", padding=10)
+        progress_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        columns = ("url", "status", "attempts", "elapsed", "result")
+        self.progress_tree = ttk.Treeview(progress_frame, columns=columns, show="headings", height=8)
+        for col, text, width in zip(columns, ("链接", "状态", "尝试", "耗时(秒)", "结果"), (260, 70, 40, 70, 240)):
+            self.progress_tree.heading(col, text=text)
+            self.progress_tree.column(col, width=width, stretch=col in ("url", "result"))
+        scrollbar = ttk.Scrollbar(progress_frame, orient="vertical", command=self.progress_tree.yview)
+        self.progress_tree.configure(yscrollcommand=scrollbar.set)
+        self.progress_tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        self.summary_var = tk.StringVar(value="")
+        ttk.Label(self.root, textvariable=self.summary_var).pack(fill="x", padx=12)
         
         # 日志输出
         log_frame = ttk.LabelFrame(self.root, text="运行日志", padding=10)
         log_frame.pack(fill="both", expand=True, padx=10, pady=5)
         
-        self.log_text = tk.Text(log_frame, height=10)
+        self.log_text = tk.Text(log_frame, height=8)
         self.log_text.pack(fill="both", expand=True)
         
-        # 简单的重定向 print
-        self.original_print = print
-        import builtins
-        builtins.print = self.gui_print
+        self.refresh_rate_label()
+        self.pump()
+    
+    def pump(self):
+        """界面线程定时执行：批量写入日志、更新进度表"""
+        chunks = []
+        try:
+            while len(chunks) < self.LOG_BATCH:
+                chunks.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if chunks:
+            self.log_text.insert("end", "".join(chunks))
+            lines = int(self.log_text.index("end-1c").split(".")[0])
+            if lines > self.MAX_LOG_LINES:
+                self.log_text.delete("1.0", f"{lines - self.MAX_LOG_LINES}.0")
+            self.log_text.see("end")
+        
+        # 同一链接在一次刷新内的多次状态变化只取最后一次
+        updates = {}
+        finished = None
+        try:
+            while True:
+                kind, *payload = self.progress_queue.get_nowait()
+                if kind == "progress":
+                    updates[url_key(payload[0]["url"])] = payload[0]
+                else:
+                    finished = payload
+        except queue.Empty:
+            pass
+        for key, report in updates.items():
+            self.update_row(key, report)
+        if finished is not None:
+            self.finish_crawl(*finished)
+        if self.running:
+            self.refresh_summary()
+        
+        self.root.after(self.PUMP_INTERVAL, self.pump)
+    
+    def update_row(self, key, report):
+        self.reports[key] = report
+        status = report["status"]
+        if status == "pending" and not self.running:
+            name = "已取消"
+        else:
+            name = self.STATUS_NAMES.get(status, status)
+        if report.get("error"):
+            result = report["error"]
+        else:
+            result = os.path.basename(report["path"]) if report.get("path") else ""
+        values = (report["url"], name, report.get("attempts", 0), f"{report.get('elapsed', 0.0):.1f}", result)
+        if self.progress_tree.exists(key):
+            self.progress_tree.item(key, values=values)
+        else:
+            self.progress_tree.insert("", "end", iid=key, values=values)
+    
+    def refresh_summary(self):
+        """汇总行：完成数、成功/失败数与吞吐量"""
+        statuses = [r["status"] for r in self.reports.values()]
+        success = sum(1 for s in statuses if s in ("success", "skipped"))
+        failed = sum(1 for s in statuses if s in ("failed", "error"))
+        elapsed = time.time() - self.batch_started if self.batch_started else 0.0
+        rate = (success + failed) / elapsed * 60 if elapsed > 0 else 0.0
+        self.summary_var.set(f"已完成 {success + failed}/{len(statuses)}  成功 {success}  失败 {failed}  "
+                             f"用时 {elapsed:.0f} 秒  {rate:.1f} 篇/分钟")
     
-    def gui_print(self, *args, **kwargs):
-        msg = " ".join(map(str, args)) + "\n"
-        self.log_text.insert("end", msg)
-        self.log_text.see("end")
-        self.original_print(*args, **kwargs)
+    def refresh_rate_label(self):
+        """每秒刷新一次当前有效速率"""
+        rates = self.spider.rate_limiter.rates()
+        if rates:
+            text = ", ".join(f"{rate:.2f}" for rate in list(rates.values())[:3])
+            self.rate_label_var.set(f"当前速率: {text} 次/秒")
+        self.root.after(1000, self.refresh_rate_label)
+    
+    def show_proxy_stats(self):
+        from tkinter import messagebox
+        stats = self.spider.proxy_stats()
+        if not stats:
+            messagebox.showinfo("代理状态", "尚未加载代理（开始爬取后生效）")
+            return
+        
+        state_names = {"ok": "正常", "ejected": "熔断", "probing": "探测中"}
+        lines = []
+        for item in stats:
+            line = (f"{item['proxy']}  {state_names[item['state']]}  成功率 {item['success_rate'] * 100:.0f}%  "
+                    f"延迟 {item['latency']:.2f}s  请求 {item['requests']}/失败 {item['failures']}")
+            if item["cooldown_left"]:
+                line += f"  冷却 {item['cooldown_left']:.0f}s"
+            lines.append(line)
+        messagebox.showinfo("代理状态", "\n".join(lines))
     
     def browse_path(self):
+        from tkinter import filedialog
         directory = filedialog.askdirectory()
         if directory:
             self.path_var.set(directory)
             self.spider.set_output_dir(directory)
     
+    def apply_settings(self):
+        """同步 GUI 配置到 spider"""
+        self.spider.use_proxy = self.proxy_enable_var.get()
+        self.spider.set_proxies(self.proxy_list_var.get())
+        self.spider.use_rate_limit = self.rate_enable_var.get()
+        self.spider.use_random_ua = self.ua_enable_var.get()
+        self.spider.stream_images = self.stream_enable_var.get()
+        try:
+            self.spider.rate_limiter.set_initial_rate(float(self.rate_val_var.get()))
+        except ValueError:
+            self.rate_val_var.set(str(self.spider.rate_limiter.initial_rate))
+    
     def start_crawl(self):
-        url = self.url_var.get().strip()
+        from tkinter import messagebox
         tags = self.tags_var.get().strip()
+        items = read_url_lines(self.url_text.get("1.0", "end").splitlines(), tags)
         
-        if not url or 'mp.weixin.qq.com' not in url:
-            messagebox.showerror("错误", "请输入有效的微信公众号文章链接")
+        if not items:
+            messagebox.showerror("错误", "请输入微信公众号文章链接（每行一个）")
+            return
+        invalid = [u for u, _ in items if 'mp.weixin.qq.com' not in u]
+        if invalid:
+            messagebox.showerror("错误", "以下链接不是有效的微信公众号文章链接：\n" + "\n".join(invalid[:10]))
             return
-        
-        # 同步 GUI 配置到 spider
-        self.spider.use_proxy = self.proxy_enable_var.get()
-        self.spider.set_proxies(self.proxy_list_var.get())
-        self.spider.use_random_delay = self.delay_enable_var.get()
-        self.spider.use_random_ua = self.ua_enable_var.get()
         try:
-            self.spider.base_delay = float(self.delay_val_var.get())
-        except:
-            self.spider.base_delay = 1.0
+            workers = max(1, int(self.workers_var.get()))
+        except ValueError:
+            workers = 4
+            self.workers_var.set("4")
+        
+        # 同一篇文章（规范化后链接相同）只保留一行
+        unique = {}
+        for url, url_tags in items:
+            unique.setdefault(url_key(url), (url, url_tags))
         
+        self.apply_settings()
+        self.running = True
+        self.batch_started = time.time()
+        self.progress_tree.delete(*self.progress_tree.get_children())
+        self.reports = {}
+        for key, (url, _) in unique.items():
+            self.update_row(key, {"url": url, "status": "pending", "attempts": 0, "elapsed": 0.0})
+        
+        self.spider.cancel_event.clear()
+        self.spider.on_progress = lambda report: self.progress_queue.put(("progress", report))
         self.crawl_btn.config(state="disabled")
-        threading.Thread(target=self.crawl_thread, args=(url, tags), daemon=True).start()
+        self.cancel_btn.config(state="normal")
+        urls = [url for url, _ in unique.values()]
+        url_tags = [t for _, t in unique.values()]
+        threading.Thread(target=self.crawl_thread, args=(urls, url_tags, workers), daemon=True).start()
+    
+    def cancel_crawl(self):
+        self.spider.cancel_event.set()
+        self.cancel_btn.config(state="disabled")
+        print("正在取消：进行中的文章处理完后停止，未开始的链接保留在队列中")
     
-    def crawl_thread(self, url, tags):
+    def crawl_thread(self, urls, tags, workers):
+        """后台线程：批量爬取，结束后把结果交回界面线程"""
         try:
-            result = self.spider.crawl(url, tags)
-            if result:
-                messagebox.showinfo("成功", "文章爬取完成！")
-            else:
-                messagebox.showerror("失败", "爬取失败！\n\n可能原因：\n1. 网络连接问题\n2. 代理IP无效（如已启用）\n3. 文章链接失效或被删除\n\n建议：\n- 检查网络连接\n- 尝试关闭代理后直连\n- 确认文章链接是否有效")
+            reports = self.spider.crawl_many(urls, tags, workers=workers)
+            self.progress_queue.put(("finished", reports, None))
         except Exception as e:
-            messagebox.showerror("失败", f"爬取过程中出错:\n{str(e)}\n\n建议检查日志获取详细信息")
-        finally:
-            self.root.after(0, lambda: self.crawl_btn.config(state="normal"))
-            self.root.after(0, lambda: self.url_var.set(""))
+            print(f"爬取过程中出错: {e}")
+            self.progress_queue.put(("finished", None, str(e)))
+    
+    def finish_crawl(self, reports, error):
+        from tkinter import messagebox
+        self.running = False
+        self.spider.on_progress = None
+        self.crawl_btn.config(state="normal")
+        self.cancel_btn.config(state="disabled")
+        for report in reports or []:
+            self.update_row(url_key(report["url"]), report)
+        self.refresh_summary()
+        
+        if error:
+            messagebox.showerror("失败", f"爬取过程中出错:\n{error}\n\n建议检查日志获取详细信息")
+            return
+        failed = [r for r in reports if r["status"] in ("failed", "error")]
+        if self.spider.cancel_event.is_set():
+            messagebox.showinfo("已取消", "已取消爬取，未开始的链接保留在队列中，再次开始爬取时会继续")
+        elif failed:
+            messagebox.showerror("失败", f"{len(failed)} 篇文章爬取失败！\n\n可能原因：\n1. 网络连接问题\n2. 代理IP无效（如已启用）\n3. 文章链接失效或被删除\n\n建议：\n- 检查网络连接\n- 尝试关闭代理后直连\n- 确认文章链接是否有效")
+        else:
+            messagebox.showinfo("成功", "文章爬取完成！")
+            self.url_text.delete("1.0", "end")
 
     def run(self):
-        self.root.mainloop()
+        # 运行期间的 print 输出（包括工作线程）经队列显示在日志框中
+        with redirect_stdout(QueueLogStream(self.log_queue, sys.stdout)):
+            self.root.mainloop()
 
-def main():
-    """主函数"""
-    spider = WechatArticleSpider(output_dir="articles")
+def build_parser():
+    """命令行参数：不带子命令时启动图形界面（--cli 为交互式命令行），子命令用于脚本和定时任务"""
+    import argparse
     
-    # 询问用户使用哪种模式
-    import sys
-    if len(sys.argv) > 1 and sys.argv[1] == "--cli":
+    parser = argparse.ArgumentParser(description="微信公众号文章爬虫",
+                                     epilog="子命令的结果以 JSON Lines 写到标准输出，运行日志写到标准错误")
+    parser.add_argument("--cli", action="store_true", help="交互式命令行模式")
+    parser.add_argument("-o", "--output-dir", default="articles", help="下载位置（默认 articles）")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不输出运行日志")
+    parser.add_argument("--profile", action="store_true", help="性能采样，报告写入 <下载位置>/profile/")
+    parser.add_argument("--metrics", metavar="FILE", help="结束时写出运行指标（.prom 为 Prometheus 文本，其余为 JSON）")
+    parser.add_argument("--proxies", metavar="LIST", help="启用代理，ip:port 列表，逗号分隔")
+    parser.add_argument("--proxy-file", metavar="FILE", help="启用代理，从文件读取代理列表（每行一个 ip:port）")
+    sub = parser.add_subparsers(dest="command", metavar="命令")
+    
+    crawl = sub.add_parser("crawl", help="爬取文章")
+    crawl.add_argument("urls", nargs="*", metavar="URL", help="文章链接")
+    crawl.add_argument("--urls-file", metavar="FILE",
+                       help="链接文件，每行一个链接，可用制表符隔开附带标签；- 表示标准输入")
+    crawl.add_argument("--tags", default="", help="标签，多个用逗号分隔")
+    crawl.add_argument("-j", "--jobs", type=int, default=4, help="并发数（默认 4）")
+    crawl.add_argument("--parse-jobs", type=int, default=0, help="解析进程数，默认在工作线程中解析（同时解析的页面数不超过 --jobs）")
+    crawl.add_argument("--force", action="store_true", help="已收录的文章也重新爬取")
+    crawl.add_argument("--stream", action="store_true", help="边下载边解析，提前开始下载图片")
+    crawl.add_argument("--async", dest="use_async", action="store_true", help="使用异步引擎（需要 aiohttp）")
+    crawl.add_argument("--near-duplicates", choices=DUPLICATE_MODES, default="link",
+                       help="近似重复文章（转载）的处理：link 不另存（默认），skip-images 保存但不下载图片，off 不检测")
+    
+    resume = sub.add_parser("resume", help="继续处理抓取队列中未完成的任务")
+    resume.add_argument("-j", "--jobs", type=int, default=4, help="并发数（默认 4）")
+    
+    enqueue = sub.add_parser("enqueue", help="只把链接加入抓取队列，由工作进程处理")
+    enqueue.add_argument("urls", nargs="*", metavar="URL", help="文章链接")
+    enqueue.add_argument("--urls-file", metavar="FILE", help="链接文件，格式同 crawl；- 表示标准输入")
+    enqueue.add_argument("--tags", default="", help="标签，多个用逗号分隔")
+    enqueue.add_argument("--force", action="store_true", help="已收录或已完成的链接也重新入队（此前失败的链接总会重新入队）")
+    
+    worker = sub.add_parser("worker", help="工作进程：与其他进程共用抓取队列，按租约认领任务")
+    worker.add_argument("-j", "--jobs", type=int, default=4, help="本进程的并发数（默认 4）")
+    worker.add_argument("--parse-jobs", type=int, default=0, help="解析进程数，默认在工作线程中解析（同时解析的页面数不超过 --jobs）")
+    worker.add_argument("--follow", action="store_true", help="队列处理完后继续等待新任务，直到收到退出信号")
+    worker.add_argument("--poll", type=float, default=5.0, help="--follow 时检查新任务的间隔（秒，默认 5）")
+    worker.add_argument("--lease", type=int, default=60, help="租约时长（秒，默认 60），心跳每 1/3 租约续租一次")
+    worker.add_argument("--stream", action="store_true", help="边下载边解析，提前开始下载图片")
+    worker.add_argument("--near-duplicates", choices=DUPLICATE_MODES, default="link", help="近似重复文章的处理，同 crawl")
+    
+    sub.add_parser("status", help="抓取队列各状态的任务数与各工作进程持有的租约")
+    
+    listing = sub.add_parser("list", help="列出已收录的文章")
+    listing.add_argument("--tag", help="按标签过滤")
+    listing.add_argument("--account", help="按公众号过滤")
+    listing.add_argument("--limit", type=int, help="最多输出条数")
+    
+    search = sub.add_parser("search", help="全文搜索")
+    search.add_argument("query", help="关键词")
+    search.add_argument("--tag", help="按标签过滤")
+    search.add_argument("--account", help="按公众号过滤")
+    search.add_argument("--limit", type=int, default=20, help="最多输出条数（默认 20）")
+    
+    sub.add_parser("tags", help="列出全部标签及文章数")
+    
+    rerender = sub.add_parser("rerender", help="从页面归档离线重新渲染全部文章")
+    rerender.add_argument("-j", "--jobs", type=int, help="解析进程数，默认为 CPU 核数")
+    
+    migrate = sub.add_parser("migrate-layout", help="切换输出布局并迁移已有文件")
+    migrate.add_argument("layout", choices=LAYOUTS)
+    return parser
+
+
+def read_url_lines(lines, tags=""):
+    """解析链接列表：忽略空行和 # 开头的注释，行内制表符之后为该链接的标签"""
+    items = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        url, _, line_tags = line.partition('\t')
+        items.append((url.strip(), line_tags.strip() or tags))
+    return items
+
+
+def main(argv=None):
+    """主函数，返回退出码"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "crawl" and args.use_async and args.parse_jobs:
+        # 异步引擎在线程池中解析，不使用解析进程池
+        parser.error("--parse-jobs 不能与 --async 同时使用")
+    if args.command is None:
+        spider = apply_proxy_args(WechatArticleSpider(output_dir=args.output_dir), args)
+        run_with_profile(spider, args, run_interactive)
+        return 0
+    
+    # 子命令的标准输出只留给结果，爬虫的运行日志改写到标准错误
+    out = sys.stdout
+    log = open(os.devnull, 'w') if args.quiet else sys.stderr
+    try:
+        with redirect_stdout(log):
+            return run_command(args, out)
+    finally:
+        if args.quiet:
+            log.close()
+
+def apply_proxy_args(spider, args):
+    """--proxies / --proxy-file：加载代理列表并启用代理"""
+    proxies = args.proxies or ""
+    if args.proxy_file:
+        with open(args.proxy_file, 'r', encoding='utf-8') as f:
+            proxies += "\n" + "\n".join(line for line in f if not line.strip().startswith('#'))
+    if proxies.strip():
+        spider.set_proxies(proxies)
+        spider.use_proxy = True
+    return spider
+
+def run_interactive(spider, args):
+    """不带子命令时的运行方式：图形界面或交互式命令行"""
+    if args.cli:
         run_cli(spider)
     else:
         gui = WechatSpiderGUI(spider)
         gui.run()
 
+def run_with_profile(spider, args, fn, *fn_args):
+    """执行 fn(spider, ...)，按参数开启性能采样并在结束时写出报告"""
+    if args.profile:
+        spider.profiler = RunProfiler()
+        fn = spider.profiler.wrap(fn)
+    try:
+        return fn(spider, *fn_args)
+    finally:
+        if args.metrics:
+            spider.metrics.export(args.metrics)
+        if args.profile:
+            spider.metrics.report()
+            spider.save_profile(os.path.join(spider.output_dir, "profile", datetime.now().strftime("%Y%m%d_%H%M%S")))
+
+def emit(out, record):
+    """写出一行 JSON 结果（立即刷新，便于管道下游逐行处理）"""
+    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+
+def run_command(args, out):
+    """执行子命令，返回退出码：有文章失败时为 1"""
+    if args.command in ("list", "search", "tags"):
+        return run_query(args, out)
+    if args.command in ("enqueue", "status"):
+        return run_queue_command(args, out)
+    
+    if args.command == "worker":
+        return run_worker_command(args, out)
+    
+    if args.command == "crawl":
+        items = read_url_args(args)
+        if items is None:
+            return 2
+        
+        if args.use_async:
+            spider = AsyncWechatArticleSpider(output_dir=args.output_dir, concurrency=args.jobs)
+        else:
+            spider = WechatArticleSpider(output_dir=args.output_dir)
+        apply_proxy_args(spider, args)
+        spider.stream_images = args.stream
+        spider.near_duplicates = args.near_duplicates
+        urls = [u for u, _ in items]
+        tags = [t for _, t in items]
+        if args.use_async:
+            reports = run_with_profile(spider, args, lambda s: s.crawl_many(urls, tags, force=args.force))
+        else:
+            reports = run_with_profile(spider, args, lambda s: s.crawl_many(
+                urls, tags, workers=args.jobs, parse_workers=args.parse_jobs, force=args.force))
+    elif args.command == "resume":
+        spider = apply_proxy_args(WechatArticleSpider(output_dir=args.output_dir), args)
+        reports = run_with_profile(spider, args, lambda s: s.resume_crawl(workers=args.jobs))
+    elif args.command == "rerender":
+        spider = WechatArticleSpider(output_dir=args.output_dir)
+        stats = run_with_profile(spider, args, lambda s: s.rerender(workers=args.jobs))
+        emit(out, stats)
+        return 1 if stats["failed"] else 0
+    else:
+        spider = WechatArticleSpider(output_dir=args.output_dir)
+        moved = run_with_profile(spider, args, lambda s: s.migrate_layout(args.layout))
+        emit(out, {"layout": args.layout, "moved": moved})
+        return 0
+    
+    for report in reports:
+        emit(out, report)
+    return 1 if any(r["status"] not in ("success", "skipped") for r in reports) else 0
+
+def read_url_args(args):
+    """
+    crawl / enqueue：合并命令行中的链接与 --urls-file（或标准输入）中的链接
+    :return: [(url, tags)]；既没有参数也没有可读的标准输入时返回 None
+    """
+    items = [(u, args.tags) for u in args.urls]
+    if args.urls_file == "-" or (not args.urls_file and not args.urls):
+        if not args.urls_file and sys.stdin.isatty():
+            print("未提供链接：请在参数中给出链接，或通过 --urls-file / 标准输入传入", file=sys.stderr)
+            return None
+        items += read_url_lines(sys.stdin, args.tags)
+    elif args.urls_file:
+        with open(args.urls_file, 'r', encoding='utf-8') as f:
+            items += read_url_lines(f, args.tags)
+    return items
+
+def run_queue_command(args, out):
+    """enqueue / status：直接打开 frontier.db（和 index.db），不创建爬虫"""
+    os.makedirs(args.output_dir, exist_ok=True)
+    frontier = CrawlQueue(os.path.join(args.output_dir, "frontier.db"))
+    if args.command == "status":
+        emit(out, dict(frontier.counts(), workers=frontier.leases()))
+        return 0
+    
+    items = read_url_args(args)
+    if items is None:
+        return 2
+    index_db = os.path.join(args.output_dir, "index.db")
+    skipped = 0
+    if not args.force and os.path.exists(index_db):
+        index = ArticleIndex(index_db)
+        kept = [(u, t) for u, t in items if not index.has_key(url_key(u))]
+        skipped = len(items) - len(kept)
+        items = kept
+    added = frontier.enqueue(items, force=args.force)
+    emit(out, {"added": added, "skipped": skipped, "pending": frontier.counts()["pending"]})
+    return 0
+
+def run_worker_command(args, out):
+    """worker：每处理完一个链接立即输出一行结果；SIGINT / SIGTERM 时处理完手头的任务再退出"""
+    import signal
+    
+    spider = apply_proxy_args(WechatArticleSpider(output_dir=args.output_dir), args)
+    spider.stream_images = args.stream
+    spider.near_duplicates = args.near_duplicates
+    spider.lease_seconds = args.lease
+    
+    lock = threading.Lock()
+    failed = []
+    
+    def on_progress(report):
+        if report["status"] in ("running", "retrying"):
+            return
+        if report["status"] not in ("success", "skipped"):
+            failed.append(report["url"])
+        with lock:
+            emit(out, report)
+    
+    def stop(signum, frame):
+        print("收到退出信号，处理完手头的任务后退出")
+        spider.cancel_event.set()
+    
+    spider.on_progress = on_progress
+    signal.signal(signal.SIGINT, stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, stop)
+    run_with_profile(spider, args, lambda s: s.run_worker(
+        workers=args.jobs, follow=args.follow, poll_interval=args.poll, parse_workers=args.parse_jobs))
+    return 1 if failed else 0
+
+def run_query(args, out):
+    """
+    list / search / tags：只读查询直接打开 index.db，不创建爬虫（不打开队列、缓存和图片库）
+    只有旧版 INDEX.json 尚未迁移时才走完整初始化
+    """
+    index_db = os.path.join(args.output_dir, "index.db")
+    if os.path.exists(os.path.join(args.output_dir, "INDEX.json")):
+        index = WechatArticleSpider(output_dir=args.output_dir).index
+    elif os.path.exists(index_db):
+        index = ArticleIndex(index_db)
+    else:
+        return 0
+    
+    if args.command == "tags":
+        for tag, count in sorted(index.tag_counts().items(), key=lambda x: x[1], reverse=True):
+            emit(out, {"tag": tag, "count": count})
+        return 0
+    
+    if args.command == "search":
+        articles = index.search_text(args.query, account=args.account, tag=args.tag, limit=args.limit)
+    else:
+        articles = index.search_tag(args.tag) if args.tag else index.all()
+        if args.account:
+            articles = [a for a in articles if a["account"] == args.account]
+        articles = articles[:args.limit] if args.limit else articles
+    for article in articles:
+        emit(out, article)
+    return 0
+
 def run_cli(spider):
     print("=" * 50)
     print("微信公众号文章爬虫 (命令行模式)")
@@ -656,10 +4672,13 @@ def run_cli(spider):
         print("2. 查看所有文章")
         print("3. 查看所有标签")
         print("4. 按标签搜索")
-        print("5. 设置下载位置")
-        print("6. 退出")
+        print("5. 全文搜索")
+        print("6. 设置下载位置")
+        print("7. 代理设置与状态")
+        print("8. 重新渲染全部文章")
+        print("9. 退出")
         
-        choice = input("\n请输入选项 (1-6): ").strip()
+        choice = input("\n请输入选项 (1-9): ").strip()
         
         if choice == '1':
             url = input("\n请输入微信公众号文章链接: ").strip()
@@ -688,11 +4707,32 @@ def run_cli(spider):
                 spider.search_by_tag(tag)
         
         elif choice == '5':
+            query = input("\n请输入关键词: ").strip()
+            if query:
+                account = input("按公众号过滤（可留空）: ").strip()
+                tag = input("按标签过滤（可留空）: ").strip()
+                spider.search_text(query, account=account or None, tag=tag or None)
+        
+        elif choice == '6':
             new_dir = input(f"\n请输入新的下载目录 (当前: {spider.output_dir}): ").strip()
             if new_dir:
                 spider.set_output_dir(new_dir)
         
-        elif choice == '6':
+        elif choice == '7':
+            proxies = input("\n请输入代理列表（ip:port，逗号分隔；直接回车保持不变，输入 off 关闭代理）: ").strip()
+            if proxies.lower() == "off":
+                spider.use_proxy = False
+                spider.set_proxies("")
+                print("已关闭代理")
+            elif proxies:
+                spider.set_proxies(proxies)
+                spider.use_proxy = bool(spider.proxies_list)
+            spider.show_proxy_stats()
+        
+        elif choice == '8':
+            spider.rerender()
+        
+        elif choice == '9':
             print("退出程序")
             break
         
@@ -701,4 +4741,4 @@ def run_cli(spider):
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())